@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -136,3 +138,159 @@ MEDIA_ROOT = '/vol/web/media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.AuthUser'
+
+# Token -> user cache used by core.authentication.CachedTokenAuthentication.
+# SHARED_CACHE optionally names a CACHES alias shared by all workers.
+
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 60,
+    'SHARED_CACHE': None,
+}
+
+# Largest number of recipes accepted by one request to the bulk endpoints
+
+RECIPE_BULK_MAX_ITEMS = 1000
+
+# Background processing of uploaded recipe images (recipe.images). Each
+# upload is re-encoded without metadata and resized to every rendition
+# width below. With 0 workers images are processed on the request thread.
+
+RECIPE_IMAGE_WORKERS = 2
+RECIPE_IMAGE_RENDITIONS = {
+    'small': 320,
+    'medium': 800,
+    'large': 1600,
+}
+
+# Disk cache of resized recipe images served by the recipe image endpoint
+
+RECIPE_THUMBNAIL_CACHE = {
+    'DIR': '/vol/web/cache/thumbnails',
+    'MAX_BYTES': 512 * 1024 * 1024,
+    'MAX_WIDTH': 2048,
+}
+
+# Per user in-memory autocomplete indexes of tag and ingredient names
+# (core.autocomplete). Users with more than DB_THRESHOLD names are served
+# by pg_trgm instead, when the extension is installed.
+
+RECIPE_AUTOCOMPLETE = {
+    'MAX_USERS': 1000,
+    'TTL': 300,
+    'DB_THRESHOLD': 5000,
+    'MAX_LIMIT': 50,
+}
+
+# Cache of serialized recipe, tag and ingredient responses
+# (recipe.cache), keyed by their ETag. CACHE names the CACHES alias to
+# use; point it at a shared backend to share entries between workers.
+
+RECIPE_RESPONSE_CACHE = {
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+}
+
+# Build recipe, tag and ingredient JSON lists from values() rows instead
+# of serializers (recipe.fast). Output is identical; orjson is used to
+# render when installed.
+
+RECIPE_FAST_LISTS = False
+
+# Recipes serialized per batch by the streaming recipe export (recipe.export)
+# and loaded per server-side cursor fetch.
+RECIPE_EXPORT_CHUNK_SIZE = 500
+
+# Recipe imports (recipe.importer): valid rows are inserted BATCH_SIZE at a
+# time and at most MAX_ERRORS invalid rows are listed in the report.
+RECIPE_IMPORT = {
+    'BATCH_SIZE': 5000,
+    'MAX_ERRORS': 1000,
+}
+
+# Per request metrics (core.metrics): wall time, database queries and
+# time, serializer and render time and response size per route, served in
+# the Prometheus format at /metrics to scrapers sending TOKEN as a bearer
+# token (disabled without one). Requests over either budget are logged
+# with their slowest SQL statement.
+REQUEST_METRICS = {
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+    'QUERY_BUDGET': 50,
+    'LATENCY_BUDGET_MS': 1000,
+}
+
+# Incremental sync of recipes, tags and ingredients (recipe.views.SyncView)
+# from the change log of core.versioning: log entries returned per request
+# by default and at most, and the days entries are kept by the
+# compact_changes command.
+RECIPE_SYNC = {
+    'BATCH_SIZE': 500,
+    'MAX_BATCH_SIZE': 5000,
+    'RETENTION_DAYS': 30,
+}
+
+# Password hashing (core.hashers). New passwords are hashed with
+# ALGORITHM (scrypt, argon2, which needs argon2-cffi, or pbkdf2) at the
+# costs below; hashes of another algorithm or cost are upgraded on the
+# next login. At most WORKERS hashes run at once so that login bursts
+# leave CPU to other requests; with 0 they run on the request thread.
+# Compare the settings with the benchmark_logins command.
+PASSWORD_HASHING = {
+    'ALGORITHM': os.environ.get('PASSWORD_HASHER', 'scrypt'),
+    'SCRYPT_WORK_FACTOR': int(os.environ.get('SCRYPT_WORK_FACTOR', 2 ** 14)),
+    'ARGON2_TIME_COST': int(os.environ.get('ARGON2_TIME_COST', 2)),
+    # KiB
+    'ARGON2_MEMORY_COST': int(os.environ.get('ARGON2_MEMORY_COST', 19456)),
+    'ARGON2_PARALLELISM': 1,
+    'PBKDF2_ITERATIONS': int(os.environ.get('PBKDF2_ITERATIONS', 390000)),
+    'WORKERS': int(os.environ.get('PASSWORD_HASH_WORKERS',
+                                  max(1, (os.cpu_count() or 2) // 2))),
+}
+PASSWORD_HASHERS = [
+    f'core.hashers.{name}PasswordHasher'
+    for name in sorted(('Scrypt', 'Argon2', 'PBKDF2'), key=lambda name: (
+        name.lower() != PASSWORD_HASHING['ALGORITHM']))
+]
+
+# Token bucket throttles of the signup and login endpoints
+# (core.throttling), checked before any password is hashed. RATES maps
+# '<signup|login>-<ip|email>' to a (burst, tokens per minute) pair.
+# Buckets live in process, at most MAX_SIZE of them, unless SHARED_CACHE
+# names a CACHES alias shared by all workers. NUM_PROXIES is the number
+# of reverse proxies whose X-Forwarded-For entries are trusted.
+AUTH_THROTTLE = {
+    'MAX_SIZE': 100000,
+    'SHARED_CACHE': None,
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+    'RATES': {
+        'signup-ip': (10, 5),
+        'signup-email': (3, 1),
+        'login-ip': (30, 30),
+        'login-email': (10, 5),
+    },
+}
+
+# Signed expiring tokens (core.tokens) issued by the login endpoint and
+# checked without a query; database tokens are still accepted. Revoked
+# tokens are kept in a table that every worker reads into a Bloom filter
+# of REVOCATION_BITS bits, refreshed at most every
+# REVOCATION_REFRESH_SECONDS and rebuilt once REVOCATION_CAPACITY tokens
+# were added.
+SIGNED_TOKENS = {
+    'ENABLED': True,
+    'TTL': int(os.environ.get('TOKEN_TTL', 7 * 24 * 3600)),
+    'REVOCATION_BITS': 2 ** 20,
+    'REVOCATION_HASHES': 7,
+    'REVOCATION_CAPACITY': 100000,
+    'REVOCATION_REFRESH_SECONDS': 5,
+}
+
+# Per-user recipe stats (core.stats), updated with every recipe write.
+# PRICE_BUCKETS are the upper bounds of the price distribution, plus one
+# bucket above them; run rebuild_recipe_stats after changing them. TOP
+# tags and ingredients are listed by default, up to MAX_TOP on request.
+RECIPE_STATS = {
+    'PRICE_BUCKETS': (5, 10, 20, 50, 100),
+    'TOP': 10,
+    'MAX_TOP': 100,
+}
@@ -0,0 +1,251 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core import tokens
+
+
+class TokenUserCache:
+    '''bounded LRU map of token key to user with a per entry ttl
+
+    Entries live in process memory and, when shared_alias names a CACHES
+    entry, also in that cache so other workers can skip the database too.
+    Other workers keep their local copy until it expires, so the local ttl
+    bounds how long a revoked token can still be used there. The shared
+    tier holds the user fields without the password hash, see to_shared().
+    '''
+    key_prefix = 'token-user:'
+
+    def __init__(self, max_size=10000, ttl=60, shared_alias=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        '''return the shared cache backend, if one is configured'''
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, key):
+        '''return a copy of the cached user for key, or None'''
+        user = self._get_local(key)
+        if user is None and self.shared is not None:
+            user = self._shared_hit(key,
+                                    self.shared.get(self.key_prefix + key))
+        return user if user is not None else self._miss()
+
+    async def aget(self, key):
+        '''async get(), reading the shared tier without blocking'''
+        user = self._get_local(key)
+        if user is None and self.shared is not None:
+            user = self._shared_hit(
+                key, await self.shared.aget(self.key_prefix + key))
+        return user if user is not None else self._miss()
+
+    def _get_local(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.copy(entry[1])
+            self._entries.pop(key, None)
+        return None
+
+    @staticmethod
+    def to_shared(user):
+        '''return the shared tier entry of user
+
+        The password field is left out; users rebuilt from the entry load
+        it on access and only save the fields they were given.
+        '''
+        fields = [field.attname for field in user._meta.concrete_fields
+                  if field.attname != 'password']
+        return fields, [getattr(user, name) for name in fields]
+
+    @staticmethod
+    def from_shared(entry):
+        '''return the user of a to_shared() entry'''
+        fields, values = entry
+        return get_user_model().from_db('default', fields, values)
+
+    def _shared_hit(self, key, entry):
+        if entry is None:
+            return None
+        user = self.from_shared(entry)
+        self._store(key, user)
+        with self._lock:
+            self.shared_hits += 1
+        return copy.copy(user)
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, user):
+        '''cache user for key in every tier'''
+        user = copy.copy(user)
+        self._store(key, user)
+        if self.shared is not None:
+            self.shared.set(self.key_prefix + key, self.to_shared(user),
+                            self.ttl)
+
+    async def aset(self, key, user):
+        '''async set()'''
+        user = copy.copy(user)
+        self._store(key, user)
+        if self.shared is not None:
+            await self.shared.aset(self.key_prefix + key,
+                                   self.to_shared(user), self.ttl)
+
+    def _store(self, key, user):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        '''drop keys from every tier'''
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if keys and self.shared is not None:
+            self.shared.delete_many([self.key_prefix + key for key in keys])
+
+    def clear(self):
+        '''drop every local entry and reset the counters'''
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        '''return hit/miss counters and the current local size'''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+            }
+
+
+_config = getattr(settings, 'TOKEN_AUTH_CACHE', {})
+token_cache = TokenUserCache(
+    max_size=_config.get('MAX_SIZE', 10000),
+    ttl=_config.get('TTL', 60),
+    shared_alias=_config.get('SHARED_CACHE'),
+)
+
+
+def user_cache_key(user_id):
+    '''return the token_cache key of the user of signed tokens'''
+    return f'user:{user_id}'
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''TokenAuthentication that caches the token -> user lookup
+
+    Accepts the signed tokens of core.tokens, checked without a query,
+    and database tokens. The users of signed tokens are cached by id.
+    Entries are evicted when the token is deleted or its user is saved
+    (deactivated, password changed, ...), see core.signals.
+    '''
+
+    def authenticate_credentials(self, key):
+        if tokens.is_signed(key):
+            token = self.load_signed(key)
+            if tokens.revocations.is_revoked(token.token_id):
+                raise exceptions.AuthenticationFailed(_('Token revoked.'))
+            user = token_cache.get(user_cache_key(token.user_id))
+            # the copy may predate a password change made elsewhere
+            if user is None or not token.matches(user):
+                user = get_user_model().objects.filter(
+                    pk=token.user_id, is_active=True).first()
+                if user is not None:
+                    token_cache.set(user_cache_key(user.pk), user)
+            return (self.check_user(user, token), token)
+
+        user = token_cache.get(key)
+        if user is not None:
+            return (user, self.get_model()(key=key, user=user))
+
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user)
+        return (user, token)
+
+    def load_signed(self, key):
+        '''return the SignedToken of key, or raise AuthenticationFailed'''
+        if not settings.SIGNED_TOKENS['ENABLED']:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        try:
+            return tokens.load(key)
+        except tokens.TokenExpired:
+            raise exceptions.AuthenticationFailed(_('Token expired.'))
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+    def check_user(self, user, token):
+        '''return user if token still authenticates it'''
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        if not token.matches(user):
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        return user
+
+    async def aauthenticate(self, request):
+        '''async authenticate(), for the async read views'''
+        key = _TokenKey().authenticate(request)
+        if key is None:
+            return None
+
+        if tokens.is_signed(key):
+            token = self.load_signed(key)
+            if await tokens.revocations.ais_revoked(token.token_id):
+                raise exceptions.AuthenticationFailed(_('Token revoked.'))
+            user = await token_cache.aget(user_cache_key(token.user_id))
+            if user is None or not token.matches(user):
+                user = await get_user_model().objects.filter(
+                    pk=token.user_id, is_active=True).afirst()
+                if user is not None:
+                    await token_cache.aset(user_cache_key(user.pk), user)
+            return (self.check_user(user, token), token)
+
+        user = await token_cache.aget(key)
+        if user is not None:
+            return (user, self.get_model()(key=key, user=user))
+
+        model = self.get_model()
+        try:
+            token = await model.objects.select_related('user').aget(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        await token_cache.aset(key, token.user)
+        return (token.user, token)
+
+
+class _TokenKey(TokenAuthentication):
+    '''TokenAuthentication parsing the header into the key alone'''
+
+    def authenticate_credentials(self, key):
+        return key
@@ -0,0 +1,213 @@
+import bisect
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, F, Q, When
+from django.db.models.functions import Upper
+
+# pg_trgm's default similarity threshold for the % operator
+SIMILARITY_THRESHOLD = 0.3
+
+
+def trigrams(text):
+    '''return the trigrams of the words of text, padded like pg_trgm'''
+    grams = set()
+    for word in re.findall(r'\w+', text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NameIndex:
+    '''prefix and trigram index of the tag or ingredient names of a user
+
+    Prefix matches come from a sorted list of lowercased names, typo
+    tolerant matches from an inverted trigram index scored like pg_trgm's
+    similarity().
+    '''
+
+    def __init__(self, rows=()):
+        self._names = {}
+        self._sorted = []
+        self._grams = {}
+        self._gram_counts = {}
+        self._lock = threading.Lock()
+        self.add(rows)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, rows):
+        '''index (id, name) rows, replacing earlier names of the same ids'''
+        with self._lock:
+            for pk, name in rows:
+                self._remove(pk)
+                self._names[pk] = name
+                bisect.insort(self._sorted, (name.lower(), pk))
+                grams = trigrams(name)
+                self._gram_counts[pk] = len(grams)
+                for gram in grams:
+                    self._grams.setdefault(gram, set()).add(pk)
+
+    def remove(self, pk):
+        '''drop the name of pk from the index'''
+        with self._lock:
+            self._remove(pk)
+
+    def _remove(self, pk):
+        name = self._names.pop(pk, None)
+        if name is None:
+            return
+        key = (name.lower(), pk)
+        position = bisect.bisect_left(self._sorted, key)
+        if self._sorted[position:position + 1] == [key]:
+            del self._sorted[position]
+        del self._gram_counts[pk]
+        for gram in trigrams(name):
+            ids = self._grams[gram]
+            ids.discard(pk)
+            if not ids:
+                del self._grams[gram]
+
+    def search(self, q, limit):
+        '''return up to limit (id, name) pairs best matching q
+
+        Names starting with q come first in alphabetical order, then names
+        at least SIMILARITY_THRESHOLD similar to q, most similar first.
+        '''
+        prefix = q.lower()
+        with self._lock:
+            matches = []
+            position = bisect.bisect_left(self._sorted, (prefix,))
+            for lowered, pk in self._sorted[position:position + limit]:
+                if not lowered.startswith(prefix):
+                    break
+                matches.append((pk, self._names[pk]))
+            if len(matches) == limit:
+                return matches
+
+            grams = trigrams(q)
+            shared = {}
+            for gram in grams:
+                for pk in self._grams.get(gram, ()):
+                    shared[pk] = shared.get(pk, 0) + 1
+            found = {pk for pk, _ in matches}
+            scored = []
+            for pk, count in shared.items():
+                score = count / (len(grams) + self._gram_counts[pk] - count)
+                if score >= SIMILARITY_THRESHOLD and pk not in found:
+                    scored.append((-score, self._names[pk].lower(), pk))
+            scored.sort()
+            matches += [(pk, self._names[pk])
+                        for _, _, pk in scored[:limit - len(matches)]]
+            return matches
+
+
+def has_trigram_extension(using='default'):
+    '''return True if the database has pg_trgm installed'''
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+class NameIndexCache:
+    '''bounded LRU of per user NameIndex objects with a per entry ttl
+
+    Indexes are built on first use and updated in place when this process
+    creates, renames or deletes names (see core.signals); the ttl bounds
+    how long changes made by other processes stay invisible. Users with
+    more than db_threshold names are searched in the database instead,
+    when pg_trgm is available.
+    '''
+
+    def __init__(self, max_users=1000, ttl=300, db_threshold=5000):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.db_threshold = db_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._trigram_db = {}
+
+    def get(self, model, user_id):
+        '''return the NameIndex of user_id, or None to search the database'''
+        key = (model._meta.label, user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        rows = model.objects.filter(user_id=user_id).values_list('id', 'name')
+        using = rows.db
+        if using not in self._trigram_db:
+            self._trigram_db[using] = has_trigram_extension(using)
+        if self._trigram_db[using]:
+            rows = list(rows[:self.db_threshold + 1])
+        index = None
+        if len(rows) <= self.db_threshold or not self._trigram_db[using]:
+            index = NameIndex(rows)
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, index)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return index
+
+    def _cached(self, model, user_id):
+        with self._lock:
+            entry = self._entries.get((model._meta.label, user_id))
+        return entry[1] if entry is not None else None
+
+    def add(self, model, user_id, rows):
+        '''index (id, name) rows in the cached index of user_id, if any'''
+        index = self._cached(model, user_id)
+        if index is not None:
+            index.add(rows)
+
+    def remove(self, model, user_id, pk):
+        '''drop pk from the cached index of user_id, if any'''
+        index = self._cached(model, user_id)
+        if index is not None:
+            index.remove(pk)
+
+    def clear(self):
+        '''drop every cached index'''
+        with self._lock:
+            self._entries.clear()
+            self._trigram_db.clear()
+
+    def search(self, model, user_id, q, limit):
+        '''return up to limit model instances of user_id best matching q'''
+        index = self.get(model, user_id)
+        if index is not None:
+            return [model(id=pk, name=name, user_id=user_id)
+                    for pk, name in index.search(q, limit)]
+
+        q = q.upper()
+        is_prefix = Q(upper_name__startswith=q)
+        return list(model.objects.filter(user_id=user_id).annotate(
+            upper_name=Upper('name')).filter(
+            is_prefix | Q(upper_name__trigram_similar=q)
+        ).annotate(
+            prefix_name=Case(When(is_prefix, then='upper_name')),
+            similarity=TrigramSimilarity('upper_name', q),
+        ).order_by(F('prefix_name').asc(nulls_last=True), '-similarity',
+                   'name')[:limit])
+
+
+_config = getattr(settings, 'RECIPE_AUTOCOMPLETE', {})
+name_index = NameIndexCache(
+    max_users=_config.get('MAX_USERS', 1000),
+    ttl=_config.get('TTL', 300),
+    db_threshold=_config.get('DB_THRESHOLD', 5000),
+)
@@ -0,0 +1,524 @@
+import http.client
+import io
+import itertools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.servers.basehttp import ThreadedWSGIServer, \
+    WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client
+from django.test.client import MULTIPART_CONTENT, BOUNDARY, \
+    encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from PIL import Image
+
+from core import models, tokens, versioning
+from core.seed import SEED_PASSWORD, seed_recipes
+from recipe import images
+
+EMAIL_PREFIX = 'benchmark-api'
+
+JSON = 'application/json'
+
+# seconds to wait for queued image processing before deleting the files
+IMAGE_TIMEOUT = 30
+
+# metrics compared against a baseline; queries must never grow
+LATENCY_METRICS = ('p50', 'p95')
+MEMORY_METRICS = ('peak_kib',)
+
+
+class BenchmarkError(Exception):
+    '''raised when a scenario gets an unexpected response'''
+
+
+def allowed_host():
+    '''return a host name that ALLOWED_HOSTS accepts'''
+    for host in settings.ALLOWED_HOSTS:
+        return 'localhost' if host == '*' else host.lstrip('.')
+    return 'localhost'
+
+
+def percentile(timings, fraction):
+    '''return the fraction percentile of sorted timings'''
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def jpeg(width=800, height=600):
+    '''return the bytes of a plain JPEG image'''
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 120, 40)).save(
+        buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def api_routes(namespaces=('recipe', 'user')):
+    '''return the (route name, method) pairs served under namespaces'''
+    routes = set()
+
+    def walk(patterns, namespace):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns, pattern.namespace or namespace)
+            elif namespace in namespaces and pattern.name:
+                callback = pattern.callback
+                # viewsets map methods to actions; other views define them
+                methods = getattr(callback, 'actions', None) or [
+                    method for method in callback.view_class.http_method_names
+                    if hasattr(callback.view_class, method)]
+                routes.update((f'{namespace}:{pattern.name}', method.upper())
+                              for method in methods
+                              if method not in ('head', 'options'))
+
+    walk(get_resolver().url_patterns, None)
+    return routes
+
+
+class Fixture:
+    '''seeded users, recipes, tags and ingredients the scenarios use
+
+    The first seeded user makes every request. Rows the scenarios create
+    are deleted by reset(), so each scenario starts from the same data.
+    '''
+
+    def __init__(self, users=1, recipes=100, ingredients_per_recipe=5,
+                 tags_per_recipe=3):
+        self.users = seed_recipes(
+            users=users, recipes_per_user=recipes,
+            ingredients_per_recipe=ingredients_per_recipe,
+            tags_per_recipe=tags_per_recipe, email_prefix=EMAIL_PREFIX)
+        self.user = self.users[0]
+        self.token = tokens.issue(self.user).key
+        self.recipe_id = self.user.recipes.order_by('id').values_list(
+            'id', flat=True).first()
+        self.tag_ids = list(self.user.tags.order_by('id').values_list(
+            'id', flat=True)[:tags_per_recipe])
+        self.ingredient_ids = list(
+            self.user.ingredients.order_by('id').values_list(
+                'id', flat=True)[:ingredients_per_recipe])
+        self.counter = itertools.count()
+
+        self.image_recipe = self.new_recipe()
+        self.image_recipe.image.save('benchmark.jpg', ContentFile(jpeg()))
+        images.process_image(self.image_recipe.pk)
+        self.last_ids = {
+            model: model.objects.order_by('-id').values_list(
+                'id', flat=True).first() or 0
+            for model in (models.Recipe, models.Tag, models.Ingredient)
+        }
+
+    def renew_token(self):
+        '''issue the token of the user again, after a password change'''
+        self.user.refresh_from_db(fields=['token_generation'])
+        self.token = tokens.issue(self.user).key
+
+    def next(self):
+        '''return a number no other call returned'''
+        return next(self.counter)
+
+    def new_recipe(self):
+        '''create and return a recipe that reset() deletes'''
+        recipe = models.Recipe.objects.create(
+            user=self.user, title=f'benchmark {self.next()}',
+            time_minutes=30, price=Decimal('9.99'))
+        recipe.tags.add(*self.tag_ids)
+        recipe.ingredients.add(*self.ingredient_ids)
+        return recipe
+
+    def recipe_payload(self):
+        '''return the JSON body of a new recipe'''
+        return {
+            'title': f'benchmark {self.next()}',
+            'time_minutes': 30,
+            'price': '9.99',
+            'tags': self.tag_ids,
+            'ingredients': self.ingredient_ids,
+            'ingredient_names': ['benchmark salt'],
+        }
+
+    def reset(self):
+        '''delete what the scenarios created since the fixture was seeded
+
+        The token is issued again, in case a scenario changed the password.
+        '''
+        for model, last_id in self.last_ids.items():
+            created = model.objects.filter(user=self.user, id__gt=last_id)
+            if model is models.Recipe:
+                self.delete_images(created)
+            created.delete()
+        self.renew_token()
+        get_user_model().objects.filter(
+            email__startswith=f'{EMAIL_PREFIX}-new').delete()
+
+    def delete_images(self, recipes):
+        '''wait for the queued images of recipes, then delete their files'''
+        busy = recipes.filter(image_status__in=(
+            models.Recipe.ImageStatus.PENDING,
+            models.Recipe.ImageStatus.PROCESSING))
+        deadline = time.monotonic() + IMAGE_TIMEOUT
+        while busy.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        for image, renditions in recipes.exclude(image='').values_list(
+                'image', 'image_renditions'):
+            images.delete_files([image, *renditions.values()])
+
+    def delete(self):
+        '''delete every row and file of the fixture'''
+        self.reset()
+        self.delete_images(models.Recipe.objects.filter(
+            pk=self.image_recipe.pk))
+        for user in self.users:
+            user.delete()
+
+
+def _url(route, *args, **query):
+    '''return the path of route, with query parameters'''
+    path = reverse(route, args=args)
+    return f'{path}?{urlencode(query)}' if query else path
+
+
+def _get(route, *args, **query):
+    '''return a build function for a GET of route'''
+    return lambda fixture: (_url(route, *args, **query), b'', None)
+
+
+def _json(path, data):
+    '''return a request of path with a JSON body'''
+    return path, json.dumps(data).encode(), JSON
+
+
+def _ids(ids):
+    '''return ids as a comma separated query parameter'''
+    return ','.join(str(pk) for pk in ids)
+
+
+class Scenario:
+    '''one kind of request, built fresh from the fixture for each run
+
+    build(fixture) returns (path, body, content type) and may create the
+    rows the request needs; status is the expected response status.
+    '''
+
+    def __init__(self, method, route, build, label='', status=200):
+        self.method = method
+        self.route = route
+        self.build = build
+        self.label = label
+        self.status = status
+
+    @property
+    def name(self):
+        label = f' [{self.label}]' if self.label else ''
+        return f'{self.method} {self.route}{label}'
+
+
+def _create_user(fixture):
+    return _json(_url('user:create'), {
+        'email': f'{EMAIL_PREFIX}-new{fixture.next()}@example.com',
+        'password': SEED_PASSWORD,
+        'name': 'Benchmark User',
+    })
+
+
+def _token(fixture):
+    return _json(_url('user:token'), {
+        'email': fixture.user.email, 'password': SEED_PASSWORD})
+
+
+def _rotate_token(route):
+    return lambda fixture: _json(_url(route), {
+        'token': tokens.issue(fixture.user).key})
+
+
+def _put_me(fixture):
+    # setting the password invalidates the signed tokens of the user
+    fixture.renew_token()
+    return _json(_url('user:me'), {
+        'email': fixture.user.email,
+        'password': SEED_PASSWORD,
+        'name': fixture.user.name,
+    })
+
+
+def _create_name(route):
+    return lambda fixture: _json(_url(route), {
+        'name': f'benchmark {fixture.next()}'})
+
+
+def _list_filtered(fixture):
+    return _url('recipe:recipe-list', tags=_ids(fixture.tag_ids[:2]),
+                ingredients=_ids(fixture.ingredient_ids[:2])), b'', None
+
+
+def _detail(fixture):
+    return _url('recipe:recipe-detail', fixture.recipe_id), b'', None
+
+
+def _async_detail(fixture):
+    return _url('recipe:async-recipe-detail', fixture.recipe_id), b'', None
+
+
+def _create_recipe(fixture):
+    return _json(_url('recipe:recipe-list'), fixture.recipe_payload())
+
+
+def _bulk_create(fixture):
+    return _json(_url('recipe:recipe-bulk-create'),
+                 [fixture.recipe_payload() for _ in range(10)])
+
+
+def _bulk_update(fixture):
+    return _json(_url('recipe:recipe-bulk-create'), [
+        {'id': fixture.new_recipe().pk, 'title': f'benchmark {n}'}
+        for n in range(10)])
+
+
+def _bulk_delete(fixture):
+    ids = [fixture.new_recipe().pk for _ in range(10)]
+    return _url('recipe:recipe-bulk-create', ids=_ids(ids)), b'', None
+
+
+def _import(fixture):
+    lines = [json.dumps({
+        'title': f'benchmark {fixture.next()}', 'time_minutes': 30,
+        'price': '9.99', 'ingredients': ['benchmark salt'],
+        'tags': ['benchmark'],
+    }) for _ in range(10)]
+    return (_url('recipe:recipe-import-recipes'),
+            '\n'.join(lines).encode(), 'application/x-ndjson')
+
+
+def _update_recipe(fixture):
+    return _json(_url('recipe:recipe-detail', fixture.new_recipe().pk),
+                 fixture.recipe_payload())
+
+
+def _patch_recipe(fixture):
+    return _json(_url('recipe:recipe-detail', fixture.new_recipe().pk),
+                 {'title': f'benchmark {fixture.next()}'})
+
+
+def _delete_recipe(fixture):
+    return _url('recipe:recipe-detail', fixture.new_recipe().pk), b'', None
+
+
+def _image_variant(fixture):
+    return _url('recipe:recipe-image-variant', fixture.image_recipe.pk,
+                width=100), b'', None
+
+
+def _upload_image(fixture):
+    image = SimpleUploadedFile('benchmark.jpg', jpeg(), 'image/jpeg')
+    return (_url('recipe:recipe-upload-image', fixture.new_recipe().pk),
+            encode_multipart(BOUNDARY, {'image': image}), MULTIPART_CONTENT)
+
+
+def _sync(fixture):
+    since = versioning.head(fixture.user.pk)
+    for _ in range(10):
+        fixture.new_recipe()
+    return _url('recipe:sync', since=since), b'', None
+
+
+SCENARIOS = (
+    Scenario('POST', 'user:create', _create_user, status=201),
+    Scenario('POST', 'user:token', _token),
+    Scenario('POST', 'user:token-refresh',
+             _rotate_token('user:token-refresh')),
+    Scenario('POST', 'user:token-revoke', _rotate_token('user:token-revoke'),
+             status=204),
+    Scenario('GET', 'user:me', _get('user:me')),
+    Scenario('PUT', 'user:me', _put_me),
+    Scenario('PATCH', 'user:me', lambda fixture: _json(
+        _url('user:me'), {'name': fixture.user.name})),
+    Scenario('GET', 'recipe:api-root', _get('recipe:api-root')),
+    Scenario('GET', 'recipe:tag-list', _get('recipe:tag-list')),
+    Scenario('POST', 'recipe:tag-list', _create_name('recipe:tag-list'),
+             status=201),
+    Scenario('GET', 'recipe:tag-autocomplete',
+             _get('recipe:tag-autocomplete', q='tag 1')),
+    Scenario('GET', 'recipe:ingredient-list',
+             _get('recipe:ingredient-list')),
+    Scenario('POST', 'recipe:ingredient-list',
+             _create_name('recipe:ingredient-list'), status=201),
+    Scenario('GET', 'recipe:ingredient-autocomplete',
+             _get('recipe:ingredient-autocomplete', q='ingredient 1')),
+    Scenario('GET', 'recipe:recipe-list', _get('recipe:recipe-list')),
+    Scenario('GET', 'recipe:recipe-list', _list_filtered, label='filtered'),
+    Scenario('GET', 'recipe:recipe-list',
+             _get('recipe:recipe-list', q='recipe 1'), label='search'),
+    Scenario('GET', 'recipe:recipe-list',
+             _get('recipe:recipe-list', page_size=50), label='page'),
+    Scenario('POST', 'recipe:recipe-list', _create_recipe, status=201),
+    Scenario('POST', 'recipe:recipe-bulk-create', _bulk_create,
+             status=201),
+    Scenario('PATCH', 'recipe:recipe-bulk-create', _bulk_update),
+    Scenario('DELETE', 'recipe:recipe-bulk-create', _bulk_delete),
+    Scenario('GET', 'recipe:recipe-export', _get('recipe:recipe-export')),
+    Scenario('POST', 'recipe:recipe-import-recipes', _import),
+    Scenario('GET', 'recipe:recipe-detail', _detail),
+    Scenario('PUT', 'recipe:recipe-detail', _update_recipe),
+    Scenario('PATCH', 'recipe:recipe-detail', _patch_recipe),
+    Scenario('DELETE', 'recipe:recipe-detail', _delete_recipe, status=204),
+    Scenario('GET', 'recipe:recipe-image-variant', _image_variant),
+    Scenario('POST', 'recipe:recipe-upload-image', _upload_image,
+             status=202),
+    Scenario('GET', 'recipe:async-recipe-list',
+             _get('recipe:async-recipe-list')),
+    Scenario('GET', 'recipe:async-recipe-detail', _async_detail),
+    Scenario('GET', 'recipe:async-tag-list', _get('recipe:async-tag-list')),
+    Scenario('GET', 'recipe:async-ingredient-list',
+             _get('recipe:async-ingredient-list')),
+    Scenario('GET', 'recipe:sync', _sync),
+    Scenario('GET', 'recipe:stats', _get('recipe:stats')),
+)
+
+
+def missing_routes(scenarios=SCENARIOS):
+    '''return the (route name, method) pairs no scenario requests'''
+    return api_routes().difference(
+        (scenario.route, scenario.method) for scenario in scenarios)
+
+
+def client_sender(fixture):
+    '''return send(method, path, body, content type) via the test client'''
+    client = Client(HTTP_HOST=allowed_host())
+
+    def send(method, path, body, content_type):
+        response = client.generic(
+            method, path, body, content_type or 'application/octet-stream',
+            HTTP_AUTHORIZATION=f'Token {fixture.token}')
+        content = (b''.join(response.streaming_content)
+                   if response.streaming else response.content)
+        response.close()
+        return response.status_code, content
+    return send
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    '''request handler that does not log every request'''
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def http_server():
+    '''serve the project on a free local port in threads; yield the port'''
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler,
+                                allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_port
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def http_sender(port, fixture):
+    '''return send(method, path, body, content type) over HTTP to port'''
+
+    def send(method, path, body, content_type):
+        client = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        headers = {'Host': allowed_host(),
+                   'Authorization': f'Token {fixture.token}'}
+        if content_type:
+            headers['Content-Type'] = content_type
+        try:
+            client.request(method, path, body or None, headers)
+            response = client.getresponse()
+            return response.status, response.read()
+        finally:
+            client.close()
+    return send
+
+
+def _checked(send, scenario, request):
+    '''return the seconds send took for request, checking its status'''
+    begin = time.perf_counter()
+    status, content = send(scenario.method, *request)
+    elapsed = time.perf_counter() - begin
+    if status != scenario.status:
+        raise BenchmarkError(
+            f'{scenario.name} answered {status}, expected '
+            f'{scenario.status}: {content[:200]!r}')
+    return elapsed
+
+
+def run_scenario(scenario, fixture, send, iterations=20, warmup=2,
+                 profile=False):
+    '''return the latency percentiles of scenario, in milliseconds
+
+    With profile, one more request is made to count its queries on this
+    thread's connection and trace its peak memory, as queries and
+    peak_kib. The fixture is reset afterwards.
+    '''
+    try:
+        timings = []
+        for n in range(warmup + iterations):
+            elapsed = _checked(send, scenario, scenario.build(fixture))
+            if n >= warmup:
+                timings.append(elapsed)
+        timings.sort()
+        result = {
+            f'p{int(fraction * 100)}': round(
+                percentile(timings, fraction) * 1000, 2)
+            for fraction in (0.5, 0.95, 0.99)
+        }
+        if profile:
+            request = scenario.build(fixture)
+            tracemalloc.start()
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    _checked(send, scenario, request)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            result['queries'] = len(queries)
+            result['peak_kib'] = round(peak / 1024)
+        return result
+    finally:
+        fixture.reset()
+
+
+def compare(baseline, results, threshold=0.25, min_delta_ms=2.0):
+    '''return a message for each metric of results worse than baseline
+
+    Latencies and peak memory regress when they grow by more than
+    threshold (a fraction), latencies also by at least min_delta_ms;
+    query counts regress when they grow at all. Results without a
+    baseline are not compared.
+    '''
+    regressions = []
+    for key, result in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for metric in LATENCY_METRICS + MEMORY_METRICS:
+            if metric not in result or metric not in base:
+                continue
+            old, new = base[metric], result[metric]
+            if new <= old * (1 + threshold):
+                continue
+            if metric in LATENCY_METRICS and new - old < min_delta_ms:
+                continue
+            regressions.append(f'{key}: {metric} {old} -> {new}')
+        if result.get('queries', 0) > base.get('queries', float('inf')):
+            regressions.append(
+                f'{key}: queries {base["queries"]} -> {result["queries"]}')
+    return regressions
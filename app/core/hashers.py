@@ -0,0 +1,100 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_executor = None
+_executor_lock = threading.Lock()
+_worker = threading.local()
+
+
+def get_executor():
+    '''return the process wide password hashing pool'''
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING['WORKERS'],
+                thread_name_prefix='password-hash',
+                initializer=_mark_worker)
+        return _executor
+
+
+def _mark_worker():
+    _worker.active = True
+
+
+def run(function, *args, **kwargs):
+    '''return function(*args, **kwargs) computed on the hashing pool
+
+    At most PASSWORD_HASHING WORKERS hashes run at once, whatever the
+    number of request threads logging in; the others wait their turn.
+    With 0 workers, and on the pool itself, function runs right away.
+    '''
+    if (not settings.PASSWORD_HASHING['WORKERS'] or
+            getattr(_worker, 'active', False)):
+        return function(*args, **kwargs)
+    return get_executor().submit(function, *args, **kwargs).result()
+
+
+def hasher_paths(algorithm):
+    '''return PASSWORD_HASHERS preferring algorithm, a HASHERS key'''
+    preferred = HASHERS[algorithm]
+    return [f'{__name__}.{hasher.__name__}' for hasher in
+            [preferred, *(h for h in HASHERS.values() if h is not preferred)]]
+
+
+class PooledHasherMixin:
+    '''hasher mixin running encode and verify on the hashing pool'''
+
+    def encode(self, password, salt, *args, **kwargs):
+        return run(super().encode, password, salt, *args, **kwargs)
+
+    def verify(self, password, encoded):
+        return run(super().verify, password, encoded)
+
+
+class ScryptPasswordHasher(PooledHasherMixin,
+                           hashers.ScryptPasswordHasher):
+    '''scrypt with the PASSWORD_HASHING SCRYPT_WORK_FACTOR'''
+    # a limit rather than an allocation; OpenSSL refuses over 32MiB, the
+    # memory of a 2 ** 15 work factor, by default
+    maxmem = 2 ** 30
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_HASHING['SCRYPT_WORK_FACTOR']
+
+
+class Argon2PasswordHasher(PooledHasherMixin,
+                           hashers.Argon2PasswordHasher):
+    '''argon2id with the PASSWORD_HASHING ARGON2 costs; needs argon2-cffi'''
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_HASHING['ARGON2_TIME_COST']
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_HASHING['ARGON2_MEMORY_COST']
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_HASHING['ARGON2_PARALLELISM']
+
+
+class PBKDF2PasswordHasher(PooledHasherMixin,
+                           hashers.PBKDF2PasswordHasher):
+    '''PBKDF2-SHA256 with the PASSWORD_HASHING PBKDF2_ITERATIONS'''
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASHING['PBKDF2_ITERATIONS']
+
+
+HASHERS = {
+    'scrypt': ScryptPasswordHasher,
+    'argon2': Argon2PasswordHasher,
+    'pbkdf2': PBKDF2PasswordHasher,
+}
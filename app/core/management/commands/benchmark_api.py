@@ -0,0 +1,140 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmark
+from core.throttling import bucket_store
+from recipe.cache import response_cache
+
+MODES = ('in-process', 'http')
+
+
+class Command(BaseCommand):
+    '''Django command to benchmark every recipe and user API route'''
+    help = ('Seed users with recipes, ingredients and tags, then request '
+            'every route of the recipe and user APIs through the test '
+            'client and over HTTP from a local threaded server. Reports '
+            'latency percentiles, and for in-process requests the queries '
+            'and peak traced memory of one request. Compares the results '
+            'with a saved baseline and fails on regressions. The response '
+            'cache and the login throttles are off during the run; seeded '
+            'and created rows are deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--recipes', type=int, default=100,
+                            help='recipes per user')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=5)
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--mode', choices=MODES + ('both',),
+                            default='both')
+        parser.add_argument('--only',
+                            help='run the scenarios whose name contains this')
+        parser.add_argument('--baseline',
+                            help='JSON results to compare with')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='write the results to --baseline instead')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='allowed fractional latency/memory growth')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='ignore latency growth below this')
+
+    def handle(self, *args, **options):
+        missing = benchmark.missing_routes()
+        if missing:
+            raise CommandError('No scenario for: ' + ', '.join(
+                f'{method} {route}' for route, method in sorted(missing)))
+        if options['recipes'] < 1 or options['users'] < 1:
+            raise CommandError('Expected at least one user and recipe.')
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError('--save-baseline needs --baseline.')
+        scenarios = [scenario for scenario in benchmark.SCENARIOS
+                     if (options['only'] or '') in scenario.name]
+        modes = MODES if options['mode'] == 'both' else (options['mode'],)
+
+        # seeded rows are committed, the HTTP server reads them on other
+        # connections
+        fixture = benchmark.Fixture(
+            users=options['users'], recipes=options['recipes'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            tags_per_recipe=options['tags_per_recipe'])
+        timeout = response_cache.timeout
+        try:
+            # measure the views, not the response cache
+            response_cache.timeout = 0
+            bucket_store.enabled = False
+            results = self.run(fixture, scenarios, modes, options)
+        except benchmark.BenchmarkError as exc:
+            raise CommandError(exc)
+        finally:
+            response_cache.timeout = timeout
+            bucket_store.enabled = True
+            fixture.delete()
+
+        if options['baseline']:
+            self.check_baseline(results, options)
+
+    def run(self, fixture, scenarios, modes, options):
+        '''return {"<mode> <scenario>": metrics} of every run'''
+        results = {}
+        for mode in modes:
+            if mode == 'http':
+                with benchmark.http_server() as port:
+                    send = benchmark.http_sender(port, fixture)
+                    results.update(self.run_mode(
+                        mode, send, fixture, scenarios, options))
+            else:
+                send = benchmark.client_sender(fixture)
+                results.update(self.run_mode(
+                    mode, send, fixture, scenarios, options))
+        return results
+
+    def run_mode(self, mode, send, fixture, scenarios, options):
+        results = {}
+        for scenario in scenarios:
+            key = f'{mode} {scenario.name}'
+            result = results[key] = benchmark.run_scenario(
+                scenario, fixture, send, iterations=options['iterations'],
+                warmup=options['warmup'], profile=mode == 'in-process')
+            line = (f'{key:<56} p50={result["p50"]:.1f}ms '
+                    f'p95={result["p95"]:.1f}ms p99={result["p99"]:.1f}ms')
+            if 'queries' in result:
+                line += (f' queries={result["queries"]} '
+                         f'peak={result["peak_kib"]}KiB')
+            self.stdout.write(line)
+        return results
+
+    def check_baseline(self, results, options):
+        '''save results as the baseline, or fail if they regress from it'''
+        dataset = {name: options[name] for name in (
+            'users', 'recipes', 'ingredients_per_recipe', 'tags_per_recipe',
+            'iterations')}
+        path = options['baseline']
+        if options['save_baseline']:
+            with open(path, 'w') as baseline_file:
+                json.dump({'options': dataset, 'results': results},
+                          baseline_file, indent=2, sort_keys=True)
+            self.stdout.write(f'Saved {len(results)} results to {path}.')
+            return
+
+        try:
+            with open(path) as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read baseline {path}: {exc}')
+        if baseline.get('options') != dataset:
+            self.stderr.write(
+                f'Baseline options {baseline.get("options")} differ from '
+                f'{dataset}; timings may not be comparable.')
+        regressions = benchmark.compare(
+            baseline.get('results', {}), results,
+            threshold=options['threshold'],
+            min_delta_ms=options['min_delta_ms'])
+        for regression in regressions:
+            self.stderr.write(regression)
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} regressions from the baseline.')
+        self.stdout.write('No regressions from the baseline.')
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core import benchmark, hashers
+from core.throttling import bucket_store
+
+EMAIL_PREFIX = 'benchmark-login'
+PASSWORD = 'benchmarkPass123'
+
+# name and PASSWORD_HASHING overrides; other costs keep their settings
+PRESETS = (
+    ('configured', {}),
+    ('configured-unpooled', {'WORKERS': 0}),
+    ('pbkdf2', {'ALGORITHM': 'pbkdf2'}),
+    ('scrypt-n14', {'ALGORITHM': 'scrypt', 'SCRYPT_WORK_FACTOR': 2 ** 14}),
+    ('scrypt-n15', {'ALGORITHM': 'scrypt', 'SCRYPT_WORK_FACTOR': 2 ** 15}),
+    ('argon2-t2-m19', {'ALGORITHM': 'argon2', 'ARGON2_TIME_COST': 2,
+                       'ARGON2_MEMORY_COST': 19456}),
+    ('argon2-t1-m64', {'ALGORITHM': 'argon2', 'ARGON2_TIME_COST': 1,
+                       'ARGON2_MEMORY_COST': 65536}),
+)
+
+
+class Command(BaseCommand):
+    '''Django command to benchmark logins under each hashing setting'''
+    help = ('Create a user hashed with each password hashing preset and '
+            'log it in --logins times from --threads concurrent clients '
+            'through the token endpoint. Reports logins per second, per '
+            'core hashing at once (the threads, bounded by the hashing '
+            'workers and the CPU count), and latency percentiles. Argon2 '
+            'presets are skipped without argon2-cffi. The login throttles '
+            'are off during the run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=40)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--only',
+                            help='run the presets whose name contains this')
+
+    def handle(self, *args, **options):
+        if options['logins'] < 1 or options['threads'] < 1:
+            raise CommandError('Expected at least one login and thread.')
+        presets = [(name, overrides) for name, overrides in PRESETS
+                   if (options['only'] or '') in name]
+        if not presets:
+            raise CommandError(f'No preset matches {options["only"]}.')
+
+        for name, overrides in presets:
+            config = {**settings.PASSWORD_HASHING, **overrides}
+            algorithm = config['ALGORITHM']
+            if algorithm == 'argon2' and find_spec('argon2') is None:
+                self.stdout.write(f'{name:<20} skipped: argon2-cffi is not '
+                                  f'installed')
+                continue
+            with override_settings(
+                    PASSWORD_HASHING=config,
+                    PASSWORD_HASHERS=hashers.hasher_paths(algorithm)):
+                rate, timings = self.run_logins(
+                    name, options['logins'], options['threads'])
+            cores = min(options['threads'], os.cpu_count() or 1,
+                        config['WORKERS'] or options['threads'])
+            self.stdout.write(
+                f'{name:<20} {rate:.1f} logins/s '
+                f'{rate / cores:.1f}/s per core '
+                f'p50={benchmark.percentile(timings, 0.5) * 1000:.1f}ms '
+                f'p95={benchmark.percentile(timings, 0.95) * 1000:.1f}ms')
+
+    def run_logins(self, name, logins, threads):
+        '''return logins per second and the sorted login timings'''
+        email = f'{EMAIL_PREFIX}-{name}@example.com'
+        user = get_user_model().objects.create_user(email, PASSWORD)
+        url = reverse('user:token')
+        timings = []
+        failures = []
+
+        def log_in(count):
+            client = Client(HTTP_HOST=benchmark.allowed_host())
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    response = client.post(
+                        url, {'email': email, 'password': PASSWORD})
+                    timings.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        failures.append(response.status_code)
+            finally:
+                connection.close()
+
+        bucket_store.enabled = False
+        try:
+            # the first login creates the token
+            Client(HTTP_HOST=benchmark.allowed_host()).post(
+                url, {'email': email, 'password': PASSWORD})
+            workers = [
+                threading.Thread(target=log_in, args=(
+                    logins // threads + (index < logins % threads),))
+                for index in range(threads)]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            bucket_store.enabled = True
+            user.delete()
+        if failures:
+            raise CommandError(f'{name}: {len(failures)} logins failed with '
+                               f'status {failures[0]}.')
+        return logins / elapsed, sorted(timings)
@@ -0,0 +1,72 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory
+
+from core.throttling import bucket_store
+from user.views import CreateTokenView
+
+EMAIL_PREFIX = 'benchmark-throttle'
+
+
+class Command(BaseCommand):
+    '''Django command to benchmark the login throttle checks'''
+    help = ('Time the throttle checks of --requests login requests from '
+            '--clients distinct addresses and emails, with buckets in '
+            'process and in each --cache alias. Reports the overhead per '
+            'request, excluding body parsing, which the view does anyway. '
+            'Rates are raised so that no request is rejected.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--cache', action='append', default=[],
+                            help='CACHES alias to also keep buckets in')
+
+    def handle(self, *args, **options):
+        count, clients = options['requests'], options['clients']
+        if count < 1 or clients < 1:
+            raise CommandError('Expected at least one request and client.')
+        for alias in options['cache']:
+            if alias not in settings.CACHES:
+                raise CommandError(f'No cache alias {alias}.')
+
+        view = CreateTokenView()
+        requests = []
+        for n in range(clients):
+            request = view.initialize_request(APIRequestFactory().post(
+                reverse('user:token'),
+                {'email': f'{EMAIL_PREFIX}-{n}@example.com',
+                 'password': 'benchmark'},
+                format='json',
+                REMOTE_ADDR=f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}'))
+            # the view parses the body anyway
+            request.data
+            requests.append(request)
+
+        rates = {scope: (count + 1, (count + 1) * 60)
+                 for scope in settings.AUTH_THROTTLE['RATES']}
+        shared_alias = bucket_store.shared_alias
+        try:
+            with override_settings(AUTH_THROTTLE={
+                    **settings.AUTH_THROTTLE, 'RATES': rates}):
+                for alias in [None, *options['cache']]:
+                    bucket_store.shared_alias = alias
+                    seconds = self.time_checks(view, requests, count)
+                    name = f'cache:{alias}' if alias else 'in-process'
+                    self.stdout.write(
+                        f'{name:<24} {seconds / count * 1e6:.2f}us per '
+                        f'request ({count} requests, {clients} clients)')
+        finally:
+            bucket_store.shared_alias = shared_alias
+            bucket_store.clear()
+
+    def time_checks(self, view, requests, count):
+        '''return the seconds count throttle checks of requests take'''
+        started = time.perf_counter()
+        for n in range(count):
+            view.check_throttles(requests[n % len(requests)])
+        return time.perf_counter() - started
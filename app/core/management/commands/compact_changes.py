@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import versioning
+
+
+class Command(BaseCommand):
+    '''Django command to compact the change log of the sync endpoint'''
+    help = ('Delete change log entries superseded by a newer change of the '
+            'same object, then the entries older than --days '
+            '(RECIPE_SYNC RETENTION_DAYS by default). Clients syncing from '
+            'an older token download their collections again. Run it '
+            'periodically, e.g. daily from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int)
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = settings.RECIPE_SYNC['RETENTION_DAYS']
+        superseded, expired = versioning.compact(
+            timezone.now() - timedelta(days=days))
+        self.stdout.write(f'Deleted {superseded} superseded and {expired} '
+                          f'expired changes.')
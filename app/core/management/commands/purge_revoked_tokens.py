@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import RevokedToken
+
+
+class Command(BaseCommand):
+    '''Django command to delete the revocations of expired tokens'''
+    help = ('Delete revoked signed tokens past their expiry, which no '
+            'longer authenticate anyway. Workers drop them from their '
+            'revocation filter when it is next rebuilt. Run it '
+            'periodically, e.g. daily from cron.')
+
+    def handle(self, *args, **options):
+        deleted, _ = RevokedToken.objects.filter(
+            expires_at__lte=timezone.now()).delete()
+        self.stdout.write(f'Deleted {deleted} expired revocations.')
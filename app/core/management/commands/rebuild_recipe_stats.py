@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import stats
+
+
+class Command(BaseCommand):
+    '''Django command to recount the per-user recipe stats'''
+    help = ('Recount the recipe stats of every user, or of --user ids, from '
+            'their recipes, e.g. after deploying them, after changing '
+            'RECIPE_STATS PRICE_BUCKETS or after rows were written without '
+            'going through the ORM. With --check, only report the stats '
+            'that drifted from a recount and fail if any did.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            dest='user_ids')
+        parser.add_argument('--check', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        user_ids, batch_size = options['user_ids'], options['batch_size']
+        if options['check']:
+            problems = stats.drift(user_ids, batch_size)
+            for user_id, found in problems.items():
+                for problem in found:
+                    self.stdout.write(f'user {user_id}: {problem}')
+            if problems:
+                raise CommandError(
+                    f'The stats of {len(problems)} users drifted.')
+            self.stdout.write(self.style.SUCCESS('No drift found.'))
+            return
+        count = stats.rebuild(user_ids, batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the recipe stats of {count} users.'))
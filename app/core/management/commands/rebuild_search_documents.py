@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import search
+
+
+class Command(BaseCommand):
+    '''Django command to rebuild every recipe search document'''
+    help = ('Recreate the search document of every recipe, e.g. after '
+            'rows were written without going through the ORM.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = search.rebuild_documents(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {count} search documents.'))
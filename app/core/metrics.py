@@ -0,0 +1,222 @@
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+# histogram bucket upper bounds, as Prometheus le labels
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERIES = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+         16777216)
+
+# name, help and buckets of each per request histogram
+HISTOGRAMS = (
+    ('http_request_duration_seconds',
+     'Wall time of requests.', SECONDS),
+    ('http_request_db_queries',
+     'Database queries made by requests.', QUERIES),
+    ('http_request_db_duration_seconds',
+     'Time requests spent in database queries.', SECONDS),
+    ('http_request_serialize_duration_seconds',
+     'Time requests spent serializing, without its queries.', SECONDS),
+    ('http_request_render_duration_seconds',
+     'Time requests spent rendering responses, without its queries.',
+     SECONDS),
+    ('http_response_size_bytes',
+     'Size of response bodies of known length.', BYTES),
+)
+
+_current = ContextVar('request_record', default=None)
+
+
+class RequestRecord:
+    '''cost of the request being handled in this context'''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = None
+        self.phases = {'serialize': 0.0, 'render': 0.0}
+        self.active = set()
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_sql = sql
+
+
+class _PhaseTimer:
+    '''adds its duration, less the queries run meanwhile, to a phase'''
+
+    def __init__(self, record, phase):
+        self.record = record
+        self.phase = phase
+
+    def __enter__(self):
+        self.record.active.add(self.phase)
+        self.db_seconds = self.record.db_seconds
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        record = self.record
+        record.active.discard(self.phase)
+        record.phases[self.phase] += (
+            time.perf_counter() - self.started -
+            (record.db_seconds - self.db_seconds))
+
+
+def start():
+    '''start recording a request in this context; return the reset token'''
+    return _current.set(RequestRecord())
+
+
+def stop(token):
+    '''stop recording; return the record of the request'''
+    record = _current.get()
+    _current.reset(token)
+    return record
+
+
+def current():
+    '''return the record of the request in this context, or None'''
+    return _current.get()
+
+
+def timed(phase):
+    '''return a context manager adding its time to phase of the request
+
+    Nested timers of the same phase only count once.
+    '''
+    record = _current.get()
+    if record is None or phase in record.active:
+        return nullcontext()
+    return _PhaseTimer(record, phase)
+
+
+def record_query(execute, sql, params, many, context):
+    '''database execute wrapper counting the queries of the request'''
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.add_query(sql, time.perf_counter() - started)
+
+
+class TimedSerializerMixin:
+    '''serializer mixin adding to_representation to the serialize phase'''
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+class Histogram:
+    '''counts of observed values per bucket, with their sum'''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def _labels(**labels):
+    '''return labels in the Prometheus text format'''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+         .replace('\n', '\\n'))
+        for name, value in labels.items())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    '''return value in the Prometheus text format'''
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RequestMetrics:
+    '''in-process histograms of request costs per route and method
+
+    Each worker process keeps its own counts; Prometheus sums them when
+    every worker is scraped, or the lifetime of one worker is reported.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._histograms = {}
+
+    def observe(self, route, method, status, values):
+        '''count a request and add values {histogram name: value}'''
+        with self._lock:
+            key = (route, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for name, _, buckets in HISTOGRAMS:
+                value = values.get(name)
+                if value is None:
+                    continue
+                histogram = self._histograms.get((name, route, method))
+                if histogram is None:
+                    histogram = self._histograms[(name, route, method)] = (
+                        Histogram(buckets))
+                histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._requests.clear()
+            self._histograms.clear()
+
+    def render(self):
+        '''return the metrics in the Prometheus text exposition format'''
+        lines = [
+            '# HELP http_requests_total Requests by route, method and '
+            'status.',
+            '# TYPE http_requests_total counter',
+        ]
+        with self._lock:
+            for (route, method, status), count in sorted(
+                    self._requests.items()):
+                lines.append('http_requests_total' + _labels(
+                    route=route, method=method, status=status) + f' {count}')
+            for name, help_text, buckets in HISTOGRAMS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (histogram_name, route, method), histogram in sorted(
+                        self._histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    bounds = [_number(bound) for bound in buckets] + ['+Inf']
+                    for bound, count in zip(bounds, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket' + _labels(
+                            route=route, method=method, le=bound) +
+                            f' {cumulative}')
+                    labels = _labels(route=route, method=method)
+                    lines.append(
+                        f'{name}_sum{labels} {_number(histogram.sum)}')
+                    lines.append(f'{name}_count{labels} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def render_samples(name, metric_type, help_text, samples):
+    '''return Prometheus text lines of a metric given (labels, value) pairs'''
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+    for labels, value in samples:
+        lines.append(f'{name}{_labels(**labels) if labels else ""} '
+                     f'{_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    '''record the cost of every request in core.metrics.request_metrics
+
+    Wall time, database queries and their time, serializer and render
+    time and response size are recorded per route (the URL name) and
+    method. Requests over the query or latency budget of REQUEST_METRICS
+    are logged with their slowest SQL statement, without its parameters.
+    Queries run while a streaming response is consumed are not counted.
+    Place it first in MIDDLEWARE to include the other middleware.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = metrics.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            record = metrics.stop(token)
+        self.finish(request, response, record)
+        return response
+
+    async def __acall__(self, request):
+        token = metrics.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            record = metrics.stop(token)
+        self.finish(request, response, record)
+        return response
+
+    def process_template_response(self, request, response):
+        '''time the rendering of DRF and template responses'''
+        record = metrics.current()
+        if record is not None:
+            timer = metrics.timed('render')
+            timer.__enter__()
+            response.add_post_render_callback(
+                lambda rendered: timer.__exit__(None, None, None))
+        return response
+
+    def finish(self, request, response, record):
+        '''add the record of request to the metrics; log it if over budget'''
+        seconds = time.perf_counter() - record.started
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        if response.streaming:
+            size = response.get('Content-Length')
+            size = int(size) if size else None
+        else:
+            size = len(response.content)
+        values = {
+            'http_request_duration_seconds': seconds,
+            'http_request_db_queries': record.queries,
+            'http_request_db_duration_seconds': record.db_seconds,
+            'http_request_serialize_duration_seconds':
+                record.phases['serialize'],
+            'http_request_render_duration_seconds': record.phases['render'],
+            'http_response_size_bytes': size,
+        }
+        metrics.request_metrics.observe(
+            route, request.method, response.status_code, values)
+
+        config = settings.REQUEST_METRICS
+        if (record.queries > config['QUERY_BUDGET'] or
+                seconds * 1000 > config['LATENCY_BUDGET_MS']):
+            logger.warning(
+                '%s %s over budget: %.1fms, %d queries in %.1fms; '
+                'slowest query %.1fms: %s', request.method,
+                request.get_full_path(), seconds * 1000, record.queries,
+                record.db_seconds * 1000, record.slowest_seconds * 1000,
+                record.slowest_sql)
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:54
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    '''merge tags and ingredients sharing a (user, name) into the oldest'''
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field_name in (('Tag', 'tags'),
+                                   ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = Recipe._meta.get_field(field_name).remote_field.through
+        column = f'{model_name.lower()}_id'
+        duplicates = model.objects.values('user', 'name').annotate(
+            keep=Min('id'), count=Count('id')).filter(count__gt=1)
+
+        for duplicate in duplicates:
+            keep = duplicate['keep']
+            linked = through.objects.filter(
+                **{column: keep}).values('recipe_id')
+            others = model.objects.filter(
+                user=duplicate['user'], name=duplicate['name']).exclude(
+                id=keep)
+            for other in others:
+                through.objects.filter(**{column: other.id}).exclude(
+                    recipe_id__in=linked).update(**{column: keep})
+                other.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_user_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names,
+                             migrations.RunPython.noop),
+    ]
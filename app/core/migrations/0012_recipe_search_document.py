@@ -0,0 +1,77 @@
+# Generated by Django 4.1.13 on 2026-10-18 19:03
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+import django.db.models.deletion
+
+# the weighted tsvector of a document as of this migration
+VECTOR_WEIGHTS = (('title', 'A'), ('ingredients', 'B'), ('tags', 'C'))
+
+
+def create_vector_index(apps, schema_editor):
+    '''GIN index the tsvector, which only PostgreSQL supports'''
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX core_recipesearchdocument_vector_gin '
+            'ON core_recipesearchdocument USING gin (vector)')
+
+
+def drop_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX core_recipesearchdocument_vector_gin')
+
+
+def build_documents(apps, schema_editor):
+    '''create the search document of every existing recipe'''
+    Recipe = apps.get_model('core', 'Recipe')
+    Document = apps.get_model('core', 'RecipeSearchDocument')
+    names = {}
+    for field_name in ('ingredients', 'tags'):
+        rows = Recipe.objects.filter(
+            **{f'{field_name}__isnull': False}).values_list(
+            'id', f'{field_name}__name').order_by('id', f'{field_name}__name')
+        for recipe_id, name in rows.iterator():
+            names.setdefault((recipe_id, field_name), []).append(name)
+
+    batch = []
+    for recipe_id, title in Recipe.objects.values_list(
+            'id', 'title').iterator():
+        batch.append(Document(
+            recipe_id=recipe_id, title=title,
+            ingredients=' '.join(names.get((recipe_id, 'ingredients'), [])),
+            tags=' '.join(names.get((recipe_id, 'tags'), []))))
+        if len(batch) == 2000:
+            Document.objects.bulk_create(batch)
+            batch = []
+    Document.objects.bulk_create(batch)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        vector = None
+        for column, weight in VECTOR_WEIGHTS:
+            part = SearchVector(column, weight=weight, config='english')
+            vector = part if vector is None else vector + part
+        Document.objects.update(vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_image_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchDocument',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='core.recipe')),
+                ('title', models.TextField(blank=True)),
+                ('ingredients', models.TextField(blank=True)),
+                ('tags', models.TextField(blank=True)),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+        ),
+        migrations.RunPython(create_vector_index, drop_vector_index),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 4.1.13 on 2026-10-18 21:08
+
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_recipes(apps, schema_editor):
+    '''count the existing recipes, as rebuild_recipe_stats would'''
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeStats = apps.get_model('core', 'RecipeStats')
+    StatsCounter = apps.get_model('core', 'RecipeStatsCounter')
+    Snapshot = apps.get_model('core', 'RecipeStatsSnapshot')
+    bounds = settings.RECIPE_STATS['PRICE_BUCKETS']
+    links = {}
+    for field_name in ('tags', 'ingredients'):
+        field = Recipe._meta.get_field(field_name)
+        rows = field.remote_field.through.objects.values_list(
+            field.m2m_field_name() + '_id',
+            field.m2m_reverse_field_name() + '_id').order_by(
+            field.m2m_field_name(), field.m2m_reverse_field_name())
+        for recipe_id, pk in rows.iterator():
+            links.setdefault((recipe_id, field_name), []).append(pk)
+
+    totals = {}
+    counts = Counter()
+    batch = []
+    for pk, user_id, time_minutes, price in Recipe.objects.values_list(
+            'id', 'user_id', 'time_minutes', 'price').iterator():
+        snapshot = Snapshot(
+            recipe_id=pk, user_id=user_id, time_minutes=time_minutes,
+            price_cents=int(price * 100),
+            tags=links.get((pk, 'tags'), []),
+            ingredients=links.get((pk, 'ingredients'), []))
+        stats = totals.setdefault(user_id, RecipeStats(user_id=user_id))
+        stats.recipe_count += 1
+        stats.time_minutes_total += time_minutes
+        stats.price_cents_total += snapshot.price_cents
+        counts[user_id, 'price', bisect_left(bounds, price)] += 1
+        for kind, field_name in (('tag', 'tags'),
+                                 ('ingredient', 'ingredients')):
+            for key in getattr(snapshot, field_name):
+                counts[user_id, kind, key] += 1
+        batch.append(snapshot)
+        if len(batch) == 2000:
+            Snapshot.objects.bulk_create(batch)
+            batch = []
+    Snapshot.objects.bulk_create(batch)
+    RecipeStats.objects.bulk_create(totals.values(), batch_size=2000)
+    StatsCounter.objects.bulk_create([
+        StatsCounter(user_id=user_id, kind=kind, key=key, count=count)
+        for (user_id, kind, key), count in counts.items()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_revoked_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('recipe_count', models.BigIntegerField(default=0)),
+                ('time_minutes_total', models.BigIntegerField(default=0)),
+                ('price_cents_total', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeStatsSnapshot',
+            fields=[
+                ('recipe_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('time_minutes', models.IntegerField()),
+                ('price_cents', models.IntegerField()),
+                ('tags', models.JSONField(default=list)),
+                ('ingredients', models.JSONField(default=list)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeStatsCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('price', 'Price bucket'), ('tag', 'Tag'), ('ingredient', 'Ingredient')], max_length=16)),
+                ('key', models.BigIntegerField()),
+                ('count', models.BigIntegerField()),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipestatscounter',
+            index=models.Index(fields=['user', 'kind', '-count', 'key'], name='core_statscounter_top_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipestatscounter',
+            constraint=models.UniqueConstraint(fields=('user', 'kind', 'key'), name='core_statscounter_key_unique'),
+        ),
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+    ]
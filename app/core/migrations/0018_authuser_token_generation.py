@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 21:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_recipe_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authuser',
+            name='token_generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,10 +1,14 @@
 import uuid
 import os
-from django.db import models
+from django.db import models, transaction
+from django.contrib.postgres.search import SearchVectorField
+from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.models import (
     AbstractBaseUser, PermissionsMixin, BaseUserManager)
 from django.conf import settings
 
+from core.autocomplete import name_index
+
 
 def recipe_image_file_path(instance, filename):
     '''return the correct file path for recipe image upload'''
@@ -43,16 +47,71 @@ class AuthUser(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255, null=False)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # signed tokens carry it; raising it invalidates them all
+    token_generation = models.PositiveIntegerField(default=0)
 
     objects = AuthUserManager()
     USERNAME_FIELD = 'email'
 
+    def set_password(self, raw_password):
+        '''set the password, invalidating the signed tokens of the user'''
+        super().set_password(raw_password)
+        self.token_generation += 1
+
+    def check_password(self, raw_password):
+        '''return True if raw_password is correct
+
+        A hash of an outdated algorithm or cost is upgraded, keeping the
+        signed tokens of the user valid.
+        '''
+        def setter(raw_password):
+            self.password = make_password(raw_password)
+            self.save(update_fields=['password'])
+        return check_password(raw_password, self.password, setter)
+
+
+class UserNameManager(models.Manager):
+    '''manager for models whose name is unique per user'''
+
+    def get_or_create_names(self, user, names):
+        '''return {name: object} for names, creating the missing ones
+
+        Missing rows are created with one insert that skips rows another
+        request created concurrently, then read back with the survivors.
+        '''
+        names = list(dict.fromkeys(names))
+        found = {obj.name: obj
+                 for obj in self.filter(user=user, name__in=names)}
+        missing = [name for name in names if name not in found]
+        if missing:
+            self.bulk_create([self.model(user=user, name=name)
+                              for name in missing], ignore_conflicts=True)
+            created = list(self.filter(user=user, name__in=missing))
+            found.update({obj.name: obj for obj in created})
+            rows = [(obj.pk, obj.name) for obj in created]
+            transaction.on_commit(
+                lambda: name_index.add(self.model, user.pk, rows))
+            # core.versioning imports this module
+            from core import versioning
+            versioning.record(user.pk, self.model._meta.model_name,
+                              [pk for pk, _ in rows])
+        return found
+
 
 class Tag(models.Model):
     '''Recipe tag model'''
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE, related_name='tags')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserNameManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'],
+                                    name='core_tag_user_name_unique'),
+        ]
 
     def __str__(self):
         '''return string representation of tag model'''
@@ -65,6 +124,15 @@ class Ingredient(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE,
                              related_name='ingredients')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserNameManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'],
+                                    name='core_ingredient_user_name_unique'),
+        ]
 
     def __str__(self):
         '''return string representation of ingredient model'''
@@ -73,6 +141,14 @@ class Ingredient(models.Model):
 
 class Recipe(models.Model):
     '''recipe model'''
+
+    class ImageStatus(models.TextChoices):
+        NONE = '', 'No image'
+        PENDING = 'pending', 'Pending'
+        PROCESSING = 'processing', 'Processing'
+        READY = 'ready', 'Ready'
+        FAILED = 'failed', 'Failed'
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE, related_name='recipes')
     title = models.CharField(max_length=255)
@@ -82,7 +158,175 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image_status = models.CharField(max_length=16, blank=True,
+                                    choices=ImageStatus.choices,
+                                    default=ImageStatus.NONE)
+    image_renditions = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'],
+                         name='core_recipe_user_id_idx'),
+        ]
 
     def __str__(self):
         '''return string representation of recipe model'''
         return self.title
+
+
+class CollectionVersion(models.Model):
+    '''per user counter advanced by every write to their collections
+
+    Recipes, tags and ingredients share it, see core.versioning.
+    '''
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                on_delete=models.CASCADE, primary_key=True,
+                                related_name='collection_version')
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+    # changes up to this ChangeLogEntry id were trimmed by compaction
+    sync_horizon = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        '''return string representation of the collection version'''
+        return f'{self.user_id}@{self.version}'
+
+
+class ChangeLogEntry(models.Model):
+    '''a create, update or delete of a recipe, tag or ingredient of a user
+
+    Written by core.versioning. Ids order the changes of each user and
+    serve as sync tokens; deleted entries are tombstones.
+    '''
+
+    class Kind(models.TextChoices):
+        RECIPE = 'recipe', 'Recipe'
+        TAG = 'tag', 'Tag'
+        INGREDIENT = 'ingredient', 'Ingredient'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, db_index=False,
+                             related_name='+')
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'],
+                         name='core_change_user_id_idx'),
+            models.Index(fields=['user', 'kind', 'object_id', 'id'],
+                         name='core_change_object_idx'),
+            models.Index(fields=['created_at'],
+                         name='core_change_created_at_idx'),
+        ]
+
+    def __str__(self):
+        '''return string representation of the change'''
+        action = 'deleted' if self.deleted else 'saved'
+        return f'{self.kind} {self.object_id} {action}'
+
+
+class RevokedToken(models.Model):
+    '''a signed token revoked before it expires, see core.tokens
+
+    Rows are read by every worker into its revocation filter and can be
+    deleted once the token expires.
+    '''
+    token_id = models.CharField(max_length=32, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, related_name='+')
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        '''return string representation of the revoked token'''
+        return self.token_id
+
+
+class RecipeStats(models.Model):
+    '''totals of the recipes of a user, maintained by core.stats'''
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                on_delete=models.CASCADE, primary_key=True,
+                                related_name='recipe_stats')
+    recipe_count = models.BigIntegerField(default=0)
+    time_minutes_total = models.BigIntegerField(default=0)
+    price_cents_total = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        '''return string representation of the recipe stats'''
+        return f'{self.user_id}: {self.recipe_count} recipes'
+
+
+class RecipeStatsCounter(models.Model):
+    '''number of recipes of a user in a price bucket, tag or ingredient
+
+    key is the bucket index in RECIPE_STATS PRICE_BUCKETS, or the id of
+    the tag or ingredient. Rows are deleted when their count drops to 0.
+    '''
+
+    class Kind(models.TextChoices):
+        PRICE = 'price', 'Price bucket'
+        TAG = 'tag', 'Tag'
+        INGREDIENT = 'ingredient', 'Ingredient'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, db_index=False,
+                             related_name='+')
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    key = models.BigIntegerField()
+    count = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'key'],
+                                    name='core_statscounter_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'kind', '-count', 'key'],
+                         name='core_statscounter_top_idx'),
+        ]
+
+    def __str__(self):
+        '''return string representation of the counter'''
+        return f'{self.kind} {self.key}: {self.count}'
+
+
+class RecipeStatsSnapshot(models.Model):
+    '''what a recipe adds to the stats of its user, as last counted
+
+    Not a foreign key: the snapshot of a deleted recipe is read, to
+    subtract it, after the recipe is gone.
+    '''
+    recipe_id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, related_name='+')
+    time_minutes = models.IntegerField()
+    price_cents = models.IntegerField()
+    tags = models.JSONField(default=list)
+    ingredients = models.JSONField(default=list)
+
+    def __str__(self):
+        '''return string representation of the snapshot'''
+        return f'recipe {self.recipe_id}'
+
+
+class RecipeSearchDocument(models.Model):
+    '''denormalised search text of a recipe, maintained by core.search
+
+    On PostgreSQL vector holds the weighted tsvector of the text columns
+    and is GIN indexed; other databases rank the text columns in Python.
+    '''
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='search_document')
+    title = models.TextField(blank=True)
+    ingredients = models.TextField(blank=True)
+    tags = models.TextField(blank=True)
+    vector = SearchVectorField(null=True)
+
+    def __str__(self):
+        '''return string representation of the search document'''
+        return self.title
@@ -0,0 +1,83 @@
+from django.contrib.postgres.search import SearchVector
+from django.db import connections
+
+from core import models
+
+# text search configuration used to build and query the tsvector
+SEARCH_CONFIG = 'english'
+
+# searched columns of RecipeSearchDocument and their tsvector weight
+SEARCH_WEIGHTS = (('title', 'A'), ('ingredients', 'B'), ('tags', 'C'))
+
+
+def uses_tsvector(using='default'):
+    '''return True if the database maintains and queries the tsvector'''
+    return connections[using].vendor == 'postgresql'
+
+
+def document_vector():
+    '''return the weighted tsvector expression of a search document'''
+    vector = None
+    for column, weight in SEARCH_WEIGHTS:
+        part = SearchVector(column, weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def _names(recipe_ids, field_name, using):
+    '''return {recipe id: space separated names linked via field_name}'''
+    field = models.Recipe._meta.get_field(field_name)
+    name = f'{field.m2m_reverse_field_name()}__name'
+    rows = field.remote_field.through.objects.using(using).filter(
+        recipe_id__in=recipe_ids).values_list('recipe_id', name).order_by(
+        'recipe_id', name)
+    names = {}
+    for recipe_id, value in rows:
+        names.setdefault(recipe_id, []).append(value)
+    return {recipe_id: ' '.join(items) for recipe_id, items in names.items()}
+
+
+def refresh_documents(recipe_ids, using='default'):
+    '''rebuild the search documents of recipe_ids with batched queries'''
+    titles = dict(models.Recipe.objects.using(using).filter(
+        pk__in=set(recipe_ids)).values_list('id', 'title'))
+    if not titles:
+        return
+    ingredients = _names(titles, 'ingredients', using)
+    tags = _names(titles, 'tags', using)
+    models.RecipeSearchDocument.objects.using(using).bulk_create([
+        models.RecipeSearchDocument(
+            recipe_id=recipe_id, title=title,
+            ingredients=ingredients.get(recipe_id, ''),
+            tags=tags.get(recipe_id, ''))
+        for recipe_id, title in titles.items()
+    ], update_conflicts=True, unique_fields=['recipe'],
+        update_fields=['title', 'ingredients', 'tags'])
+    if uses_tsvector(using):
+        models.RecipeSearchDocument.objects.using(using).filter(
+            pk__in=titles).update(vector=document_vector())
+
+
+def rebuild_documents(batch_size=2000, using='default'):
+    '''refresh the search document of every recipe; return the count'''
+    ids = models.Recipe.objects.using(using).order_by('id').values_list(
+        'id', flat=True)
+    count = 0
+    batch = []
+    for recipe_id in ids.iterator(chunk_size=batch_size):
+        batch.append(recipe_id)
+        if len(batch) == batch_size:
+            refresh_documents(batch, using)
+            count += len(batch)
+            batch = []
+    refresh_documents(batch, using)
+    return count + len(batch)
+
+
+def linked_recipe_ids(instance):
+    '''return the ids of the recipes linked to a tag or ingredient'''
+    field_name = f'{instance._meta.model_name}s'
+    through = models.Recipe._meta.get_field(field_name).remote_field.through
+    return list(through.objects.filter(
+        **{instance._meta.model_name: instance}).values_list(
+        'recipe_id', flat=True))
@@ -0,0 +1,73 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+from core import models, search, stats
+
+SEED_PASSWORD = 'seedPass123'
+
+
+def _bulk_create(model, objs, batch_size):
+    '''bulk insert objs and return them with their primary keys set'''
+    return model.objects.bulk_create(objs, batch_size=batch_size)
+
+
+def seed_recipes(users=1, recipes_per_user=100, ingredients_per_recipe=5,
+                 tags_per_recipe=3, ingredient_pool=50, tag_pool=20,
+                 email_prefix='seed', seed=0, batch_size=2000,
+                 title_words=None):
+    '''create users owning recipes, ingredients and tags; return the users
+
+    Rows are written with bulk inserts only, so large datasets can be
+    seeded quickly for benchmarks. Every user shares SEED_PASSWORD. With
+    title_words, titles are three random words of it instead of a number.
+    '''
+    rng = random.Random(seed)
+    password = make_password(SEED_PASSWORD)
+    created = _bulk_create(get_user_model(), [
+        get_user_model()(email=f'{email_prefix}{n}@example.com',
+                         name=f'Seed User {n}', password=password)
+        for n in range(users)
+    ], batch_size)
+
+    recipe_ingredients = models.Recipe.ingredients.through
+    recipe_tags = models.Recipe.tags.through
+    for user in created:
+        ingredients = _bulk_create(models.Ingredient, [
+            models.Ingredient(user=user, name=f'ingredient {n}')
+            for n in range(ingredient_pool)
+        ], batch_size)
+        tags = _bulk_create(models.Tag, [
+            models.Tag(user=user, name=f'tag {n}') for n in range(tag_pool)
+        ], batch_size)
+
+        for start in range(0, recipes_per_user, batch_size):
+            count = min(batch_size, recipes_per_user - start)
+            recipes = _bulk_create(models.Recipe, [
+                models.Recipe(
+                    user=user,
+                    title=(' '.join(rng.sample(title_words, 3))
+                           if title_words else f'recipe {start + n}'),
+                    time_minutes=rng.randint(5, 240),
+                    price=Decimal(rng.randint(100, 99999)) / 100,
+                )
+                for n in range(count)
+            ], batch_size)
+            _bulk_create(recipe_ingredients, [
+                recipe_ingredients(recipe_id=recipe.id, ingredient_id=item.id)
+                for recipe in recipes
+                for item in rng.sample(
+                    ingredients, min(ingredients_per_recipe, ingredient_pool))
+            ], batch_size)
+            _bulk_create(recipe_tags, [
+                recipe_tags(recipe_id=recipe.id, tag_id=item.id)
+                for recipe in recipes
+                for item in rng.sample(tags, min(tags_per_recipe, tag_pool))
+            ], batch_size)
+            recipe_ids = [recipe.id for recipe in recipes]
+            search.refresh_documents(recipe_ids)
+            stats.refresh(user.id, recipe_ids)
+
+    return created
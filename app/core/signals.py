@@ -0,0 +1,136 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core import metrics, models, search, versioning
+from core.autocomplete import name_index
+from core.authentication import token_cache, user_cache_key
+
+# change log kinds are the model names of recipes, tags and ingredients
+Kind = models.ChangeLogEntry.Kind
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    '''count the queries of every connection in the request metrics'''
+    # first in the list: execute_wrapper() blocks pop the last wrapper
+    if metrics.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, metrics.record_query)
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    '''stop authenticating with a deleted token'''
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_saved_user_tokens(sender, instance, created, **kwargs):
+    '''drop cached copies of a user that was deactivated or changed'''
+    if created:
+        return
+    token_cache.delete(user_cache_key(instance.pk), *Token.objects.filter(
+        user_id=instance.pk).values_list('key', flat=True))
+
+
+@receiver(post_delete, sender=get_user_model())
+def evict_deleted_user(sender, instance, **kwargs):
+    '''stop authenticating the signed tokens of a deleted user'''
+    token_cache.delete(user_cache_key(instance.pk))
+
+
+def deleted_with_owner(origin):
+    '''return True if a delete cascades from deleting the owning user'''
+    if isinstance(origin, QuerySet):
+        return issubclass(origin.model, get_user_model())
+    return isinstance(origin, get_user_model())
+
+
+@receiver(post_save, sender=models.Recipe)
+def recipe_saved(sender, instance, update_fields, **kwargs):
+    '''refresh the search document and version of a saved recipe'''
+    if update_fields is None or 'title' in update_fields:
+        versioning.refresh_recipes([instance.pk])
+    versioning.record(instance.user_id, Kind.RECIPE, [instance.pk])
+
+
+@receiver(post_delete, sender=models.Recipe)
+def recipe_deleted(sender, instance, origin, **kwargs):
+    '''log the deletion of a recipe, unless its owner is deleted'''
+    if not deleted_with_owner(origin):
+        versioning.record(instance.user_id, Kind.RECIPE, [instance.pk],
+                          deleted=True)
+
+
+@receiver(m2m_changed, sender=models.Recipe.tags.through)
+@receiver(m2m_changed, sender=models.Recipe.ingredients.through)
+def recipe_links_changed(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    '''refresh the recipes whose tags or ingredients changed'''
+    if action == 'pre_clear' and reverse:
+        instance._linked_recipe_ids = search.linked_recipe_ids(instance)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            recipe_ids = [instance.pk]
+        elif action == 'post_clear':
+            recipe_ids = instance.__dict__.pop('_linked_recipe_ids', [])
+        else:
+            recipe_ids = pk_set
+        versioning.refresh_recipes(recipe_ids, touch=True)
+        versioning.record(instance.user_id, Kind.RECIPE, recipe_ids)
+
+
+@receiver(post_save, sender=models.Tag)
+@receiver(post_save, sender=models.Ingredient)
+def index_saved_name(sender, instance, **kwargs):
+    '''add a created or renamed tag or ingredient to autocomplete'''
+    rows = [(instance.pk, instance.name)]
+    transaction.on_commit(lambda: name_index.add(
+        sender, instance.user_id, rows))
+
+
+@receiver(post_delete, sender=models.Tag)
+@receiver(post_delete, sender=models.Ingredient)
+def unindex_deleted_name(sender, instance, **kwargs):
+    '''drop a deleted tag or ingredient from autocomplete'''
+    pk = instance.pk
+    transaction.on_commit(lambda: name_index.remove(
+        sender, instance.user_id, pk))
+
+
+@receiver(post_save, sender=models.Tag)
+@receiver(post_save, sender=models.Ingredient)
+def name_saved(sender, instance, created, **kwargs):
+    '''refresh the recipes using a renamed tag or ingredient'''
+    if not created:
+        recipe_ids = search.linked_recipe_ids(instance)
+        versioning.refresh_recipes(recipe_ids, touch=True)
+    versioning.record(instance.user_id, Kind(sender._meta.model_name),
+                      [instance.pk])
+
+
+@receiver(pre_delete, sender=models.Tag)
+@receiver(pre_delete, sender=models.Ingredient)
+def collect_deleted_name_recipes(sender, instance, origin, **kwargs):
+    '''remember the recipes of a tag or ingredient about to be deleted'''
+    if not deleted_with_owner(origin):
+        instance._linked_recipe_ids = search.linked_recipe_ids(instance)
+
+
+@receiver(post_delete, sender=models.Tag)
+@receiver(post_delete, sender=models.Ingredient)
+def name_deleted(sender, instance, origin, **kwargs):
+    '''refresh the recipes that used a deleted tag or ingredient'''
+    if deleted_with_owner(origin):
+        return
+    recipe_ids = instance.__dict__.pop('_linked_recipe_ids', [])
+    with versioning.deferred():
+        versioning.refresh_recipes(recipe_ids, touch=True)
+        versioning.record(instance.user_id, Kind(sender._meta.model_name),
+                          [instance.pk], deleted=True)
+        versioning.record(instance.user_id, Kind.RECIPE, recipe_ids)
@@ -0,0 +1,277 @@
+from bisect import bisect_left
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+
+from core import models
+
+Kind = models.RecipeStatsCounter.Kind
+
+# RecipeStats columns summed over the recipes of a user
+TOTALS = ('recipe_count', 'time_minutes_total', 'price_cents_total')
+
+
+def price_bucket(price):
+    '''return the index of the RECIPE_STATS PRICE_BUCKETS bucket of price
+
+    Bucket n holds the prices up to its bound; the last one holds the
+    prices above every bound.
+    '''
+    return bisect_left(settings.RECIPE_STATS['PRICE_BUCKETS'], price)
+
+
+def _links(recipe_ids, field_name):
+    '''return {recipe id: sorted ids linked via field_name}'''
+    field = models.Recipe._meta.get_field(field_name)
+    rows = field.remote_field.through.objects.filter(
+        recipe_id__in=recipe_ids).values_list(
+        'recipe_id', field.m2m_reverse_name())
+    links = {}
+    for recipe_id, pk in rows:
+        links.setdefault(recipe_id, []).append(pk)
+    return {recipe_id: sorted(pks) for recipe_id, pks in links.items()}
+
+
+def snapshots(recipes):
+    '''return unsaved RecipeStatsSnapshots of the recipes, a queryset'''
+    rows = list(recipes.values_list('id', 'user_id', 'time_minutes',
+                                    'price'))
+    recipe_ids = [row[0] for row in rows]
+    tags = _links(recipe_ids, 'tags') if rows else {}
+    ingredients = _links(recipe_ids, 'ingredients') if rows else {}
+    return [
+        models.RecipeStatsSnapshot(
+            recipe_id=pk, user_id=user_id, time_minutes=time_minutes,
+            price_cents=int(price * 100), tags=tags.get(pk, []),
+            ingredients=ingredients.get(pk, []))
+        for pk, user_id, time_minutes, price in rows
+    ]
+
+
+def _count(snapshots, sign, totals, counts):
+    '''add sign times the contribution of snapshots to totals and counts'''
+    for snapshot in snapshots:
+        totals['recipe_count'] += sign
+        totals['time_minutes_total'] += sign * snapshot.time_minutes
+        totals['price_cents_total'] += sign * snapshot.price_cents
+        counts[Kind.PRICE, price_bucket(
+            Decimal(snapshot.price_cents) / 100)] += sign
+        for pk in snapshot.tags:
+            counts[Kind.TAG, pk] += sign
+        for pk in snapshot.ingredients:
+            counts[Kind.INGREDIENT, pk] += sign
+
+
+def refresh(user_id, recipe_ids):
+    '''bring the stats of user_id up to date with its recipes recipe_ids
+
+    The last counted contribution of each recipe, its snapshot, is
+    subtracted and the current one added, so the cost is in the changed
+    recipes, not in the collection. Deleted recipes only subtract. Called
+    by core.versioning while the version row of user_id is locked, which
+    keeps concurrent writes of the user from interleaving here.
+    '''
+    recipe_ids = set(recipe_ids)
+    old = list(models.RecipeStatsSnapshot.objects.filter(
+        user_id=user_id, recipe_id__in=recipe_ids))
+    new = snapshots(models.Recipe.objects.filter(
+        user_id=user_id, pk__in=recipe_ids))
+    totals = Counter()
+    counts = Counter()
+    _count(old, -1, totals, counts)
+    _count(new, 1, totals, counts)
+
+    with transaction.atomic(savepoint=False):
+        _add_totals(user_id, totals)
+        _add_counts(user_id, counts)
+        gone = recipe_ids.difference(snapshot.recipe_id for snapshot in new)
+        if gone and old:
+            models.RecipeStatsSnapshot.objects.filter(
+                recipe_id__in=gone).delete()
+        if new:
+            models.RecipeStatsSnapshot.objects.bulk_create(
+                new, update_conflicts=True, unique_fields=['recipe_id'],
+                update_fields=['time_minutes', 'price_cents', 'tags',
+                               'ingredients'])
+
+
+def _add_totals(user_id, totals):
+    '''add totals, {RecipeStats column: change}, to the row of user_id'''
+    if not any(totals.values()):
+        return
+    current = models.RecipeStats.objects.filter(user_id=user_id).values(
+        *TOTALS).first() or dict.fromkeys(TOTALS, 0)
+    models.RecipeStats.objects.bulk_create([models.RecipeStats(
+        user_id=user_id, **{name: current[name] + totals[name]
+                            for name in TOTALS})],
+        update_conflicts=True, unique_fields=['user'],
+        update_fields=list(TOTALS))
+
+
+def _add_counts(user_id, counts):
+    '''add counts, {(kind, key): change}, to the counters of user_id'''
+    counts = {key: change for key, change in counts.items() if change}
+    if not counts:
+        return
+    counters = models.RecipeStatsCounter.objects.filter(user_id=user_id)
+    current = {
+        (kind, key): count for kind, key, count in counters.filter(
+            kind__in={kind for kind, _ in counts},
+            key__in={key for _, key in counts}).values_list(
+            'kind', 'key', 'count')
+        if (kind, key) in counts}
+    rows = []
+    emptied = Q(pk__in=[])
+    for (kind, key), change in counts.items():
+        count = current.get((kind, key), 0) + change
+        if count > 0:
+            rows.append(models.RecipeStatsCounter(
+                user_id=user_id, kind=kind, key=key, count=count))
+        elif (kind, key) in current:
+            emptied |= Q(kind=kind, key=key)
+    if rows:
+        models.RecipeStatsCounter.objects.bulk_create(
+            rows, update_conflicts=True,
+            unique_fields=['user', 'kind', 'key'], update_fields=['count'])
+    if len(rows) < len(counts):
+        counters.filter(emptied).delete()
+
+
+def _price(cents):
+    '''return cents as a price string with two decimal places'''
+    return str((Decimal(cents) / 100).quantize(Decimal('0.01')))
+
+
+def get_stats(user_id, top):
+    '''return the stats of user_id with its top tags and ingredients
+
+    Reads the summary row, the price buckets and top rows of each
+    counter kind, whatever the number of recipes.
+    '''
+    totals = models.RecipeStats.objects.filter(user_id=user_id).values(
+        *TOTALS).first() or dict.fromkeys(TOTALS, 0)
+    counters = models.RecipeStatsCounter.objects.filter(user_id=user_id)
+    buckets = dict(counters.filter(kind=Kind.PRICE).values_list(
+        'key', 'count'))
+    bounds = settings.RECIPE_STATS['PRICE_BUCKETS']
+    recipes = totals['recipe_count']
+    minutes = totals['time_minutes_total']
+    cents = totals['price_cents_total']
+
+    def most_used(kind, model):
+        names = model.objects.filter(pk=OuterRef('key')).values('name')
+        return [
+            {'id': key, 'name': name, 'recipes': count}
+            for key, name, count in counters.filter(kind=kind).annotate(
+                name=Subquery(names)).order_by('-count', 'key').values_list(
+                'key', 'name', 'count')[:top]
+        ]
+
+    return {
+        'recipes': recipes,
+        'time_minutes': {
+            'total': minutes,
+            'average': round(minutes / recipes, 2) if recipes else None,
+        },
+        'price': {
+            'total': _price(cents),
+            'average': _price(Decimal(cents) / recipes) if recipes else None,
+            'buckets': [
+                {'up_to': bound, 'recipes': buckets.get(index, 0)}
+                for index, bound in enumerate([*bounds, None])
+            ],
+        },
+        'tags': most_used(Kind.TAG, models.Tag),
+        'ingredients': most_used(Kind.INGREDIENT, models.Ingredient),
+    }
+
+
+def _stats_user_ids():
+    '''return the ids of the users with recipes or stats rows'''
+    user_ids = set(models.Recipe.objects.values_list(
+        'user_id', flat=True).distinct())
+    for model in (models.RecipeStats, models.RecipeStatsCounter,
+                  models.RecipeStatsSnapshot):
+        user_ids.update(model.objects.values_list(
+            'user_id', flat=True).distinct())
+    return user_ids
+
+
+def _expected(user_ids, batch_size):
+    '''yield (user id, totals, counts, snapshots) counted from scratch'''
+    for user_id in sorted(user_ids):
+        totals = Counter(dict.fromkeys(TOTALS, 0))
+        counts = Counter()
+        found = []
+        ids = list(models.Recipe.objects.filter(user_id=user_id).order_by(
+            'id').values_list('id', flat=True))
+        for start in range(0, len(ids), batch_size):
+            batch = snapshots(models.Recipe.objects.filter(
+                pk__in=ids[start:start + batch_size]))
+            _count(batch, 1, totals, counts)
+            found.extend(batch)
+        yield user_id, totals, counts, found
+
+
+def drift(user_ids=None, batch_size=2000):
+    '''return {user id: [description]} of the stats that are off
+
+    The stats of user_ids, or of every user with recipes or stats, are
+    compared with counts from scratch.
+    '''
+    if user_ids is None:
+        user_ids = _stats_user_ids()
+    problems = {}
+    for user_id, totals, counts, _ in _expected(user_ids, batch_size):
+        found = []
+        stored = models.RecipeStats.objects.filter(user_id=user_id).values(
+            *TOTALS).first() or dict.fromkeys(TOTALS, 0)
+        for name in TOTALS:
+            if stored[name] != totals[name]:
+                found.append(
+                    f'{name} is {stored[name]}, expected {totals[name]}')
+        stored_counts = {
+            (kind, key): count for kind, key, count in
+            models.RecipeStatsCounter.objects.filter(
+                user_id=user_id).values_list('kind', 'key', 'count')}
+        for kind, key in sorted(set(stored_counts).union(counts)):
+            count = stored_counts.get((kind, key), 0)
+            if count != counts[kind, key]:
+                found.append(f'{kind} {key} count is {count}, expected '
+                             f'{counts[kind, key]}')
+        if found:
+            problems[user_id] = found
+    return problems
+
+
+def rebuild(user_ids=None, batch_size=2000):
+    '''recount the stats of user_ids, or of everyone; return the count
+
+    Each user is rebuilt in one transaction holding its version row, as
+    writes do, so that concurrent writes wait instead of being lost.
+    '''
+    if user_ids is None:
+        user_ids = _stats_user_ids()
+    rebuilt = 0
+    for user_id, totals, counts, found in _expected(user_ids, batch_size):
+        with transaction.atomic():
+            list(models.CollectionVersion.objects.select_for_update().filter(
+                user_id=user_id))
+            models.RecipeStats.objects.update_or_create(
+                user_id=user_id, defaults=dict(totals))
+            models.RecipeStatsCounter.objects.filter(
+                user_id=user_id).delete()
+            models.RecipeStatsCounter.objects.bulk_create([
+                models.RecipeStatsCounter(
+                    user_id=user_id, kind=kind, key=key, count=count)
+                for (kind, key), count in counts.items() if count > 0
+            ], batch_size=batch_size)
+            models.RecipeStatsSnapshot.objects.filter(
+                user_id=user_id).delete()
+            models.RecipeStatsSnapshot.objects.bulk_create(
+                found, batch_size=batch_size)
+        rebuilt += 1
+    return rebuilt
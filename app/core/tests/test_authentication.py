@@ -0,0 +1,134 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import tokens
+from core.authentication import TokenUserCache, token_cache
+
+ME_URL = reverse('user:me')
+
+
+def create_sample_user(email='test@domain.com', password='testPass'):
+    '''create and return a test user'''
+    return get_user_model().objects.create_user(email, password)
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    '''test suite for the cached token authentication backend'''
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = create_sample_user()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_is_cached(self):
+        '''test that a repeated token does not hit the database'''
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+
+    def test_deleted_token_is_evicted(self):
+        '''test that a deleted token stops authenticating'''
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_evicted(self):
+        '''test that a deactivated user stops authenticating'''
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_evicts_user(self):
+        '''test that updating the password drops the cached user'''
+        self.client.get(ME_URL)
+        self.client.patch(ME_URL, {'password': 'newPass'})
+
+        self.assertIsNone(token_cache.get(self.token.key))
+
+
+class TokenUserCacheTest(TestCase):
+    '''test suite for the token -> user cache'''
+
+    def setUp(self):
+        self.user = create_sample_user()
+
+    def test_least_recently_used_entry_is_evicted(self):
+        '''test that the cache keeps at most max_size entries'''
+        cache = TokenUserCache(max_size=2)
+        cache.set('a', self.user)
+        cache.set('b', self.user)
+        cache.get('a')
+        cache.set('c', self.user)
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_expired_entry_is_a_miss(self):
+        '''test that entries are dropped after their ttl'''
+        cache = TokenUserCache(ttl=0)
+        cache.set('a', self.user)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_shared_tier(self):
+        '''test that entries evicted locally are found in the shared cache'''
+        cache = TokenUserCache(max_size=1, shared_alias='default')
+        cache.set('a', self.user)
+        cache.set('b', self.user)
+
+        self.assertEqual(cache.get('a').email, self.user.email)
+        self.assertEqual(cache.stats()['shared_hits'], 1)
+
+        cache.delete('a', 'b')
+        self.assertIsNone(cache.get('a'))
+
+    def test_shared_tier_leaves_out_the_password(self):
+        '''test that the shared cache never holds the password hash'''
+        cache = TokenUserCache(max_size=1, shared_alias='default')
+        cache.set('a', self.user)
+        cache.set('b', self.user)
+
+        entry = cache.shared.get(cache.key_prefix + 'a')
+        self.assertNotIn('password', entry[0])
+        self.assertNotIn(self.user.password, entry[1])
+        user = cache.get('a')
+        self.assertTrue(tokens.issue(self.user).matches(user))
+        user.name = 'Renamed'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Renamed')
+        self.assertTrue(self.user.check_password('testPass'))
+
+    async def test_async_shared_tier(self):
+        '''test that aget and aset use both tiers like get and set'''
+        cache = TokenUserCache(max_size=1, shared_alias='default')
+        await cache.aset('a', self.user)
+        await cache.aset('b', self.user)
+
+        self.assertEqual((await cache.aget('a')).email, self.user.email)
+        self.assertEqual((await cache.aget('a')).email, self.user.email)
+        self.assertIsNone(await cache.aget('c'))
+        self.assertEqual(cache.stats(), {
+            'hits': 1, 'shared_hits': 1, 'misses': 1, 'size': 1})
@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from core import models
+from core.autocomplete import (
+    NameIndex, NameIndexCache, has_trigram_extension)
+
+
+class NameIndexTest(TestCase):
+    '''test suite for the in-memory name index'''
+
+    def setUp(self):
+        self.index = NameIndex([(1, 'Tomato'), (2, 'Tofu'), (3, 'Basil')])
+
+    def test_search(self):
+        '''test prefix matches followed by similar names'''
+        self.assertEqual(self.index.search('to', 10), [(2, 'Tofu'),
+                                                       (1, 'Tomato')])
+        self.assertEqual(self.index.search('pesto', 10), [])
+        self.assertEqual(self.index.search('basill', 10), [(3, 'Basil')])
+
+    def test_rename_and_remove(self):
+        '''test that renamed and removed names are reindexed'''
+        self.index.add([(2, 'Tempeh')])
+        self.index.remove(1)
+
+        self.assertEqual(self.index.search('t', 10), [(2, 'Tempeh')])
+        self.assertEqual(len(self.index), 2)
+
+
+class NameIndexCacheTest(TestCase):
+    '''test suite for the per user name index cache'''
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@domain.com', 'testPass')
+        for name in ('Tomato', 'Tofu', 'Toast'):
+            models.Tag.objects.create(user=self.user, name=name)
+
+    def test_index_built_once(self):
+        '''test that the index is loaded with one query and then reused'''
+        cache = NameIndexCache()
+        with self.assertNumQueries(1 + (connection.vendor == 'postgresql')):
+            cache.search(models.Tag, self.user.pk, 'to', 2)
+
+        with self.assertNumQueries(0):
+            tags = cache.search(models.Tag, self.user.pk, 'to', 2)
+
+        self.assertEqual([tag.name for tag in tags], ['Toast', 'Tofu'])
+
+    def test_least_recently_used_user_is_dropped(self):
+        '''test that the cache keeps at most max_users indexes'''
+        cache = NameIndexCache(max_users=1)
+        cache.get(models.Tag, self.user.pk)
+        cache.get(models.Ingredient, self.user.pk)
+
+        cache.add(models.Tag, self.user.pk, [(0, 'Torte')])
+
+        self.assertNotIn('Torte', [
+            tag.name for tag in cache.search(models.Tag, self.user.pk,
+                                             'to', 5)])
+
+    def test_large_users_are_searched_in_the_database(self):
+        '''test the pg_trgm path used above db_threshold'''
+        if not has_trigram_extension():
+            self.skipTest('requires pg_trgm')
+        cache = NameIndexCache(db_threshold=2)
+
+        self.assertIsNone(cache.get(models.Tag, self.user.pk))
+        tags = cache.search(models.Tag, self.user.pk, 'to', 2)
+        self.assertEqual([tag.name for tag in tags], ['Toast', 'Tofu'])
+        tags = cache.search(models.Tag, self.user.pk, 'tomatoe', 2)
+        self.assertEqual([tag.name for tag in tags], ['Tomato'])
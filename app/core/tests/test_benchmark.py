@@ -0,0 +1,38 @@
+from django.test import SimpleTestCase
+
+from core import benchmark
+
+
+class BenchmarkTest(SimpleTestCase):
+    '''test suite for the api benchmark scenarios and comparison'''
+
+    def test_scenarios_cover_every_route(self):
+        '''test that every api route and method has a scenario'''
+        routes = benchmark.api_routes()
+
+        self.assertIn(('recipe:recipe-bulk-create', 'DELETE'), routes)
+        self.assertIn(('recipe:async-tag-list', 'GET'), routes)
+        self.assertIn(('user:me', 'PATCH'), routes)
+        self.assertNotIn(('user:me', 'OPTIONS'), routes)
+        self.assertEqual(benchmark.missing_routes(), set())
+
+    def test_compare_thresholds(self):
+        '''test that only growth above the thresholds is a regression'''
+        baseline = {
+            'a': {'p50': 10.0, 'p95': 20.0, 'queries': 4, 'peak_kib': 100},
+            'b': {'p50': 1.0, 'p95': 1.0, 'queries': 2, 'peak_kib': 100},
+        }
+        results = {
+            'a': {'p50': 12.0, 'p95': 30.0, 'queries': 5, 'peak_kib': 120},
+            'b': {'p50': 2.5, 'p95': 1.0, 'queries': 2, 'peak_kib': 200},
+            'new': {'p50': 99.0, 'p95': 99.0, 'queries': 9},
+        }
+
+        regressions = benchmark.compare(baseline, results, threshold=0.25,
+                                        min_delta_ms=2.0)
+
+        self.assertEqual(regressions, [
+            'a: p95 20.0 -> 30.0',
+            'a: queries 4 -> 5',
+            'b: peak_kib 100 -> 200',
+        ])
@@ -1,8 +1,18 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from unittest.mock import patch
 
+from core import benchmark, models
+from core.seed import seed_recipes
+
 
 class CommandTest(TestCase):
 
@@ -21,3 +31,80 @@ class CommandTest(TestCase):
             call_command('wait_for_db')
 
             self.assertEqual(gi.call_count, 6)
+
+    def test_rebuild_search_documents(self):
+        '''test that every recipe gets a search document'''
+        user = seed_recipes(recipes_per_user=3)[0]
+        models.RecipeSearchDocument.objects.all().delete()
+        out = StringIO()
+
+        call_command('rebuild_search_documents', stdout=out)
+
+        self.assertIn('Rebuilt 3 search documents.', out.getvalue())
+        self.assertEqual(models.RecipeSearchDocument.objects.filter(
+            recipe__user=user).count(), 3)
+
+
+@override_settings(RECIPE_IMAGE_WORKERS=0)
+class BenchmarkApiCommandTest(TransactionTestCase):
+    '''test suite for the api benchmark command'''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'baseline.json')
+
+    def test_benchmark_api_saves_baseline(self):
+        '''test that every scenario runs in both modes and is saved'''
+        out = StringIO()
+        call_command('benchmark_api', recipes=3, iterations=1, warmup=0,
+                     baseline=self.path, save_baseline=True, stdout=out)
+
+        with open(self.path) as baseline_file:
+            results = json.load(baseline_file)['results']
+        self.assertEqual(len(results), 2 * len(benchmark.SCENARIOS))
+        detail = results['in-process GET recipe:recipe-detail']
+        self.assertGreater(detail['queries'], 0)
+        self.assertGreater(detail['peak_kib'], 0)
+        self.assertNotIn('queries', results['http GET recipe:recipe-detail'])
+        self.assertIn('Saved 72 results', out.getvalue())
+        self.assertFalse(get_user_model().objects.exists())
+        self.assertFalse(models.Recipe.objects.exists())
+
+    def test_benchmark_api_fails_on_regression(self):
+        '''test that a run doing more queries than the baseline fails'''
+        key = 'in-process GET recipe:recipe-detail'
+        with open(self.path, 'w') as baseline_file:
+            json.dump({'results': {key: {'p50': 1000, 'p95': 1000,
+                                         'queries': 1}}}, baseline_file)
+
+        with self.assertRaisesMessage(CommandError, '1 regressions'):
+            call_command('benchmark_api', recipes=3, iterations=1,
+                         warmup=0, mode='in-process',
+                         only='GET recipe:recipe-detail',
+                         baseline=self.path, stdout=StringIO(),
+                         stderr=StringIO())
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class BenchmarkLoginsCommandTest(TransactionTestCase):
+    '''test suite for the login and throttle benchmark commands'''
+
+    def test_benchmark_logins(self):
+        '''test that logins are timed and the users deleted'''
+        out = StringIO()
+        call_command('benchmark_logins', logins=3, threads=2,
+                     only='scrypt-n14', stdout=out)
+
+        self.assertIn('scrypt-n14', out.getvalue())
+        self.assertIn('logins/s', out.getvalue())
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_benchmark_throttles(self):
+        '''test that the throttle overhead is reported per backend'''
+        out = StringIO()
+        call_command('benchmark_throttles', requests=20, clients=5,
+                     cache=['default'], stdout=out)
+
+        self.assertIn('in-process', out.getvalue())
+        self.assertIn('cache:default', out.getvalue())
@@ -0,0 +1,47 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    check_password, identify_hasher, make_password)
+from django.test import SimpleTestCase, override_settings
+
+from core import hashers
+
+
+def hashing(**costs):
+    '''return override_settings of the PASSWORD_HASHING costs'''
+    return override_settings(
+        PASSWORD_HASHING={**settings.PASSWORD_HASHING, **costs})
+
+
+class HasherTest(SimpleTestCase):
+    '''test suite for the tunable password hashers'''
+
+    def test_configured_work_factor(self):
+        '''test that new hashes use the configured scrypt work factor'''
+        with hashing(SCRYPT_WORK_FACTOR=2 ** 10):
+            encoded = make_password('testPass')
+
+        self.assertTrue(encoded.startswith('scrypt$1024$'))
+        self.assertTrue(check_password('testPass', encoded))
+        self.assertTrue(identify_hasher(encoded).must_update(encoded))
+
+    def test_preferred_algorithm(self):
+        '''test that hasher_paths puts the configured algorithm first'''
+        with override_settings(
+                PASSWORD_HASHERS=hashers.hasher_paths('pbkdf2')):
+            with hashing(PBKDF2_ITERATIONS=1000):
+                encoded = make_password('testPass')
+
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(check_password('testPass', encoded))
+
+    def test_hashing_runs_on_pool(self):
+        '''test that hashes run on the pool unless WORKERS is 0'''
+        with hashing(WORKERS=1):
+            pooled = hashers.run(threading.current_thread)
+        with hashing(WORKERS=0):
+            inline = hashers.run(threading.current_thread)
+
+        self.assertTrue(pooled.name.startswith('password-hash'))
+        self.assertIs(inline, threading.current_thread())
@@ -0,0 +1,135 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Recipe, Tag
+
+METRICS_URL = reverse('metrics')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+CONFIG = {'TOKEN': 'scrape', 'QUERY_BUDGET': 50, 'LATENCY_BUDGET_MS': 1000}
+
+
+def sample(text, name, **labels):
+    '''return the value of the sample name{labels} in Prometheus text'''
+    label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    series = name + (f'{{{label_text}}}' if labels else '')
+    match = re.search(rf'^{re.escape(series)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+@override_settings(REQUEST_METRICS=CONFIG)
+class RequestMetricsTest(TestCase):
+    '''test suite for the request metrics middleware and endpoint'''
+
+    def setUp(self):
+        metrics.request_metrics.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@domain.com', 'testPass')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.scraper = Client()
+
+    def scrape(self):
+        res = self.scraper.get(METRICS_URL,
+                               HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        return res.content.decode()
+
+    def test_request_is_recorded(self):
+        '''test that queries, timings and size are recorded per route'''
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = Recipe.objects.create(user=self.user, title='Soup',
+                                       time_minutes=5, price=1)
+        recipe.tags.add(tag)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL)
+        query_count = len(queries)
+        text = self.scrape()
+
+        labels = {'route': 'recipe:recipe-list', 'method': 'GET'}
+        self.assertEqual(sample(text, 'http_requests_total', **labels,
+                                status=200), 1)
+        self.assertEqual(sample(text, 'http_request_db_queries_sum',
+                                **labels), query_count)
+        self.assertGreater(sample(
+            text, 'http_request_serialize_duration_seconds_sum', **labels), 0)
+        self.assertGreater(sample(
+            text, 'http_request_render_duration_seconds_sum', **labels), 0)
+        self.assertEqual(sample(text, 'http_response_size_bytes_sum',
+                                **labels), len(res.content))
+        self.assertEqual(sample(
+            text, 'http_request_duration_seconds_bucket', **labels,
+            le='+Inf'), 1)
+        self.assertIsNotNone(sample(text, 'token_cache_misses_total'))
+
+    def test_metrics_need_token(self):
+        '''test that the endpoint needs the configured bearer token'''
+        res = self.scraper.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer no')
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        with override_settings(REQUEST_METRICS={**CONFIG, 'TOKEN': None}):
+            res = self.scraper.get(METRICS_URL,
+                                   HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_request_over_budget_is_logged(self):
+        '''test that a request over the query budget logs its slowest SQL'''
+        with override_settings(REQUEST_METRICS={**CONFIG,
+                                                'QUERY_BUDGET': 0}):
+            with self.assertLogs('core.middleware', 'WARNING') as logs:
+                self.client.get(RECIPES_URL)
+
+        self.assertIn(f'GET {RECIPES_URL} over budget', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    async def test_async_request_is_recorded(self):
+        '''test that async views are recorded with their queries'''
+        client = AsyncClient()
+        await client.get(reverse('recipe:async-tag-list'),
+                         AUTHORIZATION=f'Token {self.token.key}')
+
+        text = metrics.request_metrics.render()
+        labels = {'route': 'recipe:async-tag-list', 'method': 'GET'}
+        self.assertEqual(sample(text, 'http_requests_total', **labels,
+                                status=200), 1)
+        self.assertGreater(sample(text, 'http_request_db_queries_sum',
+                                  **labels), 0)
+
+
+class HistogramTest(TestCase):
+    '''test suite for the Prometheus histogram rendering'''
+
+    def test_buckets_are_cumulative(self):
+        '''test that buckets count values up to and including le'''
+        registry = metrics.RequestMetrics()
+        for queries in (0, 1, 3, 1000):
+            registry.observe('r', 'GET', 200,
+                             {'http_request_db_queries': queries})
+
+        text = registry.render()
+
+        labels = {'route': 'r', 'method': 'GET'}
+        self.assertEqual(sample(text, 'http_request_db_queries_bucket',
+                                **labels, le='0'), 1)
+        self.assertEqual(sample(text, 'http_request_db_queries_bucket',
+                                **labels, le='1'), 2)
+        self.assertEqual(sample(text, 'http_request_db_queries_bucket',
+                                **labels, le='5'), 3)
+        self.assertEqual(sample(text, 'http_request_db_queries_bucket',
+                                **labels, le='+Inf'), 4)
+        self.assertEqual(sample(text, 'http_request_db_queries_sum',
+                                **labels), 1004)
+        self.assertIsNone(sample(text, 'http_request_duration_seconds_count',
+                                 **labels))
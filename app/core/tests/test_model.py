@@ -1,6 +1,8 @@
 from unittest.mock import patch
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from core import models
 
@@ -54,6 +56,80 @@ class ModelTest(TestCase):
 
         self.assertEqual(str(tag), tag.name)
 
+    def test_tag_name_unique_per_user(self):
+        '''test that a user cannot have two tags with the same name'''
+        user = create_sample_user()
+        models.Tag.objects.create(user=user, name='Drinks')
+
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='Drinks')
+
+    def test_get_or_create_names(self):
+        '''test that existing names are reused and missing ones created'''
+        user = create_sample_user()
+        salt = models.Ingredient.objects.create(user=user, name='Salt')
+
+        with self.assertNumQueries(5):
+            found = models.Ingredient.objects.get_or_create_names(
+                user, ['Salt', 'Pepper', 'Salt'])
+
+        self.assertEqual(found['Salt'], salt)
+        self.assertEqual(found['Pepper'].user, user)
+        self.assertEqual(models.Ingredient.objects.count(), 2)
+
+    def test_collection_version_bumped_on_writes(self):
+        '''test that writes advance the user collection version'''
+        user = create_sample_user()
+        tag = models.Tag.objects.create(user=user, name='Vegan')
+        version = user.collection_version.version
+
+        tag.delete()
+
+        user.collection_version.refresh_from_db()
+        self.assertEqual(user.collection_version.version, version + 1)
+
+    def test_racing_first_write_keeps_its_bump(self):
+        '''test that a version row inserted concurrently is still bumped'''
+        user = create_sample_user()
+        versions = models.CollectionVersion.objects
+        versions.filter(user=user).delete()
+        bulk_create = versions.bulk_create
+
+        def insert_concurrently(*args, **kwargs):
+            versions.create(user=user, version=5, updated_at=timezone.now())
+            return bulk_create(*args, **kwargs)
+
+        with patch.object(versions, 'bulk_create',
+                          side_effect=insert_concurrently):
+            models.Tag.objects.create(user=user, name='Vegan')
+
+        self.assertEqual(versions.get(user=user).version, 6)
+
+    def test_delete_user_with_collections(self):
+        '''test that deleting a user does not recreate its version row'''
+        user = create_sample_user()
+        recipe = models.Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=1)
+        recipe.tags.add(models.Tag.objects.create(user=user, name='Vegan'))
+
+        user.delete()
+
+        self.assertFalse(models.CollectionVersion.objects.exists())
+        self.assertFalse(models.RecipeSearchDocument.objects.exists())
+
+    def test_delete_users_queryset_with_collections(self):
+        '''test that bulk deleting users does not recreate their rows'''
+        user = create_sample_user()
+        recipe = models.Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=1)
+        recipe.ingredients.add(
+            models.Ingredient.objects.create(user=user, name='Salt'))
+
+        get_user_model().objects.filter(pk=user.pk).delete()
+
+        self.assertFalse(models.CollectionVersion.objects.exists())
+        self.assertFalse(models.RecipeSearchDocument.objects.exists())
+
     def test_ingredient_model_str(self):
         '''test ingredient model string representation'''
         ingredient = models.Ingredient.objects.create(
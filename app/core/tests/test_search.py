@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from unittest.mock import patch
+
+from core import models, search, versioning
+
+
+def search_document(recipe):
+    '''return the current search document of recipe'''
+    return models.RecipeSearchDocument.objects.get(recipe=recipe)
+
+
+class RecipeSearchDocumentTest(TestCase):
+    '''test suite for keeping recipe search documents in sync'''
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@domain.com', 'testPass')
+        self.recipe = models.Recipe.objects.create(
+            user=self.user, title='Tomato soup', time_minutes=5, price=1)
+        self.tag = models.Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = models.Ingredient.objects.create(
+            user=self.user, name='Tomato')
+
+    def test_document_follows_recipe(self):
+        '''test that saves and m2m changes update the document'''
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(self.ingredient)
+        self.recipe.title = 'Cold tomato soup'
+        self.recipe.save()
+
+        document = search_document(self.recipe)
+        self.assertEqual(document.title, 'Cold tomato soup')
+        self.assertEqual(document.tags, 'Vegan')
+        self.assertEqual(document.ingredients, 'Tomato')
+
+        self.recipe.tags.clear()
+        self.assertEqual(search_document(self.recipe).tags, '')
+
+    def test_document_follows_reverse_changes(self):
+        '''test that linking from the tag side updates the document'''
+        self.tag.recipe_set.add(self.recipe)
+        self.assertEqual(search_document(self.recipe).tags, 'Vegan')
+
+        self.tag.recipe_set.clear()
+        self.assertEqual(search_document(self.recipe).tags, '')
+
+    def test_document_follows_renames_and_deletes(self):
+        '''test that renamed and deleted names update the document'''
+        self.recipe.ingredients.add(self.ingredient)
+        self.ingredient.name = 'Cherry tomato'
+        self.ingredient.save()
+        self.assertEqual(search_document(self.recipe).ingredients,
+                         'Cherry tomato')
+
+        self.ingredient.delete()
+        self.assertEqual(search_document(self.recipe).ingredients, '')
+
+    def test_rebuild_documents(self):
+        '''test that rebuilding recreates missing documents'''
+        self.recipe.tags.add(self.tag)
+        models.RecipeSearchDocument.objects.all().delete()
+
+        self.assertEqual(search.rebuild_documents(batch_size=1), 1)
+
+        self.assertEqual(search_document(self.recipe).tags, 'Vegan')
+
+    def test_deferred_writes_refresh_once(self):
+        '''test that a deferred block refreshes each document once'''
+        with patch('core.search.refresh_documents',
+                   wraps=search.refresh_documents) as refresh:
+            with versioning.deferred():
+                self.recipe.title = 'Cold tomato soup'
+                self.recipe.save()
+                self.recipe.tags.add(self.tag)
+                self.recipe.ingredients.add(self.ingredient)
+
+        refresh.assert_called_once_with({self.recipe.pk})
+        document = search_document(self.recipe)
+        self.assertEqual(document.title, 'Cold tomato soup')
+        self.assertEqual(document.tags, 'Vegan')
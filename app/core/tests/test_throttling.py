@@ -0,0 +1,120 @@
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import TokenBucketStore, bucket_store
+
+CREATE_USER_URL = reverse('user:create')
+TOKEN_URL = reverse('user:token')
+
+
+def rates(**scopes):
+    '''return override_settings of AUTH_THROTTLE rates by scope'''
+    return override_settings(AUTH_THROTTLE={
+        **settings.AUTH_THROTTLE,
+        'RATES': {**settings.AUTH_THROTTLE['RATES'],
+                  **{scope.replace('_', '-'): rate
+                     for scope, rate in scopes.items()}},
+    })
+
+
+class TokenBucketStoreTest(SimpleTestCase):
+    '''test suite for the token bucket store'''
+
+    def test_burst_then_refill(self):
+        '''test that a bucket allows its burst, then refills at its rate'''
+        store = TokenBucketStore()
+
+        waits = [store.take('key', 2, 0.5, now=100) for _ in range(3)]
+
+        self.assertEqual(waits, [0, 0, 2.0])
+        self.assertEqual(store.take('key', 2, 0.5, now=101), 1.0)
+        self.assertEqual(store.take('key', 2, 0.5, now=102), 0)
+        self.assertEqual(store.take('other', 2, 0.5, now=102), 0)
+
+    def test_least_recently_used_dropped(self):
+        '''test that local buckets are bounded to max_size'''
+        store = TokenBucketStore(max_size=1)
+        store.take('first', 1, 1, now=100)
+
+        store.take('second', 1, 1, now=100)
+
+        self.assertEqual(store.take('first', 1, 1, now=100), 0)
+        self.assertEqual(store.take('second', 1, 1, now=100), 0)
+
+    def test_shared_cache(self):
+        '''test that buckets in a shared cache are seen by every store'''
+        caches['default'].clear()
+        first = TokenBucketStore(shared_alias='default')
+        second = TokenBucketStore(shared_alias='default')
+
+        first.take('key', 1, 1, now=100)
+
+        self.assertEqual(second.take('key', 1, 1, now=100.5), 0.5)
+
+
+class AuthThrottleTest(TestCase):
+    '''test suite for the signup and login throttles'''
+
+    def setUp(self):
+        bucket_store.clear()
+        self.client = APIClient()
+        self.payload = {'email': 'test@domain.com', 'password': 'testPass'}
+        get_user_model().objects.create_user(**self.payload)
+
+    @rates(login_email=(2, 1))
+    def test_login_throttled_per_email(self):
+        '''test that logins past the email burst are rejected unhashed'''
+        for _ in range(2):
+            res = self.client.post(TOKEN_URL, self.payload)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with patch('user.serializers.authenticate') as authenticate:
+            res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '60')
+        authenticate.assert_not_called()
+        res = self.client.post(TOKEN_URL, {**self.payload,
+                                           'email': 'other@domain.com'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @rates(signup_ip=(1, 30))
+    def test_signup_throttled_per_ip(self):
+        '''test that signups past the address burst are rejected'''
+        res = self.client.post(CREATE_USER_URL, {
+            'email': 'new@domain.com', 'password': 'testPass',
+            'name': 'New'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        payload = {'email': 'newer@domain.com', 'password': 'testPass',
+                   'name': 'Newer'}
+        res = self.client.post(CREATE_USER_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '2')
+        res = self.client.post(CREATE_USER_URL, payload,
+                               REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    @rates(login_ip=(1, 1))
+    def test_forwarded_address_trusted_per_proxy(self):
+        '''test that X-Forwarded-For is only used behind NUM_PROXIES'''
+        self.client.post(TOKEN_URL, self.payload,
+                         HTTP_X_FORWARDED_FOR='10.0.0.1')
+
+        res = self.client.post(TOKEN_URL, self.payload,
+                               HTTP_X_FORWARDED_FOR='10.0.0.2')
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        with override_settings(AUTH_THROTTLE={**settings.AUTH_THROTTLE,
+                                              'NUM_PROXIES': 1}):
+            res = self.client.post(TOKEN_URL, self.payload,
+                                   HTTP_X_FORWARDED_FOR='10.0.0.3')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,201 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core import signing
+from django.core.management import call_command
+from django.db import DatabaseError, models
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from unittest.mock import patch
+
+from core import tokens
+from core.authentication import token_cache
+from core.models import RevokedToken
+
+ME_URL = reverse('user:me')
+
+
+def create_sample_user(email='test@domain.com', password='testPass'):
+    '''create and return a test user'''
+    return get_user_model().objects.create_user(email, password)
+
+
+class SignedTokenTest(TestCase):
+    '''test suite for signed tokens'''
+
+    def setUp(self):
+        self.user = create_sample_user()
+
+    def test_issue_and_load(self):
+        '''test that a token describes its user, id and expiry'''
+        token = tokens.issue(self.user, ttl=60)
+
+        loaded = tokens.load(token.key)
+
+        self.assertEqual(loaded.user_id, self.user.pk)
+        self.assertEqual(loaded.token_id, token.token_id)
+        self.assertEqual(loaded.expires_at, token.expires_at)
+        self.assertTrue(loaded.matches(self.user))
+
+    def test_expired_and_tampered_tokens(self):
+        '''test that expired or altered tokens do not load'''
+        with self.assertRaises(tokens.TokenExpired):
+            tokens.load(tokens.issue(self.user, ttl=-1).key)
+
+        key = tokens.issue(self.user).key
+        with self.assertRaises(signing.BadSignature):
+            tokens.load(key[:-1] + ('A' if key[-1] != 'A' else 'B'))
+
+    def test_password_change_invalidates(self):
+        '''test that a token no longer matches after a password change'''
+        token = tokens.issue(self.user)
+
+        self.user.set_password('newPass')
+
+        self.assertFalse(token.matches(self.user))
+
+    def test_password_upgrade_keeps_tokens(self):
+        '''test that upgrading the password hash keeps tokens matching'''
+        self.user.password = make_password('testPass',
+                                           hasher='pbkdf2_sha256')
+        self.user.save()
+        token = tokens.issue(self.user)
+
+        self.assertTrue(self.user.check_password('testPass'))
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        self.assertTrue(token.matches(self.user))
+
+
+class RevocationSetTest(TestCase):
+    '''test suite for the revoked token filter'''
+
+    def setUp(self):
+        self.user = create_sample_user()
+
+    def test_revocations_of_other_workers(self):
+        '''test that rows revoked elsewhere are read on refresh'''
+        worker = tokens.RevocationSet(interval=0)
+        token = tokens.issue(self.user)
+        self.assertFalse(worker.is_revoked(token.token_id))
+
+        tokens.revoke(token)
+
+        self.assertTrue(worker.is_revoked(token.token_id))
+        self.assertTrue(RevokedToken.objects.filter(
+            token_id=token.token_id, user=self.user).exists())
+
+    def test_failed_rebuild_is_retried(self):
+        '''test that a failed first load does not skip older revocations'''
+        token = tokens.issue(self.user)
+        tokens.revoke(token)
+        RevokedToken.objects.update(
+            revoked_at=timezone.now() - timedelta(days=1))
+        worker = tokens.RevocationSet(interval=60)
+
+        with patch.object(models.QuerySet, 'values_list',
+                          side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                worker.refresh()
+
+        self.assertTrue(worker.is_revoked(token.token_id))
+
+    def test_purge_expired_revocations(self):
+        '''test that revocations of expired tokens are deleted'''
+        tokens.revoke(tokens.issue(self.user, ttl=-1))
+        tokens.revoke(tokens.issue(self.user))
+        out = StringIO()
+
+        call_command('purge_revoked_tokens', stdout=out)
+
+        self.assertIn('Deleted 1 expired revocations.', out.getvalue())
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+    def test_false_positive_is_checked(self):
+        '''test that ids the filter may hold are looked up'''
+        worker = tokens.RevocationSet(bits=1, hashes=1, interval=0)
+        worker.refresh()
+        worker.add('revoked')
+
+        with self.assertNumQueries(2):
+            self.assertFalse(worker.is_revoked('not-revoked'))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        '''test that every added item is found'''
+        bloom = tokens.BloomFilter(bits=1024, hashes=3)
+        for n in range(100):
+            bloom.add(str(n))
+
+        self.assertTrue(all(str(n) in bloom for n in range(100)))
+        self.assertEqual(bloom.count, 100)
+
+
+class SignedTokenAuthenticationTest(TestCase):
+    '''test suite for authenticating with signed tokens'''
+
+    def setUp(self):
+        token_cache.clear()
+        tokens.revocations.clear()
+        self.user = create_sample_user()
+        self.token = tokens.issue(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_authenticated_without_queries(self):
+        '''test that a signed token is checked without a query'''
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_rejected_tokens(self):
+        '''test that revoked, expired and stale tokens are rejected'''
+        expired = tokens.issue(self.user, ttl=-1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {expired.key}')
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(str(res.data['detail']), 'Token expired.')
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.client.get(ME_URL)
+        self.user.set_password('newPass')
+        self.user.save()
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        token = tokens.issue(self.user)
+        tokens.revoke(token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        res = self.client.get(ME_URL)
+        self.assertEqual(str(res.data['detail']), 'Token revoked.')
+
+    def test_stale_cached_user_reloaded(self):
+        '''test that a cached user older than the token is reloaded'''
+        stale = get_user_model().objects.get(pk=self.user.pk)
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            token_generation=models.F('token_generation') + 1)
+        self.user.refresh_from_db()
+        token_cache.set(f'user:{self.user.pk}', stale)
+        token = tokens.issue(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    async def test_async_view(self):
+        '''test that the async views accept signed tokens'''
+        res = await self.async_client.get(
+            reverse('recipe:async-tag-list'),
+            AUTHORIZATION=f'Token {self.token.key}')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,142 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+
+def _take(state, capacity, rate, now):
+    '''return the (tokens, wait) of a bucket after one attempt at now
+
+    state is the (tokens, time) the bucket was left with, or None for a
+    full bucket. wait is 0 when the attempt took a token, else the
+    seconds until one is available; rejected attempts take nothing.
+    '''
+    tokens = capacity
+    if state is not None:
+        left, updated = state
+        tokens = min(capacity, left + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class TokenBucketStore:
+    '''token buckets by key, in process memory or in a shared cache
+
+    Local buckets are bounded to max_size, dropping the least recently
+    used; a dropped bucket is full again. When shared_alias names a
+    CACHES entry buckets live there instead, shared by every worker, and
+    expire once they would be full. Concurrent attempts on other
+    workers may read the same bucket, letting a few more through.
+    '''
+    key_prefix = 'throttle:'
+
+    def __init__(self, max_size=100000, shared_alias=None):
+        self.max_size = max_size
+        self.shared_alias = shared_alias
+        self.enabled = True
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        '''return the shared cache backend, if one is configured'''
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def take(self, key, capacity, rate, now=None):
+        '''take a token from the bucket of key; return the seconds to wait
+
+        The bucket holds up to capacity tokens and gains rate tokens per
+        second. Returns 0 when a token was taken.
+        '''
+        if not self.enabled:
+            return 0.0
+        now = time.time() if now is None else now
+        shared = self.shared
+        if shared is not None:
+            cache_key = self.key_prefix + key
+            tokens, wait = _take(shared.get(cache_key), capacity, rate, now)
+            shared.set(cache_key, (tokens, now),
+                       max(1, math.ceil((capacity - tokens) / rate)))
+            return wait
+        with self._lock:
+            tokens, wait = _take(self._buckets.pop(key, None), capacity,
+                                 rate, now)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        '''drop every local bucket'''
+        with self._lock:
+            self._buckets.clear()
+
+
+_config = getattr(settings, 'AUTH_THROTTLE', {})
+bucket_store = TokenBucketStore(
+    max_size=_config.get('MAX_SIZE', 100000),
+    shared_alias=_config.get('SHARED_CACHE'),
+)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    '''throttle taking a token from the bucket of the request key
+
+    The bucket rate is AUTH_THROTTLE RATES['<view throttle_scope>-<kind>'],
+    a (burst, tokens per minute) pair. Requests without a key pass.
+    '''
+    kind = None
+
+    def get_key(self, request):
+        raise NotImplementedError('.get_key() must be overridden')
+
+    def allow_request(self, request, view):
+        self.delay = 0.0
+        key = self.get_key(request)
+        if key is None:
+            return True
+        scope = f'{view.throttle_scope}-{self.kind}'
+        capacity, per_minute = settings.AUTH_THROTTLE['RATES'][scope]
+        self.delay = bucket_store.take(f'{scope}:{key}', capacity,
+                                       per_minute / 60)
+        return not self.delay
+
+    def wait(self):
+        return self.delay
+
+
+class IPThrottle(TokenBucketThrottle):
+    '''token bucket per client address
+
+    X-Forwarded-For is trusted for AUTH_THROTTLE NUM_PROXIES hops only.
+    '''
+    kind = 'ip'
+
+    def get_key(self, request):
+        proxies = settings.AUTH_THROTTLE['NUM_PROXIES']
+        if proxies:
+            forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+            addresses = [address.strip() for address in forwarded.split(',')
+                         if address.strip()]
+            if addresses:
+                return addresses[-min(proxies, len(addresses))]
+        return request.META.get('REMOTE_ADDR')
+
+
+class EmailThrottle(TokenBucketThrottle):
+    '''token bucket per email address given in the request body'''
+    kind = 'email'
+
+    def get_key(self, request):
+        data = request.data
+        email = data.get('email') if hasattr(data, 'get') else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return hashlib.sha256(
+            email.strip().lower().encode()).hexdigest()[:32]
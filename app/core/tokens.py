@@ -0,0 +1,211 @@
+import hashlib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from core import models
+
+SALT = 'core.tokens'
+
+
+class TokenExpired(signing.BadSignature):
+    '''raised by load() for a token past its expiry'''
+
+
+class SignedToken:
+    '''a signed token: who it authenticates, its id and expiry
+
+    Tokens are self-describing: the user id, a random token id, the expiry
+    and the token generation of the user are signed with SECRET_KEY, so
+    they are checked without a query. Changing the password of a user
+    raises its generation, invalidating all of its tokens; upgrading the
+    hash of the password on login does not.
+    '''
+
+    def __init__(self, key, user_id, token_id, expires, generation):
+        self.key = key
+        self.user_id = user_id
+        self.token_id = token_id
+        self.expires = expires
+        self.generation = generation
+
+    @property
+    def expires_at(self):
+        return datetime.fromtimestamp(self.expires, dt_timezone.utc)
+
+    def matches(self, user):
+        '''return True if user is the unchanged user of the token'''
+        return (user.pk == self.user_id and
+                user.token_generation == self.generation)
+
+
+def is_signed(key):
+    '''return True if key looks like a signed token, not a database one'''
+    return ':' in key
+
+
+def issue(user, ttl=None):
+    '''return a new SignedToken of user, valid for ttl seconds'''
+    ttl = ttl or settings.SIGNED_TOKENS['TTL']
+    payload = {'u': user.pk, 'j': uuid.uuid4().hex,
+               'e': int(time.time()) + ttl, 'g': user.token_generation}
+    key = signing.Signer(salt=SALT).sign_object(payload)
+    return SignedToken(key, payload['u'], payload['j'], payload['e'],
+                       payload['g'])
+
+
+def load(key):
+    '''return the SignedToken of key
+
+    Raises signing.BadSignature for tokens not signed by us and
+    TokenExpired for expired ones. Revocation is not checked.
+    '''
+    payload = signing.Signer(salt=SALT).unsign_object(key)
+    try:
+        token = SignedToken(key, int(payload['u']), str(payload['j']),
+                            int(payload['e']), int(payload['g']))
+    except (KeyError, TypeError, ValueError):
+        raise signing.BadSignature('Malformed token payload')
+    if token.expires <= time.time():
+        raise TokenExpired('Token expired')
+    return token
+
+
+def revoke(token):
+    '''revoke token in every worker'''
+    models.RevokedToken.objects.get_or_create(
+        token_id=token.token_id,
+        defaults={'user_id': token.user_id, 'expires_at': token.expires_at,
+                  'revoked_at': timezone.now()})
+    revocations.add(token.token_id)
+
+
+def rotate(token, user):
+    '''revoke token and return a new SignedToken of user'''
+    revoke(token)
+    return issue(user)
+
+
+class BloomFilter:
+    '''set of strings in bits bits set by hashes hash functions
+
+    Membership tests may give false positives, never false negatives.
+    '''
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self.count = 0
+        self._array = bytearray((bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + n * step) % self.bits for n in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._array[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class RevocationSet:
+    '''ids of revoked tokens, in a Bloom filter read from RevokedToken
+
+    Every interval seconds at most, the rows revoked since the last
+    refresh are added, re-reading overlap seconds for rows committed
+    late; revocations made in this process apply at once. Ids the filter
+    may hold are looked up, so a false positive costs a query but never
+    rejects a valid token. Once capacity ids were added the filter is
+    rebuilt from the rows of unexpired tokens.
+    '''
+
+    def __init__(self, bits=2 ** 20, hashes=7, capacity=100000, interval=5,
+                 overlap=60):
+        self.bits = bits
+        self.hashes = hashes
+        self.capacity = capacity
+        self.interval = interval
+        self.overlap = overlap
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        '''forget every id; the next check reads the whole table'''
+        with self._lock:
+            self._filter = BloomFilter(self.bits, self.hashes)
+            self._refreshed_at = None
+            self._next_refresh = 0.0
+
+    def add(self, token_id):
+        with self._lock:
+            if token_id not in self._filter:
+                self._filter.add(token_id)
+
+    def refresh_due(self):
+        return time.monotonic() >= self._next_refresh
+
+    def refresh(self):
+        '''add the ids revoked since the last refresh, when it is due
+
+        The last refresh time only advances once the rows were read, so a
+        failed read is retried, as a full rebuild if it was one.
+        '''
+        with self._lock:
+            if not self.refresh_due():
+                return
+            self._next_refresh = time.monotonic() + self.interval
+            since = self._refreshed_at
+            rebuild = since is None or self._filter.count >= self.capacity
+        started = timezone.now()
+        rows = models.RevokedToken.objects
+        if rebuild:
+            rows = rows.filter(expires_at__gt=started)
+        else:
+            rows = rows.filter(
+                revoked_at__gte=since - timedelta(seconds=self.overlap))
+        try:
+            token_ids = list(rows.values_list('token_id', flat=True))
+        except Exception:
+            with self._lock:
+                self._next_refresh = 0.0
+            raise
+        with self._lock:
+            if rebuild:
+                self._filter = BloomFilter(self.bits, self.hashes)
+            for token_id in token_ids:
+                if token_id not in self._filter:
+                    self._filter.add(token_id)
+            self._refreshed_at = started
+
+    def is_revoked(self, token_id):
+        self.refresh()
+        return token_id in self._filter and (
+            models.RevokedToken.objects.filter(token_id=token_id).exists())
+
+    async def ais_revoked(self, token_id):
+        '''async is_revoked(), only leaving the event loop to refresh'''
+        if self.refresh_due():
+            await sync_to_async(self.refresh)()
+        return token_id in self._filter and await (
+            models.RevokedToken.objects.filter(token_id=token_id).aexists())
+
+
+_config = getattr(settings, 'SIGNED_TOKENS', {})
+revocations = RevocationSet(
+    bits=_config.get('REVOCATION_BITS', 2 ** 20),
+    hashes=_config.get('REVOCATION_HASHES', 7),
+    capacity=_config.get('REVOCATION_CAPACITY', 100000),
+    interval=_config.get('REVOCATION_REFRESH_SECONDS', 5),
+)
@@ -0,0 +1,188 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef, Subquery
+from django.utils import timezone
+
+from core import models, search, stats
+
+_deferred = threading.local()
+
+
+def record(user_id, kind, ids, deleted=False):
+    '''log a change of the ids of kind (a ChangeLogEntry.Kind) of user_id
+
+    Also bumps the collection version of user_id. Inside a deferred()
+    block the changes are collected and written once, keeping the last
+    change of each object.
+    '''
+    changes = {(user_id, kind, pk): deleted for pk in ids}
+    pending = getattr(_deferred, 'changes', None)
+    if pending is not None:
+        pending.update(changes)
+        _deferred.user_ids.add(user_id)
+        return
+    _apply({user_id}, changes)
+
+
+def refresh_recipes(recipe_ids, touch=False):
+    '''refresh the search documents of recipe_ids
+
+    With touch the recipes are also marked as modified now. Inside a
+    deferred() block the ids are collected and refreshed once, when the
+    outermost block exits.
+    '''
+    pending = getattr(_deferred, 'refresh', None)
+    if pending is not None:
+        pending.update(recipe_ids)
+        if touch:
+            _deferred.touch.update(recipe_ids)
+        return
+    recipe_ids = set(recipe_ids)
+    _refresh(recipe_ids, recipe_ids if touch else ())
+
+
+def _refresh(recipe_ids, touched):
+    if touched:
+        touch_recipes(touched)
+    if recipe_ids:
+        search.refresh_documents(recipe_ids)
+
+
+def _apply(user_ids, changes):
+    '''bump user_ids, then log changes while their version rows are locked
+
+    The lock orders the change ids of each user by commit, so a sync
+    token never skips a change that commits later, and the recipe stats
+    updates of each user one after the other. Missing version rows are
+    inserted at version 0 first and bumped like the others, so a first
+    write racing another one waits for it instead of losing its bump.
+    '''
+    now = timezone.now()
+    versions = models.CollectionVersion.objects
+    with transaction.atomic(savepoint=False):
+        bumped = versions.filter(user_id__in=user_ids).update(
+            version=F('version') + 1, updated_at=now)
+        if bumped < len(user_ids):
+            existing = set(versions.filter(
+                user_id__in=user_ids).values_list('user_id', flat=True))
+            missing = user_ids.difference(existing)
+            versions.bulk_create([
+                models.CollectionVersion(user_id=user_id, version=0,
+                                         updated_at=now)
+                for user_id in missing
+            ], ignore_conflicts=True)
+            versions.filter(user_id__in=missing).update(
+                version=F('version') + 1, updated_at=now)
+        if changes:
+            models.ChangeLogEntry.objects.bulk_create([
+                models.ChangeLogEntry(user_id=user_id, kind=kind,
+                                      object_id=pk, deleted=deleted,
+                                      created_at=now)
+                for (user_id, kind, pk), deleted in changes.items()
+            ])
+            recipe_ids = {}
+            for user_id, kind, pk in changes:
+                if kind == models.ChangeLogEntry.Kind.RECIPE:
+                    recipe_ids.setdefault(user_id, set()).add(pk)
+            for user_id, pks in recipe_ids.items():
+                stats.refresh(user_id, pks)
+
+
+@contextmanager
+def deferred():
+    '''collect the changes and refreshes made inside the block
+
+    They are applied once, when the block exits, and dropped when it
+    raises. Open the block inside the transaction of the writes, so that
+    they commit together.
+    '''
+    if getattr(_deferred, 'user_ids', None) is not None:
+        yield
+        return
+    _deferred.user_ids = set()
+    _deferred.changes = {}
+    _deferred.refresh = set()
+    _deferred.touch = set()
+    try:
+        yield
+        user_ids, changes = _deferred.user_ids, _deferred.changes
+        refresh, touched = _deferred.refresh, _deferred.touch
+    finally:
+        _deferred.user_ids = _deferred.changes = None
+        _deferred.refresh = _deferred.touch = None
+    _refresh(refresh, touched)
+    if user_ids:
+        _apply(user_ids, changes)
+
+
+def get_version(user_id):
+    '''return (version, updated_at) of the collections of user_id'''
+    row = models.CollectionVersion.objects.filter(user_id=user_id).values_list(
+        'version', 'updated_at').first()
+    return row or (0, None)
+
+
+def touch_recipes(recipe_ids):
+    '''mark recipe_ids as modified now'''
+    models.Recipe.objects.filter(pk__in=recipe_ids).update(
+        updated_at=timezone.now())
+
+
+def changes_since(user_id, since, limit):
+    '''return (changes, token, more) of user_id after token since
+
+    changes maps each ChangeLogEntry.Kind to {object id: deleted} for
+    the next limit entries, keeping the last change of each object.
+    token is the id of the last entry read; more tells whether entries
+    remain. Returns None when since predates the compacted changes, and
+    the client has to download its collections again.
+    '''
+    horizon = models.CollectionVersion.objects.filter(
+        user_id=user_id).values_list('sync_horizon', flat=True).first()
+    if since < (horizon or 0):
+        return None
+    entries = list(models.ChangeLogEntry.objects.filter(
+        user_id=user_id, id__gt=since).order_by('id').values_list(
+        'id', 'kind', 'object_id', 'deleted')[:limit + 1])
+    more = len(entries) > limit
+    entries = entries[:limit]
+    changes = {kind: {} for kind in models.ChangeLogEntry.Kind.values}
+    for _, kind, pk, deleted in entries:
+        changes[kind][pk] = deleted
+    return changes, entries[-1][0] if entries else since, more
+
+
+def head(user_id):
+    '''return the sync token of the latest change of user_id'''
+    latest = models.ChangeLogEntry.objects.filter(user_id=user_id).aggregate(
+        latest=Max('id'))['latest']
+    if latest is not None:
+        return latest
+    horizon = models.CollectionVersion.objects.filter(
+        user_id=user_id).values_list('sync_horizon', flat=True).first()
+    return horizon or 0
+
+
+def compact(before):
+    '''trim the change log; return the (superseded, expired) counts
+
+    Entries followed by a newer entry for the same object are deleted,
+    which no sync token needs. Entries created before the datetime
+    before are then deleted, and the sync horizon of their users raised
+    so that older tokens get a full download instead.
+    '''
+    entries = models.ChangeLogEntry.objects
+    superseded, _ = entries.filter(Exists(entries.filter(
+        user_id=OuterRef('user_id'), kind=OuterRef('kind'),
+        object_id=OuterRef('object_id'), id__gt=OuterRef('id')))).delete()
+
+    expired = entries.filter(created_at__lt=before)
+    last_expired = expired.filter(
+        user_id=OuterRef('user_id')).order_by('-id').values('id')[:1]
+    with transaction.atomic():
+        models.CollectionVersion.objects.filter(Exists(last_expired)).update(
+            sync_horizon=Subquery(last_expired))
+        trimmed, _ = expired.delete()
+    return superseded, trimmed
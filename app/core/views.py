@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from core import metrics
+from core.authentication import token_cache
+from recipe.cache import response_cache
+
+
+def cache_metrics():
+    '''return the token and response cache counters as Prometheus text'''
+    tokens = token_cache.stats()
+    responses = response_cache.stats()
+    return ''.join((
+        metrics.render_samples(
+            'token_cache_hits_total', 'counter',
+            'Token lookups served from the cache, by tier.',
+            [({'tier': 'local'}, tokens['hits']),
+             ({'tier': 'shared'}, tokens['shared_hits'])]),
+        metrics.render_samples(
+            'token_cache_misses_total', 'counter',
+            'Token lookups that read the database.',
+            [(None, tokens['misses'])]),
+        metrics.render_samples(
+            'token_cache_entries', 'gauge',
+            'Tokens in the local cache.', [(None, tokens['size'])]),
+        metrics.render_samples(
+            'response_cache_hits_total', 'counter',
+            'Responses served from the response cache.',
+            [(None, responses['hits'])]),
+        metrics.render_samples(
+            'response_cache_misses_total', 'counter',
+            'Response cache lookups that ran the view.',
+            [(None, responses['misses'])]),
+    ))
+
+
+@require_GET
+def metrics_view(request):
+    '''serve the request metrics of this process to Prometheus
+
+    Disabled (404) unless REQUEST_METRICS['TOKEN'] is set; scrapers send
+    it as a bearer token.
+    '''
+    token = settings.REQUEST_METRICS['TOKEN']
+    if not token:
+        raise Http404
+    if not constant_time_compare(request.headers.get('Authorization', ''),
+                                 f'Bearer {token}'):
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(
+        metrics.request_metrics.render() + cache_metrics(),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,100 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+
+from core import metrics, models, search
+from core.authentication import CachedTokenAuthentication
+from recipe import fast, filters
+
+
+class AsyncReadView(View):
+    '''base of the async read endpoints
+
+    Authenticates with the same token cache as the viewsets and answers
+    with the same JSON bodies and error responses, but runs on the event
+    loop under ASGI instead of holding a thread per request. Lists are
+    not paginated; use the viewsets to page through a collection.
+    '''
+    authentication = CachedTokenAuthentication()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            auth = await self.authentication.aauthenticate(request)
+            if auth is None:
+                raise exceptions.NotAuthenticated()
+            request.user, request.auth = auth
+            if 'page_size' in request.GET or 'cursor' in request.GET:
+                raise exceptions.ParseError(
+                    'Pagination is not supported by the async endpoints.')
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.error_response(exc)
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        '''return a JSON response of data'''
+        with metrics.timed('render'):
+            content = fast.FastJSONRenderer().render(data)
+        return HttpResponse(content, status=status_code,
+                            content_type='application/json')
+
+    def error_response(self, exc):
+        '''return the response DRF's exception handler gives exc'''
+        data = exc.detail
+        if not isinstance(data, (list, dict)):
+            data = {'detail': data}
+        response = self.render(data, exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated,
+                            exceptions.AuthenticationFailed)):
+            response['WWW-Authenticate'] = (
+                self.authentication.authenticate_header(self.request))
+        return response
+
+    async def recipes(self):
+        '''return the recipes of the user matching the list params'''
+        params = self.request.GET
+        args = (models.Recipe.objects.all(), params, self.request.user)
+        if params.get('q') and not search.uses_tsvector():
+            # the fallback search ranks the matches with a query
+            return await sync_to_async(filters.filter_recipes)(*args)
+        return filters.filter_recipes(*args)
+
+
+class RecipeListView(AsyncReadView):
+    '''async list of recipes, as GET /api/recipe/recipes/'''
+
+    async def get(self, request):
+        queryset = await self.recipes()
+        with metrics.timed('serialize'):
+            data = await fast.arecipe_list(queryset, request)
+        return self.render(data)
+
+
+class RecipeDetailView(AsyncReadView):
+    '''async recipe detail, as GET /api/recipe/recipes/<pk>/'''
+
+    async def get(self, request, pk):
+        queryset = await self.recipes()
+        try:
+            with metrics.timed('serialize'):
+                data = await fast.arecipe_detail(queryset, pk, request)
+        except models.Recipe.DoesNotExist:
+            raise exceptions.NotFound()
+        return self.render(data)
+
+
+class TagListView(AsyncReadView):
+    '''async list of tags, as GET /api/recipe/tags/'''
+    model = models.Tag
+
+    async def get(self, request):
+        queryset = self.model.objects.filter(
+            user=request.user).order_by('-name')
+        with metrics.timed('serialize'):
+            data = await fast.aname_list(queryset)
+        return self.render(data)
+
+
+class IngredientListView(TagListView):
+    '''async list of ingredients, as GET /api/recipe/ingredients/'''
+    model = models.Ingredient
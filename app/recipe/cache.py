@@ -0,0 +1,62 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class ResponseCache:
+    '''cache of serialized response data keyed by its ETag
+
+    ETags are derived from the user's collection version or the object's
+    updated_at (see recipe.conditional), so every write makes the cached
+    entries of the previous version unreachable and they simply expire.
+    Hit and miss counters are kept per process.
+    '''
+    key_prefix = 'recipe-response:'
+
+    def __init__(self, alias='default', timeout=300):
+        self.alias = alias
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def get(self, etag):
+        '''return the cached data for etag, or None'''
+        data = self.backend.get(self.key_prefix + etag)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, etag, data):
+        '''cache data under etag'''
+        self.backend.set(self.key_prefix + etag, data, self.timeout)
+
+    def clear_stats(self):
+        '''reset the hit and miss counters'''
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        '''return the hit and miss counters and the hit ratio'''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_config = getattr(settings, 'RECIPE_RESPONSE_CACHE', {})
+response_cache = ResponseCache(
+    alias=_config.get('CACHE', 'default'),
+    timeout=_config.get('TIMEOUT', 300),
+)
@@ -0,0 +1,39 @@
+from itertools import islice
+
+from recipe.fast import FastJSONRenderer
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'recipes.ndjson'),
+    'json': ('application/json', 'recipes.json'),
+}
+
+
+def _batches(iterable, size):
+    '''yield lists of up to size items of iterable'''
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def stream_recipes(queryset, serializer_class, context, fmt, chunk_size):
+    '''yield the serialized recipes of queryset as NDJSON or a JSON array
+
+    Rows are read with iterator(chunk_size), which uses a server-side
+    cursor where supported and runs the prefetches of queryset once per
+    chunk, so only one chunk of recipes is held in memory at a time.
+    '''
+    render = FastJSONRenderer().render
+    recipes = queryset.iterator(chunk_size=chunk_size)
+    if fmt == 'json':
+        yield b'['
+    first = True
+    for batch in _batches(recipes, chunk_size):
+        data = serializer_class(batch, many=True, context=context).data
+        lines = [render(item) for item in data]
+        if fmt == 'ndjson':
+            yield b'\n'.join(lines) + b'\n'
+        else:
+            yield (b'' if first else b',') + b','.join(lines)
+        first = False
+    if fmt == 'json':
+        yield b']'
@@ -0,0 +1,214 @@
+from django.contrib.postgres.expressions import ArraySubquery
+from django.conf import settings
+from django.db import connections
+from django.db.models import OuterRef
+from rest_framework import serializers as drf_serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from core import metrics, models
+from recipe import serializers
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''JSONRenderer producing the same bytes with orjson, when installed
+
+    Falls back to the standard encoder for indented output, non default
+    JSON settings and data orjson cannot encode the way DRF does.
+    '''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if (orjson is None or data is None or indent is not None or
+                self.ensure_ascii or not self.compact):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
+
+
+def _link_pairs(queryset, field_name, named=False):
+    '''return (recipe id, linked pk) pairs of queryset, in pk order
+
+    Django 4.1 can only aiterator() over named values_list() rows.
+    '''
+    field = models.Recipe._meta.get_field(field_name)
+    target = f'{field.m2m_reverse_field_name()}_id'
+    return field.remote_field.through.objects.using(queryset.db).filter(
+        recipe_id__in=queryset.values('id')).order_by(target).values_list(
+        'recipe_id', target, named=named)
+
+
+def _group(pairs):
+    '''return {recipe id: [linked pks]} of (recipe id, pk) pairs'''
+    ids = {}
+    for recipe_id, pk in pairs:
+        ids.setdefault(recipe_id, []).append(pk)
+    return ids
+
+
+def _array_ids(field_name):
+    '''return a subquery aggregating the linked pks of a recipe in order'''
+    field = models.Recipe._meta.get_field(field_name)
+    target = f'{field.m2m_reverse_field_name()}_id'
+    return ArraySubquery(field.remote_field.through.objects.filter(
+        recipe_id=OuterRef('pk')).order_by(target).values(target))
+
+
+def _converter(field, request):
+    '''return a function rendering a raw column value like field does'''
+    if isinstance(field, drf_serializers.ImageField):
+        storage = models.Recipe._meta.get_field(field.source).storage
+
+        def image(name):
+            if not name:
+                return None
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+        return image
+    if isinstance(field, (drf_serializers.IntegerField,
+                          drf_serializers.CharField,
+                          drf_serializers.ChoiceField)):
+        return None
+    return field.to_representation
+
+
+def _plan(serializer_class, request):
+    '''return (converters, related, columns) to render serializer_class
+
+    converters holds (name, is_related, source, convert) for each field in
+    output order, related the names of the to-many fields and columns the
+    sources of the others.
+    '''
+    fields = [
+        (name, field) for name, field in serializer_class(
+            context={'request': request}).fields.items()
+        if not field.write_only
+    ]
+    related = [name for name, field in fields
+               if isinstance(field, (drf_serializers.ManyRelatedField,
+                                     drf_serializers.ListSerializer))]
+    columns = [field.source for name, field in fields if name not in related]
+    converters = [
+        (name, name in related, field.source, _converter(field, request))
+        for name, field in fields
+    ]
+    return converters, related, columns
+
+
+def _recipe_queries(queryset, related, columns, named=False):
+    '''return the rows queryset and, without arrays, the link querysets'''
+    queryset = queryset.prefetch_related(None)
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.values(*columns, **{
+            f'{name}_ids': _array_ids(name) for name in related}), None
+    return queryset.values(*columns), {
+        name: _link_pairs(queryset, name, named) for name in related}
+
+
+def _build(rows, links, converters):
+    '''return the output dicts of rows'''
+    data = []
+    for row in rows:
+        item = {}
+        for name, is_related, source, convert in converters:
+            if is_related:
+                item[name] = (row[f'{name}_ids'] if links is None
+                              else links[name].get(row['id'], []))
+            else:
+                value = row[source]
+                item[name] = value if convert is None else convert(value)
+        data.append(item)
+    return data
+
+
+def recipe_list(queryset, request):
+    '''return the RecipeSerializer list representation of queryset
+
+    Rows are read with values() and related ids fetched as arrays (one
+    ARRAY subquery per relation on PostgreSQL, one query per relation
+    elsewhere), skipping serializer and model instantiation.
+    '''
+    converters, related, columns = _plan(serializers.RecipeSerializer,
+                                         request)
+    rows, link_queries = _recipe_queries(queryset, related, columns)
+    links = None
+    if link_queries is not None:
+        links = {name: _group(pairs.iterator())
+                 for name, pairs in link_queries.items()}
+    return _build(rows, links, converters)
+
+
+def name_list(queryset):
+    '''return the TagSerializer / IngredientSerializer list of queryset'''
+    return list(queryset.values('id', 'name'))
+
+
+async def arecipe_list(queryset, request):
+    '''async recipe_list(), reading rows with aiterator()'''
+    converters, related, columns = _plan(serializers.RecipeSerializer,
+                                         request)
+    rows, link_queries = _recipe_queries(queryset, related, columns,
+                                         named=True)
+    links = None
+    if link_queries is not None:
+        links = {name: _group([pair async for pair in pairs.aiterator()])
+                 for name, pairs in link_queries.items()}
+    return _build([row async for row in rows.aiterator()], links,
+                  converters)
+
+
+async def arecipe_detail(queryset, pk, request):
+    '''return the RecipeDetailSerializer representation of recipe pk
+
+    Raises Recipe.DoesNotExist when queryset has no such recipe. Nested
+    tags and ingredients are read in pk order, like the prefetch plan.
+    '''
+    serializer_class = serializers.RecipeDetailSerializer
+    converters, related, columns = _plan(serializer_class, request)
+    row = await queryset.prefetch_related(None).values(*columns).aget(pk=pk)
+    fields = serializer_class().fields
+    for name in related:
+        field = models.Recipe._meta.get_field(fields[name].source)
+        child_fields = fields[name].child.Meta.fields
+        nested = field.related_model.objects.filter(**{
+            field.related_query_name(): pk}).order_by('pk').values(
+            *child_fields)
+        # _build reads to-many values from the {name}_ids key
+        row[f'{name}_ids'] = [item async for item in nested.aiterator()]
+    return _build([row], None, converters)[0]
+
+
+async def aname_list(queryset):
+    '''async name_list(), reading rows with aiterator()'''
+    return [row async for row in queryset.values('id', 'name').aiterator()]
+
+
+class FastListMixin:
+    '''serve unpaginated JSON lists from fast_list() when enabled
+
+    With RECIPE_FAST_LISTS on, list responses are built by the view's
+    fast_list(queryset) and rendered with FastJSONRenderer. The output is
+    the same as the serializer path, which still serves paginated and
+    browsable API requests.
+    '''
+
+    def list(self, request, *args, **kwargs):
+        if (not settings.RECIPE_FAST_LISTS or
+                request.accepted_renderer.format != 'json' or
+                self.paginator is None or
+                self.paginator.get_page_size(request) is not None):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        request.accepted_renderer = FastJSONRenderer()
+        with metrics.timed('serialize'):
+            data = self.fast_list(queryset)
+        return Response(data)
@@ -0,0 +1,123 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import (
+    Case, Count, Exists, F, FloatField, OuterRef, Q, Subquery, Value, When)
+from rest_framework.exceptions import ValidationError
+
+from core import models, search
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+MATCH_MODES = (MATCH_ANY, MATCH_ALL)
+
+
+def parse_ids(param, param_name='ids'):
+    '''convert a comma-sep strings of ids to list of int ids
+
+    Raises a ValidationError for param_name when an id is not an integer.
+    '''
+    try:
+        return [int(id) for id in param.split(',')]
+    except ValueError:
+        raise ValidationError(
+            {param_name: ['Expected comma-separated ids.']})
+
+
+def filter_by_related(queryset, field_name, ids, mode=MATCH_ANY):
+    '''filter recipes linked to any or all of ids through field_name
+
+    The lookup is a correlated subquery on the m2m through table, so the
+    recipe table is never joined to the links and every recipe is returned
+    at most once however many of the ids it matches.
+    '''
+    if mode not in MATCH_MODES:
+        raise ValidationError({
+            f'{field_name}_mode': [
+                f'Must be one of: {", ".join(MATCH_MODES)}'],
+        })
+
+    field = models.Recipe._meta.get_field(field_name)
+    links = field.remote_field.through.objects.filter(**{
+        field.m2m_field_name(): OuterRef('pk'),
+        f'{field.m2m_reverse_field_name()}__in': ids,
+    })
+
+    if mode == MATCH_ANY:
+        return queryset.filter(Exists(links))
+
+    matched = links.values(field.m2m_field_name()).annotate(
+        matched=Count('pk')).values('matched')
+    return queryset.alias(**{
+        f'{field_name}_matched': Subquery(matched)
+    }).filter(**{f'{field_name}_matched': len(set(ids))})
+
+
+# ts_rank's default weights for the A, B and C labels
+FALLBACK_WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+
+
+def search_terms(text):
+    '''return the lowercased word tokens of text'''
+    return re.findall(r'\w+', text.lower())
+
+
+def search_recipes(queryset, q):
+    '''filter recipes matching the search text q, best ranked first
+
+    On PostgreSQL q is a websearch query against the GIN indexed tsvector
+    and results are ordered by ts_rank. Elsewhere every term must prefix a
+    word of the title, ingredient or tag names, and matches are ranked in
+    Python with the same weights, which is only meant for small datasets.
+    '''
+    if search.uses_tsvector(queryset.db):
+        query = SearchQuery(q, config=search.SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_document__vector=query).annotate(
+            rank=SearchRank(F('search_document__vector'), query)).order_by(
+            '-rank', '-id')
+
+    terms = search_terms(q)
+    if not terms:
+        return queryset.none()
+    condition = Q()
+    for term in terms:
+        condition &= Q(*(
+            Q(**{f'search_document__{column}__icontains': term})
+            for column, _ in search.SEARCH_WEIGHTS), _connector=Q.OR)
+    columns = [f'search_document__{column}'
+               for column, _ in search.SEARCH_WEIGHTS]
+    ranks = {}
+    for recipe_id, *texts in queryset.filter(condition).values_list(
+            'id', *columns):
+        words = [search_terms(text) for text in texts]
+        if all(any(word.startswith(term) for column in words
+                   for word in column) for term in terms):
+            ranks[recipe_id] = sum(
+                FALLBACK_WEIGHTS[weight] * sum(
+                    word.startswith(term) for word in column
+                    for term in terms) / (1 + len(column))
+                for column, (_, weight) in zip(words, search.SEARCH_WEIGHTS))
+    return queryset.filter(pk__in=ranks).annotate(rank=Case(
+        *(When(pk=pk, then=Value(rank)) for pk, rank in ranks.items()),
+        default=Value(0.0), output_field=FloatField())).order_by(
+        '-rank', '-id')
+
+
+def filter_recipes(queryset, params, user):
+    '''return the recipes of user in queryset matching the list params
+
+    Applies the tags and ingredients filters (and their _mode), newest
+    first, or ranked by the search text when q is given.
+    '''
+    for field_name in ('tags', 'ingredients'):
+        ids = params.get(field_name)
+        if ids:
+            queryset = filter_by_related(
+                queryset, field_name, parse_ids(ids, field_name),
+                params.get(f'{field_name}_mode', MATCH_ANY))
+
+    queryset = queryset.filter(user=user).order_by('-id')
+    if params.get('q'):
+        queryset = search_recipes(queryset, params['q'])
+    return queryset
@@ -0,0 +1,131 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core import models, versioning
+
+logger = logging.getLogger(__name__)
+
+Status = models.Recipe.ImageStatus
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    '''return the process wide image worker pool'''
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-image')
+        return _executor
+
+
+def schedule_processing(recipe):
+    '''process the image of recipe once the current transaction commits
+
+    With RECIPE_IMAGE_WORKERS set to 0 the image is processed right away
+    on the calling thread instead.
+    '''
+    if not settings.RECIPE_IMAGE_WORKERS:
+        process_image(recipe.pk)
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(_run_job, recipe.pk))
+
+
+def _run_job(recipe_id):
+    '''process_image wrapper managing the worker thread db connection'''
+    close_old_connections()
+    try:
+        process_image(recipe_id)
+    except Exception:
+        logger.exception('Processing image of recipe %s failed', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def _encode(image):
+    '''return image as progressive JPEG bytes, without any metadata'''
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85, optimize=True,
+               progressive=True)
+    return ContentFile(buffer.getvalue())
+
+
+def delete_files(names):
+    '''delete the given storage names, ignoring missing files'''
+    for name in names:
+        default_storage.delete(name)
+
+
+def process_image(recipe_id):
+    '''validate, sanitise and resize the uploaded image of a recipe
+
+    The upload is replaced by a re-encoded copy without EXIF data and a
+    JPEG rendition is written for each RECIPE_IMAGE_RENDITIONS width.
+    Uploads that cannot be decoded are deleted, so their metadata is
+    never served. Nothing is stored if the image was replaced while being
+    processed.
+    '''
+    recipe = models.Recipe.objects.filter(pk=recipe_id).only(
+        'image', 'user_id').first()
+    if recipe is None or not recipe.image:
+        return
+    upload = recipe.image.name
+    current = models.Recipe.objects.filter(pk=recipe_id, image=upload)
+
+    def set_status(**fields):
+        updated = current.update(updated_at=timezone.now(), **fields)
+        if updated:
+            versioning.record(recipe.user_id,
+                              models.ChangeLogEntry.Kind.RECIPE, [recipe_id])
+        return updated
+
+    set_status(image_status=Status.PROCESSING)
+
+    stem = os.path.splitext(upload)[0]
+    base = os.path.join(os.path.dirname(upload), 'renditions',
+                        os.path.basename(stem))
+    written = []
+    try:
+        with recipe.image.open('rb') as upload_file:
+            image = Image.open(upload_file)
+            image.load()
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        sanitised = default_storage.save(f'{stem}.jpg', _encode(image))
+        written.append(sanitised)
+        renditions = {}
+        for label, width in settings.RECIPE_IMAGE_RENDITIONS.items():
+            rendition = image.copy()
+            rendition.thumbnail((width, width))
+            renditions[label] = default_storage.save(
+                f'{base}_{label}.jpg', _encode(rendition))
+            written.append(renditions[label])
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning('Invalid image for recipe %s', recipe_id,
+                       exc_info=True)
+        delete_files(written)
+        if set_status(image=None, image_status=Status.FAILED):
+            delete_files([upload])
+        return
+
+    if set_status(image=sanitised, image_status=Status.READY,
+                  image_renditions=renditions):
+        delete_files([upload])
+    else:
+        delete_files(written)
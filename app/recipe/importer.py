@@ -0,0 +1,200 @@
+import codecs
+import csv
+import io
+import json
+
+from django.db import connection, transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import BaseParser
+
+from core import models, search, versioning
+from recipe.serializers import RecipeImportSerializer
+
+# separates the ingredient and tag names of a CSV cell
+NAME_SEPARATOR = ';'
+
+RELATED_FIELDS = ('ingredients', 'tags')
+
+
+def parse_csv(lines):
+    '''yield (row, data, error) for each record of CSV text lines
+
+    The header names the columns of RecipeImportSerializer; ingredients
+    and tags hold NAME_SEPARATOR separated names. Rows are numbered from
+    1, after the header.
+    '''
+    for number, record in enumerate(csv.DictReader(lines), 1):
+        data = {key: value for key, value in record.items()
+                if key is not None and value is not None}
+        for field in RELATED_FIELDS:
+            if field in data:
+                data[field] = [name for name in
+                               data[field].split(NAME_SEPARATOR)
+                               if name.strip()]
+        yield number, data, None
+
+
+def parse_ndjson(lines):
+    '''yield (row, data, error) for each JSON object of NDJSON text lines
+
+    Rows are numbered by line; blank lines are skipped.
+    '''
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except ValueError as exc:
+            yield number, None, {'non_field_errors': [f'Invalid JSON: {exc}']}
+
+
+FORMATS = {
+    'csv': parse_csv,
+    'ndjson': parse_ndjson,
+}
+
+
+class CSVImportParser(BaseParser):
+    '''hand the CSV request body to the importer without reading it'''
+    media_type = 'text/csv'
+    import_format = 'csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return {'format': self.import_format, 'stream': stream}
+
+
+class NDJSONImportParser(CSVImportParser):
+    '''hand the NDJSON request body to the importer without reading it'''
+    media_type = 'application/x-ndjson'
+    import_format = 'ndjson'
+
+
+def _csv_value(value):
+    '''return value as a COPY csv field, None being NULL'''
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _copy(cursor, table, columns, rows):
+    '''insert rows of database values with one COPY into table'''
+    quote = cursor.db.ops.quote_name
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(_csv_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(
+        f'COPY {quote(table)} ({", ".join(quote(c) for c in columns)}) '
+        f'FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def _links(recipes, rows, field_name, found):
+    '''return the through model, its columns and (recipe, object) pks'''
+    field = models.Recipe._meta.get_field(field_name)
+    columns = (f'{field.m2m_field_name()}_id',
+               f'{field.m2m_reverse_field_name()}_id')
+    return field.remote_field.through, columns, [
+        (recipe.pk, pk)
+        for recipe, row in zip(recipes, rows)
+        for pk in dict.fromkeys(
+            found[name].pk for name in row.get(field_name, ()))
+    ]
+
+
+def _copy_recipes(recipes):
+    '''COPY recipes in, with primary keys drawn from their sequence'''
+    meta = models.Recipe._meta
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+            'FROM generate_series(1, %s)',
+            [meta.db_table, meta.pk.column, len(recipes)])
+        ids = sorted(pk for pk, in cursor.fetchall())
+        for recipe, pk in zip(recipes, ids):
+            recipe.pk = pk
+        fields = meta.concrete_fields
+        _copy(cursor, meta.db_table, [field.column for field in fields], (
+            [field.get_db_prep_save(field.pre_save(recipe, True), connection)
+             for field in fields]
+            for recipe in recipes))
+
+
+def _load(user, rows):
+    '''insert validated rows of user with their links; return the count'''
+    if not rows:
+        return 0
+    use_copy = connection.vendor == 'postgresql'
+    with transaction.atomic(), versioning.deferred():
+        recipes = [
+            models.Recipe(user=user, **{
+                key: value for key, value in row.items()
+                if key not in RELATED_FIELDS})
+            for row in rows
+        ]
+        if use_copy:
+            _copy_recipes(recipes)
+        else:
+            models.Recipe.objects.bulk_create(recipes)
+        for field_name in RELATED_FIELDS:
+            model = models.Recipe._meta.get_field(field_name).related_model
+            found = model.objects.get_or_create_names(
+                user, [name for row in rows
+                       for name in row.get(field_name, ())])
+            through, columns, links = _links(
+                recipes, rows, field_name, found)
+            if use_copy:
+                with connection.cursor() as cursor:
+                    _copy(cursor, through._meta.db_table, columns, links)
+            else:
+                through.objects.bulk_create([
+                    through(**dict(zip(columns, link))) for link in links])
+        search.refresh_documents([recipe.pk for recipe in recipes])
+        versioning.record(user.pk, models.ChangeLogEntry.Kind.RECIPE,
+                          [recipe.pk for recipe in recipes])
+    return len(recipes)
+
+
+def import_recipes(user, stream, fmt, batch_size=5000, max_errors=1000):
+    '''import the recipes of a UTF-8 CSV or NDJSON byte stream for user
+
+    The stream is parsed line by line and valid rows are inserted in
+    batches of batch_size, each in its own transaction along with its
+    change log entries: COPY on PostgreSQL, bulk_create elsewhere.
+    Invalid rows are skipped and reported, up to max_errors of them,
+    with the errors the API returns.
+    Returns {'created': n, 'failed': n, 'errors': [{'row', 'errors'}]}.
+    '''
+    result = {'created': 0, 'failed': 0, 'errors': []}
+
+    def fail(number, errors):
+        result['failed'] += 1
+        if len(result['errors']) < max_errors:
+            result['errors'].append({'row': number, 'errors': errors})
+
+    validator = RecipeImportSerializer()
+    batch = []
+    number = 0
+    try:
+        lines = codecs.iterdecode(stream, 'utf-8-sig')
+        for number, data, errors in FORMATS[fmt](lines):
+            if errors is None:
+                try:
+                    batch.append(validator.run_validation(data))
+                except ValidationError as exc:
+                    errors = exc.detail
+                    if not isinstance(errors, dict):
+                        errors = {'non_field_errors': errors}
+            if errors is not None:
+                fail(number, errors)
+            elif len(batch) == batch_size:
+                result['created'] += _load(user, batch)
+                batch = []
+    except UnicodeDecodeError:
+        fail(number + 1, {'non_field_errors': [
+            'Invalid UTF-8 text; the rest of the file was skipped.']})
+    except csv.Error as exc:
+        fail(number + 1, {'non_field_errors': [
+            f'Invalid CSV: {exc}; the rest of the file was skipped.']})
+    result['created'] += _load(user, batch)
+    return result
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import models
+from core.seed import seed_recipes
+from recipe import filters
+
+
+class Rollback(Exception):
+    '''raised to discard the seeded benchmark data'''
+
+
+class Command(BaseCommand):
+    '''Django command to benchmark recipe tag/ingredient filtering'''
+    help = ('Seed a recipe collection with dense m2m fan-out, time the '
+            'join-based and EXISTS-based filters, then roll the data back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--tags-per-recipe', type=int, default=8)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=12)
+        parser.add_argument('--filter-ids', type=int, default=10,
+                            help='number of tag and ingredient ids to filter')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        user, = seed_recipes(
+            recipes_per_user=options['recipes'],
+            tags_per_recipe=options['tags_per_recipe'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            tag_pool=max(20, options['tags_per_recipe']),
+            ingredient_pool=max(50, options['ingredients_per_recipe']),
+            email_prefix='benchmark-filters',
+        )
+        count = options['filter_ids']
+        tag_ids = list(user.tags.values_list('id', flat=True)[:count])
+        ingredient_ids = list(
+            user.ingredients.values_list('id', flat=True)[:count])
+        base = models.Recipe.objects.filter(user=user).order_by('-id')
+
+        def exists(mode):
+            queryset = filters.filter_by_related(base, 'tags', tag_ids, mode)
+            return filters.filter_by_related(
+                queryset, 'ingredients', ingredient_ids, mode)
+
+        cases = (
+            ('join (legacy)', lambda: base.filter(
+                tags__id__in=tag_ids).filter(
+                ingredients__id__in=ingredient_ids)),
+            ('exists, match any', lambda: exists(filters.MATCH_ANY)),
+            ('exists, match all', lambda: exists(filters.MATCH_ALL)),
+        )
+        for label, build in cases:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                ids = list(build().values_list('id', flat=True))
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(
+                f'{label:<20} rows={len(ids):<8} distinct={len(set(ids)):<8} '
+                f'best={min(timings) * 1000:.1f}ms '
+                f'mean={sum(timings) / len(timings) * 1000:.1f}ms')
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core import models
+from core.seed import seed_recipes
+from recipe import fast, serializers
+
+
+class Rollback(Exception):
+    '''raised to discard the seeded benchmark data'''
+
+
+class Command(BaseCommand):
+    '''Django command to benchmark the serializer and fast list paths'''
+    help = ('Seed recipe collections of each size, time building and '
+            'rendering their list responses with the serializers and the '
+            'fast path, then roll the data back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,1000,10000',
+                            help='comma separated recipe counts')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        request = Request(APIRequestFactory().get('/api/recipe/recipes/'))
+        prefetch = serializers.get_prefetch_plan(serializers.RecipeSerializer)
+        for size in [int(n) for n in options['sizes'].split(',')]:
+            user, = seed_recipes(recipes_per_user=size,
+                                 email_prefix=f'benchmark-lists-{size}')
+            queryset = models.Recipe.objects.filter(user=user).order_by('-id')
+            cases = (
+                ('serializers', lambda: JSONRenderer().render(
+                    serializers.RecipeSerializer(
+                        queryset.prefetch_related(*prefetch), many=True,
+                        context={'request': request}).data)),
+                ('fast path', lambda: fast.FastJSONRenderer().render(
+                    fast.recipe_list(queryset, request))),
+            )
+            best = {}
+            for label, render in cases:
+                timings = []
+                for _ in range(options['repeat']):
+                    begin = time.perf_counter()
+                    render()
+                    timings.append(time.perf_counter() - begin)
+                best[label] = min(timings)
+                self.stdout.write(
+                    f'rows={size:<7} {label:<12} '
+                    f'best={best[label] * 1000:.1f}ms '
+                    f'mean={sum(timings) / len(timings) * 1000:.1f}ms')
+            self.stdout.write(
+                f'rows={size:<7} speedup '
+                f'{best["serializers"] / best["fast path"]:.1f}x')
@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core import models
+from core.seed import seed_recipes
+from recipe import filters
+
+WORDS = (
+    'tomato', 'basil', 'garlic', 'lemon', 'chicken', 'beef', 'rice',
+    'noodle', 'curry', 'soup', 'salad', 'stew', 'roast', 'grilled', 'spicy',
+    'sweet', 'sour', 'crispy', 'creamy', 'smoky', 'pie', 'tart', 'bread',
+    'cake', 'pasta', 'pesto', 'ginger', 'chili', 'mushroom', 'onion',
+    'potato', 'carrot', 'pepper', 'honey', 'mustard', 'apple', 'berry',
+    'almond', 'coconut', 'mango', 'lime', 'cheese', 'bean', 'lentil',
+    'pumpkin', 'spinach', 'salmon', 'tuna', 'shrimp', 'pork',
+)
+
+
+class Rollback(Exception):
+    '''raised to discard the seeded benchmark data'''
+
+
+class Command(BaseCommand):
+    '''Django command to benchmark full-text recipe search'''
+    help = ('Seed a large recipe collection, time ranked ?q= searches '
+            'against a title ILIKE scan, then roll the data back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--query', action='append', dest='queries',
+                            help='search text, may be repeated')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        start = time.perf_counter()
+        user, = seed_recipes(
+            recipes_per_user=options['recipes'],
+            email_prefix='benchmark-search',
+            title_words=WORDS,
+            batch_size=5000,
+        )
+        self.stdout.write(f'seeded {options["recipes"]} recipes in '
+                          f'{time.perf_counter() - start:.1f}s')
+        if connection.vendor == 'postgresql':
+            # plan with statistics of the seeded rows, as autovacuum would
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        base = models.Recipe.objects.filter(user=user).order_by('-id')
+        size = options['page_size']
+        for q in options['queries'] or ['tomato', 'spicy chicken curry']:
+            cases = (
+                ('title ilike', lambda: base.filter(title__icontains=q)),
+                ('ranked search', lambda: filters.search_recipes(base, q)),
+            )
+            for label, build in cases:
+                timings = []
+                for _ in range(options['repeat']):
+                    begin = time.perf_counter()
+                    ids = list(build().values_list('id', flat=True)[:size])
+                    timings.append(time.perf_counter() - begin)
+                self.stdout.write(
+                    f'{q!r:<24} {label:<14} rows={len(ids):<6} '
+                    f'best={min(timings) * 1000:.1f}ms '
+                    f'mean={sum(timings) / len(timings) * 1000:.1f}ms')
@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.exceptions import ValidationError
+
+from core import models
+from recipe import filters, serializers
+
+
+class Command(BaseCommand):
+    '''Django command to print query plans for the main api queries'''
+    help = ('Run EXPLAIN (EXPLAIN ANALYZE on PostgreSQL) on the queries '
+            'behind the tag, ingredient and recipe endpoints for a user.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='user whose data is queried')
+        parser.add_argument('--tags', help='comma-separated tag ids')
+        parser.add_argument('--ingredients',
+                            help='comma-separated ingredient ids')
+        parser.add_argument('--page-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["email"]}')
+
+        explain_options = {}
+        if connection.vendor == 'postgresql':
+            explain_options = {'analyze': True, 'buffers': True}
+
+        for label, queryset in self.get_queries(user, options):
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
+
+    def get_queries(self, user, options):
+        '''return (label, queryset) for each query the endpoints issue'''
+        page_size = options['page_size']
+        recipes = models.Recipe.objects.filter(user=user).order_by('-id')
+        for field_name in ('tags', 'ingredients'):
+            if options[field_name]:
+                try:
+                    ids = filters.parse_ids(options[field_name], field_name)
+                except ValidationError:
+                    raise CommandError(
+                        f'--{field_name} expects comma-separated ids')
+                recipes = filters.filter_by_related(recipes, field_name, ids)
+        page_ids = list(recipes.values_list('id', flat=True)[:page_size])
+
+        queries = [
+            ('tag list', user.tags.order_by('-name')[:page_size]),
+            ('ingredient list',
+             user.ingredients.order_by('-name')[:page_size]),
+            ('recipe list', recipes[:page_size]),
+        ]
+        if not page_ids:
+            self.stdout.write(self.style.WARNING(
+                'No recipes match, skipping detail and prefetch queries.'))
+            return queries
+
+        queries.append(('recipe detail', models.Recipe.objects.filter(
+            user=user, id=page_ids[0])))
+        for prefetch in serializers.get_prefetch_plan(
+                serializers.RecipeDetailSerializer):
+            queries.append((
+                f'recipe {prefetch.prefetch_to} prefetch',
+                prefetch.queryset.filter(recipe__id__in=page_ids),
+            ))
+        return queries
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import importer
+
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+def flatten(errors, prefix=''):
+    '''yield (field, message) for nested serializer errors'''
+    if isinstance(errors, dict):
+        for key, value in errors.items():
+            yield from flatten(value, f'{prefix}.{key}' if prefix else key)
+    else:
+        for message in errors:
+            yield prefix, message
+
+
+class Command(BaseCommand):
+    '''Django command to import recipes from a CSV or NDJSON file'''
+    help = ('Import the recipes of a CSV or NDJSON file, or stdin, for a '
+            'user. Invalid rows are skipped and reported.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('path', help='file to import, - for stdin')
+        parser.add_argument('--format', choices=sorted(importer.FORMATS),
+                            help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.RECIPE_IMPORT['BATCH_SIZE'])
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["email"]}.')
+        path = options['path']
+        fmt = options['format'] or EXTENSIONS.get(
+            os.path.splitext(path)[1].lower())
+        if fmt is None:
+            raise CommandError('Cannot tell the format, pass --format.')
+
+        start = time.perf_counter()
+        stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        try:
+            result = importer.import_recipes(
+                user, stream, fmt, batch_size=options['batch_size'],
+                max_errors=sys.maxsize)
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+        elapsed = time.perf_counter() - start
+
+        for error in result['errors']:
+            for field, message in flatten(error['errors']):
+                self.stderr.write(f'row {error["row"]}: {field}: {message}')
+        rate = result['created'] / elapsed * 60 if elapsed else 0
+        self.stdout.write(
+            f'Imported {result["created"]} recipes in {elapsed:.1f}s '
+            f'({rate:.0f}/min), {result["failed"]} rows failed.')
@@ -0,0 +1,143 @@
+import asyncio
+import io
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core import tokens
+from core.benchmark import allowed_host, percentile
+from core.seed import seed_recipes
+from recipe.cache import response_cache
+
+
+class Command(BaseCommand):
+    '''Django command to load test the sync and async read endpoints'''
+    help = ('Seed a user, then drive the recipe, recipe detail and tag '
+            'read endpoints with concurrent requests through one WSGI and '
+            'one ASGI handler in this process, as one worker would, and '
+            'report requests per second and latency percentiles. Sync '
+            'lists use the fast path, like the async ones. The seeded rows '
+            'are deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=64)
+
+    def handle(self, *args, **options):
+        # seeded rows are committed, the handlers read them on other
+        # connections
+        user, = seed_recipes(recipes_per_user=options['recipes'],
+                             email_prefix='load-test')
+        timeout = response_cache.timeout
+        try:
+            # measure the views, not the response cache
+            response_cache.timeout = 0
+            with override_settings(RECIPE_FAST_LISTS=True):
+                self.run(user, options)
+        finally:
+            response_cache.timeout = timeout
+            user.delete()
+
+    def run(self, user, options):
+        token = tokens.issue(user).key
+        recipe_id = user.recipes.values_list('id', flat=True).first()
+        sync_paths = [
+            reverse('recipe:recipe-list'),
+            reverse('recipe:recipe-detail', args=[recipe_id]),
+            reverse('recipe:tag-list'),
+        ]
+        async_paths = [
+            reverse('recipe:async-recipe-list'),
+            reverse('recipe:async-recipe-detail', args=[recipe_id]),
+            reverse('recipe:async-tag-list'),
+        ]
+        modes = (
+            ('wsgi sync views', self.run_wsgi, sync_paths),
+            ('asgi sync views', self.run_asgi, sync_paths),
+            ('asgi async views', self.run_asgi, async_paths),
+        )
+        for label, run, paths in modes:
+            requests = list(itertools.islice(
+                itertools.cycle(paths), options['requests']))
+            start = time.perf_counter()
+            results = run(requests, token, options['concurrency'])
+            elapsed = time.perf_counter() - start
+            timings = sorted(timing for _, timing in results)
+            errors = sum(code != 200 for code, _ in results)
+            self.stdout.write(
+                f'{label:<17} rps={len(results) / elapsed:<8.1f} '
+                f'p50={percentile(timings, 0.5) * 1000:.1f}ms '
+                f'p99={percentile(timings, 0.99) * 1000:.1f}ms '
+                f'errors={errors}')
+
+    def run_wsgi(self, paths, token, concurrency):
+        '''return (status, seconds) of paths served by a threaded worker'''
+        handler = WSGIHandler()
+        host = allowed_host()
+
+        def request(path):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path,
+                'QUERY_STRING': '', 'SERVER_NAME': host,
+                'SERVER_PORT': '80', 'HTTP_HOST': host,
+                'HTTP_AUTHORIZATION': f'Token {token}',
+                'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+            }
+            status = []
+            begin = time.perf_counter()
+            body = handler(environ, lambda code, headers: status.append(
+                int(code.split()[0])))
+            for _ in body:
+                pass
+            body.close()
+            return status[0], time.perf_counter() - begin
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            return list(pool.map(request, paths))
+
+    def run_asgi(self, paths, token, concurrency):
+        '''return (status, seconds) of paths served by an event loop'''
+        handler = ASGIHandler()
+        host = allowed_host()
+
+        async def request(path):
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': path,
+                'query_string': b'', 'scheme': 'http',
+                'server': (host, 80), 'headers': [
+                    (b'host', host.encode()),
+                    (b'authorization', f'Token {token}'.encode()),
+                ],
+            }
+            status = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            begin = time.perf_counter()
+            await handler(scope, receive, send)
+            return status[0], time.perf_counter() - begin
+
+        async def worker(queue, results):
+            while queue:
+                results.append(await request(queue.pop()))
+
+        async def main():
+            queue = list(reversed(paths))
+            results = []
+            await asyncio.gather(*(worker(queue, results)
+                                   for _ in range(concurrency)))
+            return results
+
+        return asyncio.run(main())
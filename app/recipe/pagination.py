@@ -0,0 +1,29 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    '''keyset pagination, enabled when the client sends a page size or cursor
+
+    The cursor is built from the ordering the view already applies to its
+    queryset (eg. `-id` or `-name`), so every page is a range scan on that
+    column instead of an OFFSET scan, and rows inserted while a client is
+    paging do not shift the pages it has still to fetch.
+    '''
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        '''return None, disabling pagination, unless the client opted in'''
+        params = request.query_params
+        if (self.page_size_query_param not in params and
+                self.cursor_query_param not in params):
+            return None
+        return super().get_page_size(request)
+
+    def get_ordering(self, request, queryset, view):
+        '''return the ordering already applied to the view queryset'''
+        ordering = queryset.query.order_by
+        if ordering:
+            return tuple(ordering)
+        return super().get_ordering(request, queryset, view)
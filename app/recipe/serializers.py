@@ -1,9 +1,33 @@
+from functools import lru_cache
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from core import metrics, models, search, versioning
+
+
+class UserNameSerializer(metrics.TimedSerializerMixin,
+                         serializers.ModelSerializer):
+    '''base serializer for models whose name is unique per user'''
 
-from core import models
+    def validate_name(self, value):
+        '''reject a name the requesting user already has'''
+        request = self.context.get('request')
+        queryset = self.Meta.model.objects.filter(name=value)
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if request is not None and queryset.filter(user=request.user).exists():
+            raise serializers.ValidationError(
+                f'You already have a {self.Meta.model._meta.verbose_name} '
+                'with this name.')
+        return value
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(UserNameSerializer):
     '''serializes the Tag Model'''
     class Meta:
         model = models.Tag
@@ -11,7 +35,7 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(UserNameSerializer):
     '''serializer for Ingredient model'''
     class Meta:
         model = models.Ingredient
@@ -19,22 +43,255 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RenditionsField(serializers.ReadOnlyField):
+    '''renders {label: storage name} as {label: absolute url}'''
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for label, name in value.items():
+            url = default_storage.url(name)
+            urls[label] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    '''many related field resolving every submitted pk with one query'''
+    default_error_messages = {
+        'does_not_exist': 'Invalid pks {pk_values} - objects do not exist.',
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._resolved = {}
+
+    def to_pk(self, value):
+        '''return value as a primary key, raising TypeError or ValueError'''
+        if isinstance(value, bool):
+            raise TypeError
+        try:
+            model = self.child_relation.queryset.model
+            return model._meta.pk.to_python(value)
+        except DjangoValidationError:
+            raise ValueError
+
+    def prefetch(self, values):
+        '''resolve the valid pks among values ahead of validation'''
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.to_pk(value))
+            except (TypeError, ValueError):
+                pass
+        self.resolve(pks)
+
+    def resolve(self, pks):
+        '''return {pk: object} for the pks the child queryset contains'''
+        missing = set(pks).difference(self._resolved)
+        if missing:
+            self._resolved.update(
+                self.child_relation.get_queryset().in_bulk(missing))
+        return {pk: self._resolved[pk] for pk in pks if pk in self._resolved}
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        pks = []
+        for item in data:
+            try:
+                pks.append(self.to_pk(item))
+            except (TypeError, ValueError):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__)
+        pks = list(dict.fromkeys(pks))
+
+        found = self.resolve(pks)
+        missing = [str(pk) for pk in pks if pk not in found]
+        if missing:
+            self.fail('does_not_exist', pk_values=', '.join(missing))
+        return [found[pk] for pk in pks]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    '''primary key field limited to rows owned by the requesting user
+
+    With many=True the field validates the whole list with one query.
+    '''
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        list_kwargs.update({key: value for key, value in kwargs.items()
+                            if key in MANY_RELATION_KWARGS})
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        request = self.context.get('request')
+        if request is None:
+            return super().get_queryset().none()
+        return super().get_queryset().filter(user=request.user)
+
+
+def write_recipe_links(recipes, related, field_name, replace=False):
+    '''write the field_name m2m rows of recipes with one batched insert
+
+    related holds, for each recipe, the objects to link it to. With
+    replace, the existing links of those recipes are deleted first.
+    '''
+    field = models.Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = f'{field.m2m_field_name()}_id'
+    target = f'{field.m2m_reverse_field_name()}_id'
+
+    if replace:
+        through.objects.filter(
+            **{f'{source}__in': [recipe.pk for recipe in recipes]}).delete()
+    through.objects.bulk_create([
+        through(**{source: recipe.pk, target: pk})
+        for recipe, objs in zip(recipes, related)
+        for pk in dict.fromkeys(obj.pk for obj in objs)
+    ])
+
+
+# write-only fields taking names, and the m2m field the named objects join
+NAME_FIELDS = (('ingredient_names', 'ingredients'), ('tag_names', 'tags'))
+
+
+def resolve_names(items, user):
+    '''replace the names in items with objects, creating missing ones
+
+    Names are looked up, and missing rows created, with one batch per
+    model for all of items.
+    '''
+    for names_field, related_field in NAME_FIELDS:
+        if not any(names_field in attrs for attrs in items):
+            continue
+        model = models.Recipe._meta.get_field(related_field).related_model
+        found = model.objects.get_or_create_names(
+            user, [name for attrs in items
+                   for name in attrs.get(names_field, [])])
+        for attrs in items:
+            if names_field in attrs:
+                attrs[related_field] = list(attrs.get(related_field, [])) + [
+                    found[name] for name in attrs.pop(names_field)]
+
+
+def _as_list(value):
+    '''return value if it is a list, else an empty list'''
+    return value if isinstance(value, list) else []
+
+
+class RecipeListSerializer(metrics.TimedSerializerMixin,
+                           serializers.ListSerializer):
+    '''creates and updates many recipes with batched queries'''
+    related_fields = ('ingredients', 'tags')
+
+    def _pop_related(self, validated_data):
+        '''remove and return the m2m values present in validated_data'''
+        return {
+            name: [attrs.pop(name, None) for attrs in validated_data]
+            for name in self.related_fields
+        }
+
+    def _write_related(self, recipes, related, replace):
+        for name, values in related.items():
+            pairs = [(recipe, value) for recipe, value in zip(recipes, values)
+                     if value is not None]
+            if pairs:
+                write_recipe_links(*zip(*pairs), name, replace=replace)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            for name, field in self.child.fields.items():
+                if isinstance(field, BatchedManyRelatedField):
+                    field.prefetch(
+                        value for item in data if isinstance(item, dict)
+                        for value in _as_list(item.get(name)))
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        '''insert the recipes and their m2m rows in bulk'''
+        if validated_data:
+            resolve_names(validated_data, validated_data[0]['user'])
+        related = self._pop_related(validated_data)
+        recipes = models.Recipe.objects.bulk_create(
+            [models.Recipe(**attrs) for attrs in validated_data])
+        self._write_related(recipes, related, replace=False)
+        search.refresh_documents([recipe.pk for recipe in recipes])
+        if recipes:
+            versioning.record(recipes[0].user_id,
+                              models.ChangeLogEntry.Kind.RECIPE,
+                              [recipe.pk for recipe in recipes])
+        return recipes
+
+    def update(self, instances, validated_data):
+        '''apply validated_data to the matching instances in bulk'''
+        if instances:
+            resolve_names(validated_data, instances[0].user)
+        related = self._pop_related(validated_data)
+        now = timezone.now()
+        fields = {'updated_at'}
+        for instance, attrs in zip(instances, validated_data):
+            for attr, value in attrs.items():
+                setattr(instance, attr, value)
+            instance.updated_at = now
+            fields.update(attrs)
+        models.Recipe.objects.bulk_update(instances, sorted(fields))
+        self._write_related(instances, related, replace=True)
+        search.refresh_documents([instance.pk for instance in instances])
+        if instances:
+            versioning.record(instances[0].user_id,
+                              models.ChangeLogEntry.Kind.RECIPE,
+                              [instance.pk for instance in instances])
+        return instances
+
+
+class RecipeSerializer(metrics.TimedSerializerMixin,
+                       serializers.ModelSerializer):
     '''serializes recipe model'''
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
+        required=False,
         queryset=models.Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
+        required=False,
         queryset=models.Tag.objects.all()
     )
+    ingredient_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        write_only=True,
+        required=False
+    )
+    tag_names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        write_only=True,
+        required=False
+    )
+    image_renditions = RenditionsField()
 
     class Meta:
         model = models.Recipe
         fields = ('id', 'title', 'time_minutes',
-                  'price', 'link', 'ingredients', 'tags', 'image')
-        read_only_fields = ('id', 'image')
+                  'price', 'link', 'ingredients', 'tags', 'image',
+                  'image_status', 'image_renditions',
+                  'ingredient_names', 'tag_names')
+        read_only_fields = ('id', 'image', 'image_status')
+        list_serializer_class = RecipeListSerializer
+
+    def create(self, validated_data):
+        '''create a recipe, creating any named ingredients and tags'''
+        resolve_names([validated_data], validated_data['user'])
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        '''update a recipe, creating any named ingredients and tags'''
+        resolve_names([validated_data], instance.user)
+        return super().update(instance, validated_data)
 
 
 class RecipeDetailSerializer(RecipeSerializer):
@@ -43,9 +300,56 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
-class RecipeUploadSerializer(serializers.ModelSerializer):
+class RecipeImportSerializer(serializers.ModelSerializer):
+    '''validates one imported recipe, naming its ingredients and tags'''
+    ingredients = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False
+    )
+
+    class Meta:
+        model = models.Recipe
+        fields = ('title', 'time_minutes', 'price', 'link',
+                  'ingredients', 'tags')
+
+
+class RecipeUploadSerializer(metrics.TimedSerializerMixin,
+                             serializers.ModelSerializer):
     '''serializer for uploading recipe image'''
+    image_renditions = RenditionsField()
+
     class Meta:
         model = models.Recipe
-        fields = ('id', 'image')
-        read_only_fields = ('id',)
+        fields = ('id', 'image', 'image_status', 'image_renditions')
+        read_only_fields = ('id', 'image_status')
+
+
+@lru_cache(maxsize=None)
+def _prefetch_spec(serializer_class):
+    '''return (source, model, columns) for each to-many field rendered'''
+    serializer = serializer_class()
+    model = serializer.Meta.model
+    spec = []
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.ManyRelatedField):
+            related = model._meta.get_field(field.source).related_model
+            spec.append((field.source, related, ('id',)))
+        elif (isinstance(field, serializers.ListSerializer) and
+              isinstance(field.child, serializers.ModelSerializer)):
+            child_meta = field.child.Meta
+            spec.append((field.source, child_meta.model,
+                         tuple(child_meta.fields)))
+    return tuple(spec)
+
+
+def get_prefetch_plan(serializer_class):
+    '''return the Prefetch objects needed to render serializer_class'''
+    return [
+        Prefetch(source,
+                 queryset=related.objects.only(*columns).order_by('pk'))
+        for source, related, columns in _prefetch_spec(serializer_class)
+    ]
@@ -0,0 +1,139 @@
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import token_cache
+from core.models import Ingredient, Recipe, Tag
+from recipe.cache import response_cache
+
+# sync endpoint and its async variant
+LISTS = (
+    (reverse('recipe:recipe-list'), reverse('recipe:async-recipe-list')),
+    (reverse('recipe:tag-list'), reverse('recipe:async-tag-list')),
+    (reverse('recipe:ingredient-list'),
+     reverse('recipe:async-ingredient-list')),
+)
+
+
+def detail_urls(recipe_id):
+    '''return the sync and async detail urls of a recipe'''
+    return (reverse('recipe:recipe-detail', args=[recipe_id]),
+            reverse('recipe:async-recipe-detail', args=[recipe_id]))
+
+
+class AsyncReadViewTest(TestCase):
+    '''test suite for the async read endpoints'''
+
+    def setUp(self):
+        token_cache.clear()
+        response_cache.backend.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@domain.com', 'testPass')
+        self.token = Token.objects.create(user=self.user)
+        self.sync_client = APIClient()
+        self.sync_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.async_client = AsyncClient()
+
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Vegan', 'Été')]
+        ingredients = [Ingredient.objects.create(user=self.user, name=name)
+                       for name in ('Salt', 'Tomato', 'Basil')]
+        self.recipes = []
+        for n, title in enumerate(('Tomato soup', 'Crème 🍮', 'Plain')):
+            recipe = Recipe.objects.create(
+                user=self.user, title=title, time_minutes=n,
+                price=Decimal('1.50') * n, link=f'https://x.test/{n}')
+            recipe.tags.add(*tags[n:])
+            recipe.ingredients.add(*reversed(ingredients[:n + 1]))
+            self.recipes.append(recipe)
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            image='uploads/recipe/a.jpg', image_status='ready')
+        other = get_user_model().objects.create_user(
+            'other@domain.com', 'testPass')
+        self.other_recipe = Recipe.objects.create(
+            user=other, title='Tomato soup', time_minutes=1, price=1)
+
+    def aget(self, url, params=None, token=True):
+        '''return the async response for url with the user's token'''
+        headers = {'AUTHORIZATION': f'Token {self.token.key}'} if token \
+            else {}
+        return self.async_client.get(url, params or {}, **headers)
+
+    async def assertSameResponse(self, sync_url, async_url, params=None,
+                                 status_code=status.HTTP_200_OK,
+                                 token=True):
+        client = self.sync_client if token else APIClient()
+        sync_res = await sync_to_async(client.get)(sync_url, params)
+        async_res = await self.aget(async_url, params, token)
+
+        self.assertEqual(async_res.status_code, status_code)
+        self.assertEqual(sync_res.status_code, status_code)
+        self.assertEqual(async_res.content, sync_res.content)
+        self.assertEqual(async_res['Content-Type'], 'application/json')
+        return async_res
+
+    async def test_lists_match_sync_views(self):
+        '''test that the async lists are byte identical to the sync ones'''
+        for sync_url, async_url in LISTS:
+            await self.assertSameResponse(sync_url, async_url)
+
+    async def test_recipe_list_filters_match_sync_view(self):
+        '''test that filters and search behave like the sync list'''
+        sync_url, async_url = LISTS[0]
+        tag = await Tag.objects.aget(name='Vegan')
+        for params in ({'tags': str(tag.id)},
+                       {'tags': str(tag.id), 'tags_mode': 'all'},
+                       {'q': 'tomato'},
+                       {'q': 'nothing'}):
+            await self.assertSameResponse(sync_url, async_url, params)
+
+        await self.assertSameResponse(
+            sync_url, async_url, {'tags': str(tag.id), 'tags_mode': 'some'},
+            status_code=status.HTTP_400_BAD_REQUEST)
+
+    async def test_recipe_detail_matches_sync_view(self):
+        '''test that the async detail is byte identical to the sync one'''
+        for recipe in self.recipes:
+            await self.assertSameResponse(*detail_urls(recipe.id))
+
+    async def test_recipe_detail_not_found(self):
+        '''test that other users' recipes are not found'''
+        await self.assertSameResponse(
+            *detail_urls(self.other_recipe.id),
+            status_code=status.HTTP_404_NOT_FOUND)
+
+    async def test_authentication_required(self):
+        '''test that unauthenticated requests get the sync 401'''
+        sync_url, async_url = LISTS[0]
+        res = await self.assertSameResponse(
+            sync_url, async_url, token=False,
+            status_code=status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res['WWW-Authenticate'], 'Token')
+
+        res = await self.async_client.get(async_url,
+                                          AUTHORIZATION='Token nope')
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res.json(), {'detail': 'Invalid token.'})
+
+    async def test_token_lookup_is_cached(self):
+        '''test that a repeated token is served by the token cache'''
+        url = LISTS[1][1]
+        await self.aget(url)
+        res = await self.aget(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    async def test_pagination_rejected(self):
+        '''test that paging parameters are rejected, not ignored'''
+        res = await self.aget(LISTS[0][1], {'page_size': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,134 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase
+
+from core import models
+from core.seed import seed_recipes
+
+
+class BenchmarkCommandTest(TestCase):
+    '''test suite for the recipe benchmark commands'''
+
+    def test_benchmark_recipe_filters(self):
+        '''test that the filter benchmark reports and discards its data'''
+        out = StringIO()
+        call_command('benchmark_recipe_filters', recipes=20, repeat=1,
+                     stdout=out)
+
+        self.assertIn('exists, match all', out.getvalue())
+        self.assertFalse(models.Recipe.objects.exists())
+
+    def test_benchmark_recipe_search(self):
+        '''test that the search benchmark reports and discards its data'''
+        out = StringIO()
+        call_command('benchmark_recipe_search', recipes=20, repeat=1,
+                     queries=['tomato'], stdout=out)
+
+        self.assertIn('ranked search', out.getvalue())
+        self.assertFalse(models.Recipe.objects.exists())
+
+    def test_benchmark_recipe_lists(self):
+        '''test that the list benchmark reports and discards its data'''
+        out = StringIO()
+        call_command('benchmark_recipe_lists', sizes='3,5', repeat=1,
+                     stdout=out)
+
+        self.assertIn('rows=5       speedup', out.getvalue())
+        self.assertFalse(models.Recipe.objects.exists())
+
+    def test_explain_queries(self):
+        '''test that query plans are printed for every api query'''
+        user = seed_recipes(recipes_per_user=5)[0]
+        tag_ids = ','.join(
+            str(id) for id in user.tags.values_list('id', flat=True)[:2])
+        out = StringIO()
+        call_command('explain_queries', user.email, tags=tag_ids, stdout=out)
+
+        for label in ('tag list', 'ingredient list', 'recipe list',
+                      'recipe tags prefetch'):
+            self.assertIn(label, out.getvalue())
+
+    def test_explain_queries_no_matching_recipes(self):
+        '''test that an empty recipe page skips the id based queries'''
+        user = seed_recipes(recipes_per_user=0)[0]
+        out = StringIO()
+        call_command('explain_queries', user.email, stdout=out)
+
+        self.assertIn('recipe list', out.getvalue())
+        self.assertNotIn('recipe detail', out.getvalue())
+
+    def test_explain_queries_invalid_ids(self):
+        '''test that malformed ids fail with a command error'''
+        user = seed_recipes(recipes_per_user=0)[0]
+
+        with self.assertRaisesMessage(
+                CommandError, '--ingredients expects comma-separated ids'):
+            call_command('explain_queries', user.email, ingredients='1,x',
+                         stdout=StringIO())
+
+
+class ImportRecipesCommandTest(TestCase):
+    '''test suite for the import_recipes command'''
+
+    def setUp(self):
+        self.user = seed_recipes(recipes_per_user=0)[0]
+
+    def write(self, suffix, text):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_recipes(self):
+        '''test that valid rows are imported and invalid ones reported'''
+        path = self.write('.csv', 'title,time_minutes,price,tags\n'
+                                  'Soup,5,1.50,Quick;Cheap\n'
+                                  'Stew,-,1,Slow\n')
+        out, err = StringIO(), StringIO()
+        call_command('import_recipes', self.user.email, path, stdout=out,
+                     stderr=err)
+
+        self.assertIn('Imported 1 recipes', out.getvalue())
+        self.assertIn('1 rows failed', out.getvalue())
+        self.assertIn('row 2: time_minutes:', err.getvalue())
+        recipe = models.Recipe.objects.get(user=self.user)
+        self.assertEqual(sorted(recipe.tags.values_list('name', flat=True)),
+                         ['Cheap', 'Quick'])
+
+    def test_import_recipes_format(self):
+        '''test that the format comes from the extension or --format'''
+        text = '{"title": "Soup", "time_minutes": 5, "price": 1}\n'
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', self.user.email,
+                         self.write('.txt', text))
+
+        call_command('import_recipes', self.user.email,
+                     self.write('.txt', text), format='ndjson',
+                     stdout=StringIO())
+        self.assertEqual(models.Recipe.objects.count(), 1)
+
+    def test_import_recipes_unknown_user(self):
+        '''test that an unknown email is an error'''
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', 'nobody@example.com',
+                         self.write('.csv', ''))
+
+
+class LoadTestCommandTest(TransactionTestCase):
+    '''test suite for the read api load test command'''
+
+    def test_load_test_read_api(self):
+        '''test that every mode is reported and the seed is removed'''
+        out = StringIO()
+        call_command('load_test_read_api', recipes=3, requests=6,
+                     concurrency=2, stdout=out)
+
+        for label in ('wsgi sync views', 'asgi sync views',
+                      'asgi async views'):
+            self.assertIn(label, out.getvalue())
+        self.assertEqual(out.getvalue().count('errors=0'), 3)
+        self.assertFalse(models.Recipe.objects.exists())
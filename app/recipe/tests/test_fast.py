@@ -0,0 +1,136 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.cache import response_cache
+from recipe.fast import FastJSONRenderer
+
+RECIPE_LIST_URL = reverse('recipe:recipe-list')
+TAG_LIST_URL = reverse('recipe:tag-list')
+INGREDIENT_LIST_URL = reverse('recipe:ingredient-list')
+
+TITLES = (
+    'Plain soup',
+    'Crème brûlée 🍮',
+    'Quotes " and \\ backslash / slash',
+    'Control \x01\x1f\x7f\n\t\b\f\r chars',
+    'Separators   and  ',
+    '<script>&amp;</script>',
+)
+
+
+class FastListTest(TestCase):
+    '''test suite proving the fast list path matches the serializers'''
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@domain.com', 'testPass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Zesty', 'Été', 'Main  ')]
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Salt', 'Pepper', 'Crème', 'Tab\there')]
+        prices = (Decimal('0'), Decimal('999.99'), Decimal('1.5'),
+                  Decimal('10.00'), Decimal('0.01'), Decimal('42'))
+        for n, (title, price) in enumerate(zip(TITLES, prices)):
+            recipe = Recipe.objects.create(
+                user=self.user, title=title, time_minutes=n * 7,
+                price=price, link='' if n % 2 else f'https://x.test/{n}')
+            recipe.tags.add(*reversed(tags[:n % 4]))
+            recipe.ingredients.add(*ingredients[n % 3:][::-1])
+        Recipe.objects.filter(title='Plain soup').update(
+            image='uploads/recipe/a b.jpg', image_status='ready',
+            image_renditions={'small': 'uploads/recipe/renditions/s.jpg'})
+
+        other = get_user_model().objects.create_user(
+            'user2@domain.com', 'testPass')
+        Recipe.objects.create(user=other, title='Plain soup',
+                              time_minutes=1, price=1)
+
+    def get(self, url, params=None, **headers):
+        '''return the response body for url on both list paths'''
+        bodies = []
+        for enabled in (False, True):
+            response_cache.backend.clear()
+            with override_settings(RECIPE_FAST_LISTS=enabled):
+                res = self.client.get(url, params, **headers)
+            self.assertEqual(res.status_code, 200)
+            bodies.append(res.content)
+        return bodies
+
+    def assertSameOutput(self, url, params=None, **headers):
+        slow, fast = self.get(url, params, **headers)
+        self.assertEqual(fast, slow)
+        return fast
+
+    def test_recipe_list(self):
+        '''test that recipe lists are byte identical'''
+        body = self.assertSameOutput(RECIPE_LIST_URL)
+
+        self.assertIn(b'http://testserver/media/uploads/recipe/a%20b.jpg',
+                      body)
+        self.assertIn(b'\\u2028', body)
+
+    def test_recipe_list_filtered(self):
+        '''test that filtered and searched lists are byte identical'''
+        tag, ingredient = Tag.objects.first(), Ingredient.objects.first()
+        for params in ({'tags': tag.id},
+                       {'ingredients': ingredient.id, 'tags': tag.id,
+                        'tags_mode': 'all'},
+                       {'q': 'soup'},
+                       {'q': 'no match'}):
+            self.assertSameOutput(RECIPE_LIST_URL, params)
+
+    def test_name_lists(self):
+        '''test that tag and ingredient lists are byte identical'''
+        self.assertSameOutput(TAG_LIST_URL)
+        self.assertSameOutput(INGREDIENT_LIST_URL)
+
+    def test_other_renderers_use_serializers(self):
+        '''test that indented, browsable and paged output is unchanged'''
+        self.assertSameOutput(
+            RECIPE_LIST_URL, HTTP_ACCEPT='application/json; indent=4')
+        self.assertSameOutput(RECIPE_LIST_URL, {'page_size': 2})
+
+        with override_settings(RECIPE_FAST_LISTS=True):
+            res = self.client.get(TAG_LIST_URL, HTTP_ACCEPT='text/html')
+        self.assertNotIsInstance(res.accepted_renderer, FastJSONRenderer)
+
+    @override_settings(RECIPE_FAST_LISTS=True)
+    def test_fast_list_query_count(self):
+        '''test that the fast path does not query per recipe'''
+        response_cache.backend.clear()
+        # version, rows and, without array subqueries, two link queries
+        with self.assertNumQueries(4 if self.uses_link_queries() else 2):
+            self.client.get(RECIPE_LIST_URL)
+
+    def uses_link_queries(self):
+        return connection.vendor != 'postgresql'
+
+
+class FastJSONRendererTest(TestCase):
+    '''test suite for the orjson backed renderer'''
+
+    def test_matches_json_renderer(self):
+        '''test that the rendered bytes match JSONRenderer'''
+        data = [{'title': title, 'id': n, 'none': None, 'list': [1, 2],
+                 'flag': True} for n, title in enumerate(TITLES)]
+
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+
+    def test_unsupported_data_falls_back(self):
+        '''test that data orjson rejects is rendered by json'''
+        data = {'price': Decimal('1.50')}
+
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
@@ -4,10 +4,12 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core.autocomplete import name_index
 from core.models import Ingredient
 from recipe.serializers import IngredientSerializer
 
 INGREDIENT_LIST_URL = reverse('recipe:ingredient-list')
+INGREDIENT_AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
 
 
 def create_sample_user(email='test@domain.com', password='testPass'):
@@ -82,3 +84,26 @@ class PrivateIngredientAPITest(TestCase):
         res = self.client.post(INGREDIENT_LIST_URL, {'name': ''})
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IngredientAutocompleteTest(TestCase):
+    '''test suite for ingredient name autocomplete'''
+
+    def setUp(self):
+        name_index.clear()
+        self.client = APIClient()
+        self.user = create_sample_user()
+        self.client.force_authenticate(self.user)
+
+    def test_names_created_with_recipes_are_suggested(self):
+        '''test that names created in bulk reach the cached index'''
+        create_ingredient(user=self.user, name='Garlic')
+        self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {'q': 'ga'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.get_or_create_names(
+                self.user, ['Garam masala', 'Rice'])
+        res = self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {'q': 'ga'})
+
+        self.assertEqual([item['name'] for item in res.data],
+                         ['Garam masala', 'Garlic'])
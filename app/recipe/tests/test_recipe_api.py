@@ -1,17 +1,30 @@
+import io
+import json
 import tempfile
 import os
+import threading
+from unittest.mock import patch
 from PIL import Image
 
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Recipe, Ingredient, Tag
+from recipe import images, thumbnails
+from recipe.cache import ResponseCache, response_cache
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 RECIPE_LIST_URL = reverse('recipe:recipe-list')
+RECIPE_BULK_URL = reverse('recipe:recipe-bulk-create')
+RECIPE_EXPORT_URL = reverse('recipe:recipe-export')
+RECIPE_IMPORT_URL = reverse('recipe:recipe-import-recipes')
 
 
 def compute_recipe_detail_url(recipe_id):
@@ -24,6 +37,11 @@ def compute_recipe_image_upload_url(recipe_id):
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
 
+def compute_recipe_image_variant_url(recipe_id):
+    '''compute and return a recipe image variant url'''
+    return reverse('recipe:recipe-image-variant', args=[recipe_id])
+
+
 def create_sample_user(**params):
     '''create and return a test user'''
     defaults = {
@@ -175,6 +193,88 @@ class PrivateRecipeAPITest(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2,  ingredients)
 
+    def test_create_recipe_validates_ids_in_one_query(self):
+        '''test that related ids are checked with a query per field'''
+        counts = []
+        for size in (1, 40):
+            ingredients = [
+                create_sample_ingredient(user=self.user, name=f'{size}-{n}')
+                for n in range(size)
+            ]
+            payload = {
+                'title': 'test recipe', 'time_minutes': 5, 'price': 4.00,
+                'ingredients': [item.id for item in ingredients], 'tags': [],
+            }
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(RECIPE_LIST_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_create_recipe_rejects_other_users_ids(self):
+        '''test that related ids must belong to the requesting user'''
+        other = create_sample_user(email='user2@domain.com')
+        mine = create_sample_tag(user=self.user)
+        theirs = create_sample_tag(user=other)
+        payload = {
+            'title': 'test recipe', 'time_minutes': 5, 'price': 4.00,
+            'tags': [mine.id, theirs.id, 999999], 'ingredients': [],
+        }
+
+        res = self.client.post(RECIPE_LIST_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(f'{theirs.id}, 999999', str(res.data['tags'][0]))
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_create_recipe_invalid_id_type(self):
+        '''test that non integer ids are rejected'''
+        payload = {
+            'title': 'test recipe', 'time_minutes': 5, 'price': 4.00,
+            'tags': ['abc'], 'ingredients': [],
+        }
+
+        res = self.client.post(RECIPE_LIST_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+
+    def test_create_recipe_with_names(self):
+        '''test creating a recipe with ingredients and tags by name'''
+        salt = create_sample_ingredient(user=self.user, name='Salt')
+        beef = create_sample_tag(user=self.user, name='Beef')
+        payload = {
+            'title': 'Pepper soup', 'time_minutes': 30, 'price': '8.00',
+            'ingredient_names': ['Salt', 'Pepper', 'Pepper'],
+            'tags': [beef.id], 'tag_names': ['Spicy'],
+        }
+
+        res = self.client.post(RECIPE_LIST_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(
+            sorted(recipe.ingredients.values_list('name', flat=True)),
+            ['Pepper', 'Salt'])
+        self.assertEqual(sorted(recipe.tags.values_list('name', flat=True)),
+                         ['Beef', 'Spicy'])
+        self.assertIn(salt.id, res.data['ingredients'])
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 2)
+        self.assertNotIn('ingredient_names', res.data)
+
+    def test_update_recipe_tags_by_name(self):
+        '''test that tag_names replaces the tags of a recipe'''
+        recipe = create_sample_recipe(user=self.user)
+        recipe.tags.add(create_sample_tag(user=self.user, name='Old'))
+
+        res = self.client.patch(compute_recipe_detail_url(recipe.id),
+                                {'tag_names': ['New']}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(recipe.tags.values_list('name', flat=True)),
+                         ['New'])
+
     def test_update_recipe_patch(self):
         '''test updating recipe through http patch'''
         recipe = create_sample_recipe(user=self.user)
@@ -219,6 +319,19 @@ class PrivateRecipeAPITest(TestCase):
         self.assertEqual(len(tags), 0)
         self.assertEqual(len(ingredients), 0)
 
+    def test_update_recipe_put_keeps_omitted_links(self):
+        '''test that a json put without tags or ingredients keeps them'''
+        recipe = create_sample_recipe(user=self.user)
+        tag = create_sample_tag(user=self.user)
+        recipe.tags.add(tag)
+        payload = {'title': 'Nsala Soup', 'time_minutes': 60, 'price': '9.00'}
+
+        res = self.client.put(compute_recipe_detail_url(recipe.id), payload,
+                              format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(recipe.tags.all()), [tag])
+
     def test_filter_recipe_by_tags(self):
         '''test the functionality of filtering recipe by tag'''
         recipe1 = create_sample_recipe(user=self.user, title='recipe1')
@@ -269,7 +382,762 @@ class PrivateRecipeAPITest(TestCase):
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
 
+    def test_filter_recipe_returns_each_recipe_once(self):
+        '''test that recipes matching several filter ids are not repeated'''
+        recipe = create_sample_recipe(user=self.user)
+        tags = [create_sample_tag(user=self.user, name=f'tag{n}')
+                for n in range(2)]
+        ingredients = [create_sample_ingredient(user=self.user, name=f'i{n}')
+                       for n in range(2)]
+        recipe.tags.add(*tags)
+        recipe.ingredients.add(*ingredients)
+
+        res = self.client.get(RECIPE_LIST_URL, {
+            'tags': ','.join(str(tag.id) for tag in tags),
+            'ingredients': ','.join(str(item.id) for item in ingredients),
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [recipe.id])
+
+    def test_filter_recipe_by_all_tags(self):
+        '''test that tags_mode=all only returns recipes with every tag'''
+        tag1 = create_sample_tag(user=self.user, name='tag1')
+        tag2 = create_sample_tag(user=self.user, name='tag2')
+        both = create_sample_recipe(user=self.user, title='both')
+        both.tags.add(tag1, tag2)
+        one = create_sample_recipe(user=self.user, title='one')
+        one.tags.add(tag1)
+
+        res = self.client.get(RECIPE_LIST_URL, {
+            'tags': f'{tag1.id},{tag2.id}', 'tags_mode': 'all'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [both.id])
+
+    def test_filter_recipe_by_all_ingredients(self):
+        '''test that ingredients_mode=all combines with the tag filter'''
+        tag = create_sample_tag(user=self.user)
+        item1 = create_sample_ingredient(user=self.user, name='item1')
+        item2 = create_sample_ingredient(user=self.user, name='item2')
+        match = create_sample_recipe(user=self.user, title='match')
+        match.tags.add(tag)
+        match.ingredients.add(item1, item2)
+        untagged = create_sample_recipe(user=self.user, title='untagged')
+        untagged.ingredients.add(item1, item2)
+
+        res = self.client.get(RECIPE_LIST_URL, {
+            'tags': str(tag.id),
+            'ingredients': f'{item1.id},{item2.id}',
+            'ingredients_mode': 'all',
+        })
+
+        self.assertEqual([r['id'] for r in res.data], [match.id])
+
+    def test_filter_recipe_invalid_mode(self):
+        '''test that an unknown filter mode is rejected'''
+        res = self.client.get(RECIPE_LIST_URL,
+                              {'tags': '1', 'tags_mode': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data,
+                         {'tags_mode': ['Must be one of: any, all']})
+
+    def test_filter_recipe_invalid_ids(self):
+        '''test that malformed filter ids are rejected'''
+        for params in ({'tags': 'abc'}, {'ingredients': '1,,2'}):
+            res = self.client.get(RECIPE_LIST_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(res.data, {
+                next(iter(params)): ['Expected comma-separated ids.']})
+
+    def test_recipe_listing_query_count_is_constant(self):
+        '''test that listing recipes does not issue a query per recipe'''
+        tag = create_sample_tag(user=self.user)
+        ingredient = create_sample_ingredient(user=self.user)
+        for count in (1, 10):
+            for _ in range(count):
+                recipe = create_sample_recipe(user=self.user)
+                recipe.tags.add(tag)
+                recipe.ingredients.add(ingredient)
+
+            # collection version, recipes, tags and ingredients
+            with self.assertNumQueries(4):
+                res = self.client.get(RECIPE_LIST_URL)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_recipe_detail_query_count(self):
+        '''test that recipe detail loads nested objects in bulk'''
+        recipe = create_sample_recipe(user=self.user)
+        for name in ('Beef', 'Vegan', 'Dessert'):
+            recipe.tags.add(create_sample_tag(user=self.user, name=name))
+            recipe.ingredients.add(
+                create_sample_ingredient(user=self.user, name=name))
+
+        # updated_at, recipe, tags and ingredients
+        with self.assertNumQueries(4):
+            res = self.client.get(compute_recipe_detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 3)
+
+    def test_recipe_listing_not_paginated_by_default(self):
+        '''test that recipes are returned as a plain list by default'''
+        create_sample_recipe(user=self.user)
+
+        res = self.client.get(RECIPE_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(res.data, list)
+
+    def test_recipe_listing_cursor_pagination(self):
+        '''test that recipe pages follow the -id ordering'''
+        recipes = [create_sample_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPE_LIST_URL, {'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+        self.assertEqual([r['id'] for r in res.data['results']],
+                         [recipes[4].id, recipes[3].id])
+
+        create_sample_recipe(user=self.user, title='inserted')
+        res = self.client.get(res.data['next'])
+        self.assertEqual([r['id'] for r in res.data['results']],
+                         [recipes[2].id, recipes[1].id])
+
+        res = self.client.get(res.data['next'])
+        self.assertEqual([r['id'] for r in res.data['results']],
+                         [recipes[0].id])
+        self.assertIsNone(res.data['next'])
+        self.assertIsNotNone(res.data['previous'])
+
+    def test_recipe_cursor_pagination_with_filters(self):
+        '''test that paginated recipes honour the tag filter'''
+        tag = create_sample_tag(user=self.user)
+        tagged = []
+        for _ in range(3):
+            recipe = create_sample_recipe(user=self.user)
+            recipe.tags.add(tag)
+            tagged.append(recipe.id)
+            create_sample_recipe(user=self.user)
+
+        res = self.client.get(
+            RECIPE_LIST_URL, {'tags': str(tag.id), 'page_size': 2})
+        ids = [r['id'] for r in res.data['results']]
+        res = self.client.get(res.data['next'])
+        ids += [r['id'] for r in res.data['results']]
+
+        self.assertEqual(ids, sorted(tagged, reverse=True))
+        self.assertIsNone(res.data['next'])
+
+
+class RecipeSearchAPITest(TestCase):
+    '''test suite for full-text recipe search'''
+
+    def setUp(self):
+        self.user = create_sample_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, q, **params):
+        res = self.client.get(RECIPE_LIST_URL, {'q': q, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_search_title_ingredients_and_tags(self):
+        '''test that q matches titles, ingredient and tag names'''
+        soup = create_sample_recipe(user=self.user, title='Tomato soup')
+        salad = create_sample_recipe(user=self.user, title='Green salad')
+        salad.ingredients.add(create_sample_ingredient(self.user, 'Tomato'))
+        stew = create_sample_recipe(user=self.user, title='Bean stew')
+        stew.tags.add(create_sample_tag(self.user, 'Tomato based'))
+        create_sample_recipe(user=self.user, title='Pancakes')
+
+        ids = [recipe['id'] for recipe in self.search('tomato')]
+
+        self.assertEqual(ids, [soup.id, salad.id, stew.id])
+
+    def test_search_requires_every_term(self):
+        '''test that all terms of q must match'''
+        soup = create_sample_recipe(user=self.user, title='Tomato soup')
+        create_sample_recipe(user=self.user, title='Tomato salad')
+
+        ids = [recipe['id'] for recipe in self.search('tomato soup')]
+
+        self.assertEqual(ids, [soup.id])
+
+    def test_search_limited_to_user(self):
+        '''test that other users' recipes are never returned'''
+        other = create_sample_user(email='user2@domain.com')
+        create_sample_recipe(user=other, title='Tomato soup')
+
+        self.assertEqual(self.search('tomato'), [])
+
+    def test_search_combines_with_filters(self):
+        '''test that q and tag filters apply together'''
+        tag = create_sample_tag(self.user, 'Dinner')
+        soup = create_sample_recipe(user=self.user, title='Tomato soup')
+        soup.tags.add(tag)
+        create_sample_recipe(user=self.user, title='Tomato salad')
+
+        ids = [recipe['id'] for recipe in self.search(
+            'tomato', tags=str(tag.id))]
+
+        self.assertEqual(ids, [soup.id])
+
+    def test_search_paginated(self):
+        '''test that ranked results can be paged with a cursor'''
+        for n in range(5):
+            create_sample_recipe(user=self.user, title=f'Tomato dish {n}')
+
+        page = self.search('tomato', page_size=2)
+        ids = [recipe['id'] for recipe in page['results']]
+        while page['next']:
+            page = self.client.get(page['next']).data
+            ids += [recipe['id'] for recipe in page['results']]
+
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_bulk_created_recipes_are_searchable(self):
+        '''test that bulk writes maintain the search documents'''
+        payload = [
+            {'title': 'Tomato soup', 'time_minutes': 10, 'price': '1.00'},
+            {'title': 'Pancakes', 'time_minutes': 10, 'price': '1.00',
+             'tag_names': ['Tomato free']},
+        ]
+        res = self.client.post(RECIPE_BULK_URL, payload, format='json')
+
+        ids = [recipe['id'] for recipe in self.search('tomato')]
+
+        self.assertEqual(ids, [res.data[0]['id'], res.data[1]['id']])
+
+
+class ConditionalRecipeAPITest(TestCase):
+    '''test suite for conditional GETs of recipes'''
+
+    def setUp(self):
+        self.user = create_sample_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = create_sample_recipe(user=self.user)
+
+    def assertNotModified(self, url, res):
+        '''assert that url answers 304 to the validators of res'''
+        with self.assertNumQueries(1):
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(again['ETag'], res['ETag'])
+
+    def test_list_not_modified(self):
+        '''test that an unchanged list answers 304 with one query'''
+        res = self.client.get(RECIPE_LIST_URL)
+
+        self.assertIn('Last-Modified', res)
+        self.assertNotModified(RECIPE_LIST_URL, res)
+
+        res = self.client.get(RECIPE_LIST_URL,
+                              HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_etag_depends_on_query(self):
+        '''test that each query string has its own etag'''
+        res = self.client.get(RECIPE_LIST_URL)
+        other = self.client.get(RECIPE_LIST_URL, {'q': 'test'})
+
+        self.assertNotEqual(res['ETag'], other['ETag'])
+
+    def test_list_modified_by_writes(self):
+        '''test that recipe, link and name changes change the etag'''
+        tag = create_sample_tag(user=self.user)
+        etags = {self.client.get(RECIPE_LIST_URL)['ETag']}
+
+        for write in (
+            lambda: self.recipe.tags.add(tag),
+            lambda: Tag.objects.filter(pk=tag.pk).first().delete(),
+            lambda: self.client.patch(
+                compute_recipe_detail_url(self.recipe.id), {'title': 'x'}),
+            lambda: self.client.delete(
+                compute_recipe_detail_url(self.recipe.id)),
+        ):
+            write()
+            etags.add(self.client.get(RECIPE_LIST_URL)['ETag'])
+
+        self.assertEqual(len(etags), 5)
+
+    def test_detail_not_modified(self):
+        '''test that an unchanged recipe answers 304 with one query'''
+        url = compute_recipe_detail_url(self.recipe.id)
+        res = self.client.get(url)
+
+        self.assertNotModified(url, res)
+
+    def test_detail_invalid_id(self):
+        '''test that a non-integer recipe id returns 404'''
+        res = self.client.get(compute_recipe_detail_url('abc'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_detail_modified_by_tag_rename(self):
+        '''test that renaming a linked tag changes the recipe etag'''
+        tag = create_sample_tag(user=self.user, name='Main')
+        self.recipe.tags.add(tag)
+        url = compute_recipe_detail_url(self.recipe.id)
+        res = self.client.get(url)
+
+        tag.name = 'Dessert'
+        tag.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'Dessert')
+
+    def test_missing_recipe_not_found(self):
+        '''test that conditional requests for unknown recipes 404'''
+        res = self.client.get(compute_recipe_detail_url(0),
+                              HTTP_IF_NONE_MATCH='*')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_writes_bump_version_once(self):
+        '''test that a bulk request advances the version by one'''
+        for _ in range(2):
+            create_sample_recipe(user=self.user)
+        version = self.user.collection_version.version
+        ids = ','.join(str(pk) for pk in self.user.recipes.values_list(
+            'id', flat=True))
+
+        self.client.delete(f'{RECIPE_BULK_URL}?ids={ids}')
+
+        self.user.collection_version.refresh_from_db()
+        self.assertEqual(self.user.collection_version.version, version + 1)
+
+
+class RecipeResponseCacheTest(TestCase):
+    '''test suite for the recipe response cache'''
+
+    def setUp(self):
+        response_cache.backend.clear()
+        response_cache.clear_stats()
+        self.user = create_sample_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = create_sample_recipe(user=self.user)
+        self.recipe.tags.add(create_sample_tag(user=self.user))
+        self.url = compute_recipe_detail_url(self.recipe.id)
+
+    def test_detail_served_from_cache(self):
+        '''test that a repeated read skips the query and serializer'''
+        res = self.client.get(self.url)
+        self.assertEqual(res['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url)
+
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertEqual(cached.content, res.content)
+        self.assertEqual(response_cache.stats(),
+                         {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_list_cached_per_query(self):
+        '''test that list entries are keyed by their query string'''
+        self.client.get(RECIPE_LIST_URL)
+        res = self.client.get(RECIPE_LIST_URL, {'q': 'nothing'})
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data, [])
+        self.assertEqual(
+            self.client.get(RECIPE_LIST_URL)['X-Cache'], 'HIT')
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'other.example.com'])
+    def test_cached_per_host_and_scheme(self):
+        '''test that responses with absolute urls are kept per origin'''
+        res = self.client.get(self.url)
+
+        for extra in ({'HTTP_HOST': 'other.example.com'}, {'secure': True}):
+            other = self.client.get(self.url, **extra)
+            self.assertEqual(other['X-Cache'], 'MISS')
+            self.assertNotEqual(other['ETag'], res['ETag'])
+
+    def test_writes_invalidate(self):
+        '''test that api and model writes make cached entries stale'''
+        self.client.get(RECIPE_LIST_URL)
+        self.client.get(self.url)
+
+        self.client.patch(self.url, {'title': 'Renamed'})
+        res = self.client.get(self.url)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['title'], 'Renamed')
+
+        Tag.objects.filter(user=self.user).first().delete()
+        res = self.client.get(RECIPE_LIST_URL)
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data[0]['tags'], [])
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'shared'},
+    })
+    def test_shared_backend(self):
+        '''test that entries round trip through another cache alias'''
+        shared = ResponseCache(alias='shared')
+        self.client.get(self.url)
+
+        with patch('recipe.conditional.response_cache', shared):
+            self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+            res = self.client.get(self.url)
 
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(shared.stats()['hits'], 1)
+
+
+class RecipeExportAPITest(TestCase):
+    '''test suite for the streaming recipe export'''
+
+    def setUp(self):
+        self.user = create_sample_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        tag = create_sample_tag(user=self.user)
+        ingredient = create_sample_ingredient(user=self.user)
+        self.recipes = []
+        for n in range(5):
+            recipe = create_sample_recipe(user=self.user, title=f'Dish {n}')
+            recipe.tags.add(tag)
+            if n % 2:
+                recipe.ingredients.add(ingredient)
+            self.recipes.append(recipe)
+        create_sample_recipe(user=create_sample_user(email='o@domain.com'))
+
+    def export(self, params=None):
+        res = self.client.get(RECIPE_EXPORT_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        return res, b''.join(res.streaming_content)
+
+    def expected(self):
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        return RecipeDetailSerializer(recipes, many=True, context={
+            'request': None}).data
+
+    def test_export_ndjson(self):
+        '''test that every recipe is streamed as one JSON line'''
+        res, body = self.export()
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        self.assertIn('recipes.ndjson', res['Content-Disposition'])
+        lines = body.decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         json.loads(json.dumps(self.expected())))
+
+    def test_export_json_array(self):
+        '''test that ?output=json streams one JSON array'''
+        for chunk_size in (2, 5, 500):
+            with override_settings(RECIPE_EXPORT_CHUNK_SIZE=chunk_size):
+                res, body = self.export({'output': 'json'})
+
+            self.assertEqual(res['Content-Type'], 'application/json')
+            self.assertEqual(json.loads(body),
+                             json.loads(json.dumps(self.expected())))
+
+    def test_export_empty(self):
+        '''test exporting a user without recipes'''
+        Recipe.objects.filter(user=self.user).delete()
+
+        self.assertEqual(self.export()[1], b'')
+        self.assertEqual(self.export({'output': 'json'})[1], b'[]')
+
+    def test_export_filters(self):
+        '''test that the list filters apply to the export'''
+        ingredient = Ingredient.objects.get(user=self.user)
+        body = self.export({'ingredients': ingredient.id})[1]
+
+        ids = [json.loads(line)['id'] for line in body.splitlines()]
+        self.assertEqual(ids, [self.recipes[1].id, self.recipes[3].id])
+
+    def test_export_invalid_output(self):
+        '''test that an unknown ?output= is rejected'''
+        res = self.client.get(RECIPE_EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_prefetches_per_chunk(self):
+        '''test that related rows are loaded once per chunk of recipes'''
+        res = self.client.get(RECIPE_EXPORT_URL)
+
+        # the recipe query, then tags and ingredients for each of 3 chunks
+        with self.assertNumQueries(7):
+            body = b''.join(res.streaming_content)
+        self.assertEqual(len(body.splitlines()), 5)
+
+
+class RecipeImportAPITest(TestCase):
+    '''test suite for importing recipes from CSV and NDJSON'''
+
+    def setUp(self):
+        self.user = create_sample_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = create_sample_tag(user=self.user, name='Dinner')
+
+    def post(self, body, content_type):
+        if isinstance(body, str):
+            body = body.encode()
+        res = self.client.post(RECIPE_IMPORT_URL, body,
+                               content_type=content_type)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_import_csv(self):
+        '''test importing recipes with named ingredients and tags'''
+        body = (
+            'title,time_minutes,price,link,ingredients,tags\r\n'
+            'Soup,10,4.50,,Salt;Water;Salt,Dinner;Cheap\r\n'
+            '"Pie, apple",45,12,https://pie.test,"Apple; Flour",\r\n'
+        )
+        result = self.post(body, 'text/csv')
+
+        self.assertEqual(result, {'created': 2, 'failed': 0, 'errors': []})
+        soup = Recipe.objects.get(user=self.user, title='Soup')
+        self.assertEqual(str(soup.price), '4.50')
+        self.assertEqual(soup.link, '')
+        self.assertEqual(soup.image_status, '')
+        self.assertEqual(soup.image_renditions, {})
+        self.assertFalse(soup.image)
+        self.assertEqual(sorted(soup.ingredients.values_list(
+            'name', flat=True)), ['Salt', 'Water'])
+        self.assertIn(self.tag, soup.tags.all())
+        self.assertEqual(soup.tags.count(), 2)
+        pie = Recipe.objects.get(user=self.user, title='Pie, apple')
+        self.assertEqual(sorted(pie.ingredients.values_list(
+            'name', flat=True)), ['Apple', 'Flour'])
+        self.assertEqual(pie.link, 'https://pie.test')
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_imported_recipes_are_listed_and_searchable(self):
+        '''test that imports update the list version and search'''
+        etag = self.client.get(RECIPE_LIST_URL)['ETag']
+        self.post('{"title": "Tomato soup", "time_minutes": 5, '
+                  '"price": "2.00", "ingredients": ["Basil"]}\n',
+                  'application/x-ndjson')
+
+        res = self.client.get(RECIPE_LIST_URL, {'q': 'basil'})
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual([recipe['title'] for recipe in res.data],
+                         ['Tomato soup'])
+
+    def test_import_reports_invalid_rows(self):
+        '''test that invalid rows are reported and valid ones imported'''
+        body = '\n'.join((
+            '{"title": "Good", "time_minutes": 5, "price": "1.00"}',
+            '{"title": "", "time_minutes": "soon", "price": "1.00"}',
+            '',
+            'not json',
+            '[1, 2]',
+            '{"title": "Bad tag", "time_minutes": 1, "price": 1, '
+            '"tags": ["' + 'x' * 256 + '"]}',
+            '{"title": "Good too", "time_minutes": 5, "price": 1000}',
+        ))
+        result = self.post(body, 'application/x-ndjson')
+
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['failed'], 5)
+        errors = {error['row']: error['errors']
+                  for error in result['errors']}
+        self.assertEqual(sorted(errors), [2, 4, 5, 6, 7])
+        self.assertEqual(set(errors[2]), {'title', 'time_minutes'})
+        self.assertIn('non_field_errors', errors[4])
+        self.assertIn('non_field_errors', errors[5])
+        self.assertIn('tags', errors[6])
+        self.assertIn('price', errors[7])
+        self.assertEqual(
+            list(Recipe.objects.values_list('title', flat=True)), ['Good'])
+
+    @override_settings(RECIPE_IMPORT={'BATCH_SIZE': 2, 'MAX_ERRORS': 1})
+    def test_import_batches(self):
+        '''test that rows are loaded in batches and errors capped'''
+        rows = ['title,time_minutes,price,tags']
+        rows += [f'Dish {n},{n},1,Dinner;Tag {n % 2}' for n in range(5)]
+        rows += ['Bad,x,1', 'Worse,y,1']
+        result = self.post('\n'.join(rows), 'text/csv')
+
+        self.assertEqual(result['created'], 5)
+        self.assertEqual(result['failed'], 2)
+        self.assertEqual(len(result['errors']), 1)
+        self.assertEqual(Recipe.objects.filter(tags=self.tag).count(), 5)
+        self.assertEqual(
+            Tag.objects.filter(user=self.user).count(), 3)
+
+    def test_import_invalid_utf8(self):
+        '''test that undecodable input stops the import with an error'''
+        body = b'title,time_minutes,price\nOk,1,1\n\xff\xfe,1,1\n'
+        result = self.post(body, 'text/csv')
+
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['errors'][0]['row'], 2)
+
+    def test_import_requires_body(self):
+        '''test that empty and unsupported bodies are rejected'''
+        res = self.client.post(RECIPE_IMPORT_URL, b'',
+                               content_type='text/csv')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(RECIPE_IMPORT_URL, [], format='json')
+        self.assertEqual(res.status_code,
+                         status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+
+class BulkRecipeAPITest(TestCase):
+    '''test suite for the recipe bulk endpoints'''
+
+    def setUp(self):
+        self.user = create_sample_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_recipes(self):
+        '''test creating several recipes with their links at once'''
+        tag = create_sample_tag(user=self.user)
+        ingredient = create_sample_ingredient(user=self.user)
+        payload = [
+            {'title': 'Jollof', 'time_minutes': 40, 'price': '5.50',
+             'tags': [tag.id], 'ingredients': [ingredient.id]},
+            {'title': 'Suya', 'time_minutes': 20, 'price': '3.00',
+             'tags': [tag.id], 'ingredients': []},
+        ]
+
+        res = self.client.post(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['title'] for r in res.data], ['Jollof', 'Suya'])
+        self.assertEqual(res.data[0]['ingredients'], [ingredient.id])
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 2)
+        self.assertEqual(recipes.filter(tags=tag).count(), 2)
+
+    def test_bulk_create_query_count_is_constant(self):
+        '''test that the batch size does not change the query count'''
+        tags = [create_sample_tag(user=self.user, name=f'tag{n}')
+                for n in range(3)]
+        counts = []
+        for size in (2, 6):
+            payload = [
+                {'title': f'recipe {n}', 'time_minutes': 10, 'price': '1.00',
+                 'tags': [tag.id for tag in tags], 'ingredients': []}
+                for n in range(size)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.post(RECIPE_BULK_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bulk_create_recipes_with_names(self):
+        '''test that names shared by a batch are created once'''
+        payload = [
+            {'title': f'recipe {n}', 'time_minutes': 10, 'price': '1.00',
+             'tag_names': ['Quick'], 'ingredient_names': ['Rice', f'x{n}']}
+            for n in range(3)
+        ]
+
+        res = self.client.post(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        quick = Tag.objects.get(user=self.user, name='Quick')
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 4)
+        self.assertEqual([r['tags'] for r in res.data], [[quick.id]] * 3)
+
+    def test_bulk_create_reports_item_errors(self):
+        '''test that an invalid item rejects the whole batch'''
+        payload = [
+            {'title': 'Jollof', 'time_minutes': 40, 'price': '5.50',
+             'tags': [], 'ingredients': []},
+            {'title': 'Suya', 'price': '3.00', 'tags': [], 'ingredients': []},
+        ]
+
+        res = self.client.post(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('time_minutes', res.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(RECIPE_BULK_MAX_ITEMS=1)
+    def test_bulk_create_item_limit(self):
+        '''test that batches larger than the limit are rejected'''
+        item = {'title': 'Jollof', 'time_minutes': 40, 'price': '5.50'}
+
+        res = self.client.post(RECIPE_BULK_URL, [item, item], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_partial_update_recipes(self):
+        '''test updating several recipes and replacing their tags'''
+        old_tag = create_sample_tag(user=self.user, name='Old')
+        new_tag = create_sample_tag(user=self.user, name='New')
+        recipe1 = create_sample_recipe(user=self.user)
+        recipe2 = create_sample_recipe(user=self.user)
+        recipe1.tags.add(old_tag)
+        recipe2.tags.add(old_tag)
+        payload = [
+            {'id': recipe1.id, 'title': 'Renamed'},
+            {'id': recipe2.id, 'tags': [new_tag.id]},
+        ]
+
+        res = self.client.patch(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        self.assertEqual(recipe1.title, 'Renamed')
+        self.assertEqual(list(recipe1.tags.all()), [old_tag])
+        self.assertEqual(list(recipe2.tags.all()), [new_tag])
+        self.assertEqual(res.data[1]['tags'], [new_tag.id])
+
+    def test_bulk_partial_update_unknown_recipe(self):
+        '''test that ids of other users recipes are rejected'''
+        recipe = create_sample_recipe(user=self.user)
+        other = create_sample_recipe(
+            user=create_sample_user(email='user2@domain.com'))
+        payload = [
+            {'id': recipe.id, 'title': 'Renamed'},
+            {'id': other.id, 'title': 'Stolen'},
+        ]
+
+        res = self.client.patch(RECIPE_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('id', res.data[1])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'test recipe')
+
+    def test_bulk_delete_recipes(self):
+        '''test deleting recipes by a list of ids'''
+        recipe1 = create_sample_recipe(user=self.user)
+        recipe2 = create_sample_recipe(user=self.user)
+        keep = create_sample_recipe(user=self.user)
+        other = create_sample_recipe(
+            user=create_sample_user(email='user2@domain.com'))
+
+        res = self.client.delete(
+            f'{RECIPE_BULK_URL}?ids={recipe1.id},{recipe2.id},{other.id}')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['deleted'], [recipe1.id, recipe2.id])
+        self.assertEqual(res.data['not_found'], [other.id])
+        self.assertEqual(list(Recipe.objects.filter(user=self.user)), [keep])
+        self.assertTrue(Recipe.objects.filter(id=other.id).exists())
+
+
+@override_settings(RECIPE_IMAGE_WORKERS=0)
 class RecipeImageUploadAPITest(TestCase):
     '''test suite for recipe image upload'''
 
@@ -280,6 +1148,8 @@ class RecipeImageUploadAPITest(TestCase):
         self.recipe = create_sample_recipe(user=self.user)
 
     def tearDown(self):
+        self.recipe.refresh_from_db()
+        images.delete_files(self.recipe.image_renditions.values())
         self.recipe.image.delete()
 
     def test_upload_image_success(self):
@@ -294,13 +1164,290 @@ class RecipeImageUploadAPITest(TestCase):
             res = self.client.post(url, {'image': ntf}, format='multipart')
 
         self.recipe.refresh_from_db()
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def test_upload_image_processed(self):
+        '''test that uploads are sanitised and resized'''
+        url = compute_recipe_image_upload_url(self.recipe.id)
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            Image.new('RGBA', (1000, 500)).save(ntf, format='PNG', exif=exif)
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.data['image_status'], 'ready')
+        self.assertEqual(set(res.data['image_renditions']),
+                         {'small', 'medium', 'large'})
+        self.assertTrue(res.data['image_renditions']['small'].startswith(
+            'http://testserver/'))
+        with Image.open(self.recipe.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (1000, 500))
+            self.assertEqual(len(image.getexif()), 0)
+        small = self.recipe.image_renditions['small']
+        with default_storage.open(small) as rendition:
+            self.assertEqual(Image.open(rendition).size, (320, 160))
+
+    def test_upload_image_queued_for_workers(self):
+        '''test that uploads are handed to the worker pool on commit'''
+        url = compute_recipe_image_upload_url(self.recipe.id)
+
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf, \
+                override_settings(RECIPE_IMAGE_WORKERS=2), \
+                patch('recipe.images.get_executor') as get_executor, \
+                self.captureOnCommitCallbacks(execute=True):
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['image_status'], 'pending')
+        get_executor.return_value.submit.assert_called_once_with(
+            images._run_job, self.recipe.id)
+
+    def test_process_invalid_image(self):
+        '''test that undecodable images are marked as failed and deleted'''
+        self.recipe.image.save('broken.jpg', ContentFile(b'not-an-image'))
+        upload = self.recipe.image.name
+
+        with self.assertLogs('recipe.images', 'WARNING'):
+            images.process_image(self.recipe.id)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, 'failed')
+        self.assertEqual(self.recipe.image_renditions, {})
+        self.assertFalse(self.recipe.image)
+        self.assertFalse(default_storage.exists(upload))
+
+    def test_process_truncated_image(self):
+        '''test that a truncated upload with EXIF data is not kept'''
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        buffer = io.BytesIO()
+        Image.new('RGB', (200, 200)).save(buffer, format='JPEG', exif=exif)
+        self.recipe.image.save(
+            'truncated.jpg', ContentFile(buffer.getvalue()[:-200]))
+        upload = self.recipe.image.name
+
+        with self.assertLogs('recipe.images', 'WARNING'):
+            images.process_image(self.recipe.id)
+
+        res = self.client.get(compute_recipe_detail_url(self.recipe.id))
+        self.assertEqual(res.data['image_status'], 'failed')
+        self.assertIsNone(res.data['image'])
+        self.assertFalse(default_storage.exists(upload))
+
     def test_upload_image_bad_request(self):
         '''test uploading invalid image file'''
         url = compute_recipe_image_upload_url(self.recipe.id)
         res = self.client.post(url, {'image': 'not-img'}, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeImageVariantAPITest(TestCase):
+    '''test suite for resized recipe image variants'''
+
+    def setUp(self):
+        self.user = create_sample_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = create_sample_recipe(
+            user=self.user, image_status=Recipe.ImageStatus.READY)
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 200)).save(buffer, format='JPEG', exif=exif)
+        self.recipe.image.save('variant.jpg', ContentFile(buffer.getvalue()))
+        self.url = compute_recipe_image_variant_url(self.recipe.id)
+
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = thumbnails.ThumbnailCache(self.cache_dir.name, 10 ** 7)
+        patcher = patch.object(thumbnails, 'thumbnail_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.recipe.image.delete()
+        self.cache_dir.cleanup()
+
+    def test_resize_to_width(self):
+        '''test that the image is scaled to the requested width'''
+        res = self.client.get(self.url, {'width': 100, 'output': 'png'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/png')
+        with Image.open(io.BytesIO(b''.join(res.streaming_content))) as img:
+            self.assertEqual(img.size, (100, 50))
+            self.assertEqual(len(img.getexif()), 0)
+
+    def test_crop_to_height(self):
+        '''test that a height crops the image to the exact size'''
+        res = self.client.get(self.url, {'width': 50, 'height': 50})
+
+        with Image.open(io.BytesIO(b''.join(res.streaming_content))) as img:
+            self.assertEqual(img.size, (50, 50))
+            self.assertEqual(img.format, 'JPEG')
+
+    def test_invalid_params(self):
+        '''test that bad sizes and formats are rejected'''
+        for params in ({}, {'width': 'x'}, {'width': 0},
+                       {'width': 100, 'height': -1},
+                       {'width': 100, 'output': 'gif'}):
+            res = self.client.get(self.url, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipe_without_image(self):
+        '''test that recipes without an image return 404'''
+        recipe = create_sample_recipe(user=self.user)
+
+        res = self.client.get(compute_recipe_image_variant_url(recipe.id),
+                              {'width': 100})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unprocessed_image(self):
+        '''test that pending and failed images have no variants'''
+        for image_status, code in (
+                (Recipe.ImageStatus.PENDING, status.HTTP_409_CONFLICT),
+                (Recipe.ImageStatus.PROCESSING, status.HTTP_409_CONFLICT),
+                (Recipe.ImageStatus.FAILED, status.HTTP_404_NOT_FOUND)):
+            Recipe.objects.filter(pk=self.recipe.pk).update(
+                image_status=image_status)
+
+            with patch('recipe.thumbnails.render_variant') as render:
+                res = self.client.get(self.url, {'width': 100})
+
+            self.assertEqual(res.status_code, code)
+            render.assert_not_called()
+
+    def test_undecodable_image(self):
+        '''test that an image that cannot be decoded returns 404'''
+        with open(self.recipe.image.path, 'wb') as file:
+            file.write(b'not-an-image')
+
+        with self.assertLogs('recipe.views', 'WARNING'):
+            res = self.client.get(self.url, {'width': 100})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_not_modified(self):
+        '''test that a matching If-None-Match skips rendering'''
+        res = self.client.get(self.url, {'width': 100})
+        etag = res['ETag']
+
+        with patch('recipe.thumbnails.render_variant') as render:
+            res = self.client.get(self.url, {'width': 100},
+                                  HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        render.assert_not_called()
+
+    def test_versioned_url_is_immutable(self):
+        '''test that only the versioned url may be cached forever'''
+        res = self.client.get(self.url, {'width': 100})
+        self.assertEqual(res['Cache-Control'], 'private, no-cache')
+
+        res = self.client.get(res['Content-Location'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('immutable', res['Cache-Control'])
+
+    def test_variant_rendered_once(self):
+        '''test that repeated requests are served from the disk cache'''
+        with patch('recipe.thumbnails.render_variant',
+                   wraps=thumbnails.render_variant) as render:
+            for _ in range(3):
+                res = self.client.get(self.url, {'width': 100})
+                b''.join(res.streaming_content)
+
+        render.assert_called_once()
+
+    def test_replaced_image_gets_new_variants(self):
+        '''test that new content under the same name changes the ETag'''
+        res = self.client.get(self.url, {'width': 100})
+        path = self.recipe.image.path
+        Image.new('RGB', (300, 300)).save(path, format='JPEG')
+        os.utime(path, (1, 1))
+
+        replaced = self.client.get(self.url, {'width': 100})
+
+        self.assertNotEqual(replaced['ETag'], res['ETag'])
+        with Image.open(io.BytesIO(
+                b''.join(replaced.streaming_content))) as img:
+            self.assertEqual(img.size, (100, 100))
+
+
+class ThumbnailCacheTest(TestCase):
+    '''test suite for the thumbnail disk cache'''
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+    def test_least_recently_used_files_are_evicted(self):
+        '''test that the cache stays under max_bytes'''
+        cache = thumbnails.ThumbnailCache(self.cache_dir.name, 250)
+        cache.put('aa', 'png', b'x' * 100)
+        cache.put('bb', 'png', b'x' * 100)
+        os.utime(cache.path('aa', 'png'), (0, 0))
+        os.utime(cache.path('bb', 'png'), (1, 1))
+        cache.get('aa', 'png')
+        cache.put('cc', 'png', b'x' * 100)
+
+        self.assertIsNotNone(cache.get('aa', 'png'))
+        self.assertIsNone(cache.get('bb', 'png'))
+        self.assertIsNotNone(cache.get('cc', 'png'))
+
+    def test_concurrent_renders_are_coalesced(self):
+        '''test that parallel misses for one key render it once'''
+        cache = thumbnails.ThumbnailCache(self.cache_dir.name, 10 ** 6)
+        started = threading.Event()
+        calls = []
+
+        def render():
+            calls.append(1)
+            started.wait(1)
+            return b'data'
+
+        threads = [
+            threading.Thread(target=cache.get_or_render,
+                             args=('key', 'png', render))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        started.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+
+    def test_eviction_uses_the_index(self):
+        '''test that only the first use scans the cache directory'''
+        cache = thumbnails.ThumbnailCache(self.cache_dir.name, 250)
+        cache.put('aa', 'png', b'x' * 100)
+
+        with patch('os.walk') as walk:
+            for key in ('bb', 'cc', 'dd'):
+                cache.put(key, 'png', b'x' * 100)
+
+        walk.assert_not_called()
+        self.assertIsNone(cache.get('aa', 'png'))
+        self.assertIsNotNone(cache.get('dd', 'png'))
+
+    def test_open_renders_an_evicted_file_again(self):
+        '''test that a file evicted before it is opened is rendered'''
+        cache = thumbnails.ThumbnailCache(self.cache_dir.name, 10 ** 6)
+        path = cache.put('key', 'png', b'old')
+
+        with patch.object(cache, 'get', return_value=path):
+            os.remove(path)
+            with cache.open('key', 'png', lambda: b'new') as file:
+                self.assertEqual(file.read(), b'new')
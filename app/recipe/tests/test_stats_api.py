@@ -0,0 +1,200 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import stats
+from core.models import (
+    Ingredient, Recipe, RecipeStats, RecipeStatsCounter, Tag)
+from core.seed import seed_recipes
+
+
+STATS_URL = reverse('recipe:stats')
+RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk-create')
+
+
+def create_sample_user(email='test@domain.com', password='testPass'):
+    '''create and return a test user'''
+    return get_user_model().objects.create_user(email, password)
+
+
+def create_sample_recipe(user, **params):
+    '''create and return a sample recipe'''
+    defaults = {'title': 'Soup', 'time_minutes': 10, 'price': 5.00}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicStatsTest(TestCase):
+    '''test suite for stats public api'''
+
+    def test_login_required(self):
+        '''test that the stats endpoint is auth-protected'''
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateStatsTest(TestCase):
+    '''test suite for stats private api'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_sample_user()
+        self.client.force_authenticate(self.user)
+
+    def get_stats(self, **params):
+        res = self.client.get(STATS_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def assertNoDrift(self):
+        self.assertEqual(stats.drift(), {})
+
+    def test_empty_collection(self):
+        '''test the stats of a user without recipes'''
+        data = self.get_stats()
+
+        self.assertEqual(data['recipes'], 0)
+        self.assertIsNone(data['time_minutes']['average'])
+        self.assertEqual(data['price']['total'], '0.00')
+        self.assertIsNone(data['price']['average'])
+        self.assertEqual(data['tags'], [])
+        self.assertEqual(data['ingredients'], [])
+
+    def test_stats_follow_writes(self):
+        '''test that created recipes are counted with their links'''
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        for price, tags in (('4.00', [quick, vegan]), ('12.50', [quick]),
+                            ('250.00', [])):
+            res = self.client.post(RECIPES_URL, {
+                'title': 'Dish', 'time_minutes': 20, 'price': price,
+                'tags': [tag.id for tag in tags], 'ingredients': [rice.id],
+            }, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        create_sample_recipe(create_sample_user('other@domain.com'))
+
+        data = self.get_stats()
+
+        self.assertEqual(data['recipes'], 3)
+        self.assertEqual(data['time_minutes'],
+                         {'total': 60, 'average': 20.0})
+        self.assertEqual(data['price']['total'], '266.50')
+        self.assertEqual(data['price']['average'], '88.83')
+        self.assertEqual([bucket['recipes']
+                          for bucket in data['price']['buckets']],
+                         [1, 0, 1, 0, 0, 1])
+        self.assertEqual(data['tags'], [
+            {'id': quick.id, 'name': 'Quick', 'recipes': 2},
+            {'id': vegan.id, 'name': 'Vegan', 'recipes': 1},
+        ])
+        self.assertEqual(data['ingredients'],
+                         [{'id': rice.id, 'name': 'Rice', 'recipes': 3}])
+        self.assertNoDrift()
+
+    def test_stats_follow_updates_and_deletes(self):
+        '''test that updates, link changes and deletes adjust the stats'''
+        tag = Tag.objects.create(user=self.user, name='Quick')
+        ingredient = Ingredient.objects.create(user=self.user, name='Rice')
+        recipe = create_sample_recipe(self.user, price='8.00')
+        other = create_sample_recipe(self.user, time_minutes=30)
+        recipe.tags.add(tag)
+        other.tags.add(tag)
+        other.ingredients.add(ingredient)
+
+        self.client.patch(reverse('recipe:recipe-detail', args=[recipe.id]),
+                          {'price': '60.00', 'time_minutes': 50})
+        other.tags.remove(tag)
+        ingredient.delete()
+        self.client.delete(f'{BULK_URL}?ids={other.id}')
+
+        data = self.get_stats()
+        self.assertEqual(data['recipes'], 1)
+        self.assertEqual(data['time_minutes']['total'], 50)
+        self.assertEqual(data['price']['total'], '60.00')
+        self.assertEqual(data['price']['buckets'][4]['recipes'], 1)
+        self.assertEqual(data['tags'],
+                         [{'id': tag.id, 'name': 'Quick', 'recipes': 1}])
+        self.assertEqual(data['ingredients'], [])
+        self.assertNoDrift()
+
+        tag.delete()
+        recipe.delete()
+        self.assertEqual(self.get_stats()['recipes'], 0)
+        self.assertFalse(RecipeStatsCounter.objects.filter(
+            user=self.user).exists())
+
+    def test_bulk_writes(self):
+        '''test that bulk creates and updates are counted'''
+        res = self.client.post(BULK_URL, [
+            {'title': f'recipe {n}', 'time_minutes': 10, 'price': '3.00',
+             'tag_names': ['Quick']}
+            for n in range(3)
+        ], format='json')
+        self.client.patch(BULK_URL, [
+            {'id': item['id'], 'time_minutes': 15} for item in res.data
+        ], format='json')
+
+        data = self.get_stats()
+
+        self.assertEqual(data['recipes'], 3)
+        self.assertEqual(data['time_minutes']['total'], 45)
+        self.assertEqual(data['tags'][0]['recipes'], 3)
+        self.assertNoDrift()
+
+    def test_top_limits_the_lists(self):
+        '''test that ?top= caps the tags and ingredients listed'''
+        recipe = create_sample_recipe(self.user)
+        recipe.tags.add(*[Tag.objects.create(user=self.user, name=f'tag{n}')
+                          for n in range(4)])
+
+        self.assertEqual(len(self.get_stats(top=2)['tags']), 2)
+        res = self.client.get(STATS_URL, {'top': 'all'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reads_do_not_depend_on_collection_size(self):
+        '''test that the stats are read with a fixed number of queries'''
+        create_sample_recipe(self.user)
+        with self.assertNumQueries(4):
+            self.get_stats()
+        for n in range(5):
+            create_sample_recipe(self.user).tags.add(
+                Tag.objects.create(user=self.user, name=f'tag{n}'))
+        with self.assertNumQueries(4):
+            self.get_stats()
+
+
+class RebuildRecipeStatsCommandTest(TestCase):
+    '''test suite for the rebuild_recipe_stats command'''
+
+    def test_seeded_stats_match(self):
+        '''test that seeded recipes are counted'''
+        user = seed_recipes(recipes_per_user=20, batch_size=7)[0]
+
+        self.assertEqual(RecipeStats.objects.get(user=user).recipe_count, 20)
+        self.assertEqual(stats.drift(), {})
+
+    def test_check_reports_and_rebuild_fixes_drift(self):
+        '''test that --check fails on drift and a rebuild repairs it'''
+        user = seed_recipes(recipes_per_user=5)[0]
+        RecipeStats.objects.filter(user=user).update(recipe_count=1)
+        RecipeStatsCounter.objects.filter(
+            user=user, kind=RecipeStatsCounter.Kind.TAG).delete()
+        out = StringIO()
+
+        with self.assertRaisesMessage(CommandError, '1 users drifted'):
+            call_command('rebuild_recipe_stats', check=True, stdout=out)
+        self.assertIn('recipe_count is 1, expected 5', out.getvalue())
+
+        call_command('rebuild_recipe_stats', stdout=out)
+        self.assertIn('Rebuilt the recipe stats of 1 users.', out.getvalue())
+        call_command('rebuild_recipe_stats', check=True, stdout=out)
+        self.assertIn('No drift found.', out.getvalue())
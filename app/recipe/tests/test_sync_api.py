@@ -0,0 +1,217 @@
+import json
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from unittest.mock import patch
+
+from core import search, versioning
+from core.models import ChangeLogEntry, Ingredient, Recipe, Tag
+from recipe import importer
+
+
+SYNC_URL = reverse('recipe:sync')
+
+
+def create_sample_user(email='test@domain.com', password='testPass'):
+    '''create and return a test user'''
+    return get_user_model().objects.create_user(email, password)
+
+
+def create_sample_recipe(user, **params):
+    '''create and return a sample recipe'''
+    defaults = {'title': 'Soup', 'time_minutes': 10, 'price': 5.00}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicSyncTest(TestCase):
+    '''test suite for sync public api'''
+
+    def test_login_required(self):
+        '''test that the sync endpoint is auth-protected'''
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateSyncTest(TestCase):
+    '''test suite for sync private api'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_sample_user()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, since, **params):
+        res = self.client.get(SYNC_URL, {'since': since, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_reset_without_token(self):
+        '''test that syncing without a token returns only the head token'''
+        create_sample_recipe(self.user)
+
+        res = self.client.get(SYNC_URL)
+
+        self.assertTrue(res.data['reset'])
+        self.assertEqual(res.data['recipes'], [])
+        self.assertEqual(res.data['token'],
+                         str(versioning.head(self.user.pk)))
+        self.assertEqual(self.sync(res.data['token'])['recipes'], [])
+
+    def test_created_and_updated_objects(self):
+        '''test that saved objects are returned once, as last saved'''
+        since = versioning.head(self.user.pk)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe = create_sample_recipe(self.user)
+        recipe.title = 'Stew'
+        recipe.save()
+
+        data = self.sync(since)
+
+        self.assertFalse(data['reset'])
+        self.assertFalse(data['more'])
+        self.assertEqual([item['title'] for item in data['recipes']],
+                         ['Stew'])
+        self.assertEqual(data['tags'], [{'id': tag.id, 'name': 'Vegan'}])
+        self.assertEqual(data['ingredients'],
+                         [{'id': ingredient.id, 'name': 'Salt'}])
+        self.assertEqual(data['deleted'],
+                         {'recipes': [], 'tags': [], 'ingredients': []})
+        self.assertEqual(self.sync(data['token'])['recipes'], [])
+
+    def test_link_changes(self):
+        '''test that adding a tag to a recipe returns the recipe'''
+        recipe = create_sample_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        since = versioning.head(self.user.pk)
+
+        recipe.tags.add(tag)
+
+        data = self.sync(since)
+        self.assertEqual([item['id'] for item in data['recipes']],
+                         [recipe.id])
+        self.assertEqual(data['recipes'][0]['tags'], [tag.id])
+
+    def test_deleted_objects(self):
+        '''test that deletions are returned as tombstones'''
+        recipe = create_sample_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        since = versioning.head(self.user.pk)
+        deleted_recipe = create_sample_recipe(self.user)
+        deleted_recipe_id, tag_id = deleted_recipe.id, tag.id
+
+        tag.delete()
+        deleted_recipe.delete()
+
+        data = self.sync(since)
+        self.assertEqual(data['deleted']['recipes'], [deleted_recipe_id])
+        self.assertEqual(data['deleted']['tags'], [tag_id])
+        self.assertEqual([item['id'] for item in data['recipes']],
+                         [recipe.id])
+        self.assertEqual(data['recipes'][0]['tags'], [])
+
+    def test_other_users_changes_excluded(self):
+        '''test that only the changes of the user are returned'''
+        since = versioning.head(self.user.pk)
+        create_sample_recipe(create_sample_user('other@domain.com'))
+
+        data = self.sync(since)
+
+        self.assertEqual(data['recipes'], [])
+        self.assertEqual(data['token'], str(since))
+
+    def test_batches(self):
+        '''test that changes beyond limit are returned by the next token'''
+        since = versioning.head(self.user.pk)
+        recipes = [create_sample_recipe(self.user, title=f'Soup {n}')
+                   for n in range(3)]
+
+        first = self.sync(since, limit=2)
+        second = self.sync(first['token'], limit=2)
+
+        self.assertTrue(first['more'])
+        self.assertFalse(second['more'])
+        self.assertEqual(
+            [item['id'] for item in first['recipes'] + second['recipes']],
+            [recipe.id for recipe in recipes])
+
+    def test_invalid_parameters(self):
+        '''test that malformed tokens and limits are rejected'''
+        for params in ({'since': 'abc'}, {'since': -1},
+                       {'since': 0, 'limit': 0},
+                       {'since': 0, 'limit': 100000}):
+            res = self.client.get(SYNC_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_compacted_token_resets(self):
+        '''test that tokens older than the compacted log get a reset'''
+        since = versioning.head(self.user.pk)
+        recipe = create_sample_recipe(self.user)
+        recipe.title = 'Stew'
+        recipe.save()
+        token = versioning.head(self.user.pk)
+        create_sample_recipe(self.user, title='Pie')
+        ChangeLogEntry.objects.filter(id__lte=token).update(
+            created_at=timezone.now() - timedelta(days=40))
+        out = StringIO()
+
+        call_command('compact_changes', days=30, stdout=out)
+
+        self.assertIn('Deleted 1 superseded and 1 expired changes.',
+                      out.getvalue())
+        self.assertTrue(self.sync(since)['reset'])
+        data = self.sync(token)
+        self.assertFalse(data['reset'])
+        self.assertEqual([item['title'] for item in data['recipes']],
+                         ['Pie'])
+
+    def test_rolled_back_changes_are_not_logged(self):
+        '''test that a deferred block that raises logs nothing'''
+        since = versioning.head(self.user.pk)
+
+        with patch('core.versioning._apply') as apply:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic(), versioning.deferred():
+                    create_sample_recipe(self.user)
+                    raise RuntimeError
+
+        apply.assert_not_called()
+        self.assertEqual(versioning.head(self.user.pk), since)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_import_batches_are_logged_as_they_commit(self):
+        '''test that imported batches are logged even if a later one fails'''
+        since = versioning.head(self.user.pk)
+        stream = BytesIO(b''.join(
+            json.dumps({'title': f'Soup {n}', 'time_minutes': 5,
+                        'price': '2.00'}).encode() + b'\n'
+            for n in range(4)))
+        refresh = search.refresh_documents
+        calls = []
+
+        def fail_second_batch(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError
+            return refresh(*args, **kwargs)
+
+        with patch('core.search.refresh_documents',
+                   side_effect=fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                importer.import_recipes(self.user, stream, 'ndjson',
+                                        batch_size=2)
+
+        data = self.sync(since)
+        self.assertEqual([item['title'] for item in data['recipes']],
+                         ['Soup 0', 'Soup 1'])
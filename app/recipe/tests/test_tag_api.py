@@ -4,11 +4,13 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from core.autocomplete import name_index
 from core.models import Tag
 from recipe.serializers import TagSerializer
 
 
 TAG_LIST_URL = reverse('recipe:tag-list')
+TAG_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 
 def create_sample_user(email='test@domain.com', password='testPass'):
@@ -73,8 +75,106 @@ class PrivateTagTest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
         self.assertTrue(exist)
 
+    def test_create_tag_duplicate_name(self):
+        '''test that a user cannot create two tags with the same name'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(
+            user=create_sample_user('other@domain.com', 'test222'),
+            name='Dessert')
+
+        res = self.client.post(TAG_LIST_URL, {'name': 'Vegan'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TAG_LIST_URL, {'name': 'Dessert'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
     def test_create_tag_invalid(self):
         '''test create tag with invalid payload'''
         res = self.client.post(TAG_LIST_URL, {'name': ''})
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tag_listing_cursor_pagination(self):
+        '''test that tag pages follow the -name ordering'''
+        for name in ('Apple', 'Beans', 'Corn', 'Dates'):
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAG_LIST_URL, {'page_size': 3})
+        self.assertEqual([t['name'] for t in res.data['results']],
+                         ['Dates', 'Corn', 'Beans'])
+
+        res = self.client.get(res.data['next'])
+        self.assertEqual([t['name'] for t in res.data['results']],
+                         ['Apple'])
+        self.assertIsNone(res.data['next'])
+
+    def test_tag_listing_not_modified(self):
+        '''test that an unchanged tag list answers 304 until a write'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        res = self.client.get(TAG_LIST_URL)
+
+        again = self.client.get(TAG_LIST_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.post(TAG_LIST_URL, {'name': 'Dessert'})
+        again = self.client.get(TAG_LIST_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(again.data), 2)
+
+
+class TagAutocompleteTest(TestCase):
+    '''test suite for tag name autocomplete'''
+
+    def setUp(self):
+        name_index.clear()
+        self.client = APIClient()
+        self.user = create_sample_user()
+        self.client.force_authenticate(self.user)
+        for name in ('Tomato', 'Tofu', 'Toast', 'Potato', 'Vegan'):
+            Tag.objects.create(user=self.user, name=name)
+
+    def autocomplete(self, q, **params):
+        res = self.client.get(TAG_AUTOCOMPLETE_URL, {'q': q, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [tag['name'] for tag in res.data]
+
+    def test_prefix_matches_first(self):
+        '''test that names starting with q come first'''
+        self.assertEqual(self.autocomplete('to'), ['Toast', 'Tofu', 'Tomato'])
+        self.assertEqual(self.autocomplete('TO', limit=2), ['Toast', 'Tofu'])
+
+    def test_typo_tolerant_matches(self):
+        '''test that misspelt names still match'''
+        self.assertEqual(self.autocomplete('tomatoe'), ['Tomato'])
+        self.assertEqual(self.autocomplete('vegann'), ['Vegan'])
+
+    def test_limited_to_user(self):
+        '''test that other users' names are never suggested'''
+        other = create_sample_user(email='user2@domain.com')
+        Tag.objects.create(user=other, name='Torte')
+
+        self.assertNotIn('Torte', self.autocomplete('tor'))
+
+    def test_index_updated_on_create(self):
+        '''test that new and deleted names update the cached index'''
+        self.autocomplete('to')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(TAG_LIST_URL, {'name': 'Torte'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.get(name='Tofu').delete()
+
+        with self.assertNumQueries(0):
+            names = self.autocomplete('to')
+        self.assertEqual(names, ['Toast', 'Tomato', 'Torte'])
+
+    def test_invalid_limit(self):
+        '''test that the limit must be a small positive integer'''
+        for limit in ('x', 0, 1000):
+            res = self.client.get(TAG_AUTOCOMPLETE_URL,
+                                  {'q': 'to', 'limit': limit})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_empty_query(self):
+        '''test that an empty q suggests nothing'''
+        self.assertEqual(self.autocomplete(' '), [])
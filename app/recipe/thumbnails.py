@@ -0,0 +1,210 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from PIL import Image, ImageOps, features
+
+# format name -> (Pillow format, content type, save options)
+FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg',
+             {'quality': 85, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'image/png', {'optimize': True}),
+}
+if features.check('webp'):
+    FORMATS['webp'] = ('WEBP', 'image/webp', {'quality': 80, 'method': 4})
+
+
+def source_version(image):
+    '''return a short fingerprint of the stored image, a FieldFile
+
+    It covers the name, size and modification time of the file, so an
+    image replaced under the same name gets a new fingerprint without
+    reading its content.
+    '''
+    name = image.name
+    try:
+        stamp = (f'{image.storage.size(name)}\0'
+                 f'{image.storage.get_modified_time(name).timestamp()}')
+    except (NotImplementedError, OSError):
+        stamp = ''
+    return hashlib.sha256(f'{name}\0{stamp}'.encode()).hexdigest()[:16]
+
+
+def variant_key(version, width, height, fmt):
+    '''return the address of a variant of the image of source_version'''
+    return hashlib.sha256(
+        f'{version}\0{width}\0{height or ""}\0{fmt}'.encode()).hexdigest()
+
+
+class InvalidImage(Exception):
+    '''raised by render_variant() for sources it cannot decode'''
+
+
+def render_variant(source, width, height, fmt):
+    '''return the bytes of source resized to width (and cropped to height)
+
+    Metadata of the source is not copied to the variant. Raises
+    InvalidImage when source cannot be decoded.
+    '''
+    pil_format, _, options = FORMATS[fmt]
+    try:
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            if height:
+                image = ImageOps.fit(image, (width, height))
+            else:
+                image.thumbnail((width, image.height))
+            if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            image.info.pop('exif', None)
+            buffer = io.BytesIO()
+            image.save(buffer, format=pil_format, **options)
+    except (OSError, Image.DecompressionBombError) as exc:
+        raise InvalidImage(str(exc)) from exc
+    return buffer.getvalue()
+
+
+class ThumbnailCache:
+    '''size bounded, content addressed disk cache of rendered variants
+
+    Files are named after their key and evicted least recently used first
+    once the cache grows past max_bytes. Their sizes and use order are
+    kept in memory, read from the directory once; files other processes
+    write are seen at the next scan. Concurrent requests for the same key
+    in this process wait for a single render.
+    '''
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # path -> size, least recently used first; None until scanned
+        self._sizes = None
+        self._total = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def path(self, key, fmt):
+        return os.path.join(self.directory, key[:2], f'{key}.{fmt}')
+
+    def get(self, key, fmt):
+        '''return the path of a cached variant, marking it recently used'''
+        path = self.path(key, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                if self._sizes is not None:
+                    self._total -= self._sizes.pop(path, 0)
+            return None
+        with self._lock:
+            if self._sizes is not None and path in self._sizes:
+                self._sizes.move_to_end(path)
+        return path
+
+    def put(self, key, fmt, data):
+        '''store data under key and return its path'''
+        path = self.path(key, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(path), delete=False) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+
+        with self._lock:
+            sizes = self._index()
+            self._total += len(data) - sizes.pop(path, 0)
+            sizes[path] = len(data)
+        self.evict()
+        return path
+
+    def get_or_render(self, key, fmt, render):
+        '''return the path for key, calling render() once if it is missing'''
+        path = self.get(key, fmt)
+        if path is not None:
+            return path
+        with self._key_lock(key):
+            path = self.get(key, fmt)
+            if path is None:
+                path = self.put(key, fmt, render())
+            return path
+
+    def open(self, key, fmt, render):
+        '''return the variant for key open for reading, see get_or_render()
+
+        A file evicted between its lookup and opening is rendered again;
+        if that one is evicted too, the render is served from memory.
+        '''
+        try:
+            return open(self.get_or_render(key, fmt, render), 'rb')
+        except FileNotFoundError:
+            pass
+        data = render()
+        try:
+            return open(self.put(key, fmt, data), 'rb')
+        except FileNotFoundError:
+            return io.BytesIO(data)
+
+    @contextmanager
+    def _key_lock(self, key):
+        with self._lock:
+            lock, waiters = self._key_locks.get(key, (threading.Lock(), 0))
+            self._key_locks[key] = (lock, waiters + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, waiters = self._key_locks[key]
+                if waiters == 1:
+                    del self._key_locks[key]
+                else:
+                    self._key_locks[key] = (lock, waiters - 1)
+
+    def _index(self):
+        '''return the sizes of the cached files, scanning them at first'''
+        if self._sizes is None:
+            self._sizes = OrderedDict(
+                (path, size) for _, size, path in sorted(self._scan()))
+            self._total = sum(self._sizes.values())
+        return self._sizes
+
+    def _scan(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def evict(self):
+        '''once over max_bytes, delete the least recently used files
+
+        Files are deleted until the cache is under 90% of max_bytes.
+        '''
+        victims = []
+        with self._lock:
+            sizes = self._index()
+            if self._total > self.max_bytes:
+                target = self.max_bytes * 0.9
+                while sizes and self._total > target:
+                    path, size = sizes.popitem(last=False)
+                    self._total -= size
+                    victims.append(path)
+        for path in victims:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+thumbnail_cache = ThumbnailCache(
+    directory=settings.RECIPE_THUMBNAIL_CACHE['DIR'],
+    max_bytes=settings.RECIPE_THUMBNAIL_CACHE['MAX_BYTES'],
+)
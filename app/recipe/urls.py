@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from recipe import views
+from recipe import async_views, views
 
 app_name = 'recipe'
 
@@ -12,4 +12,14 @@ router.register('recipes', views.RecipeViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/recipes/', async_views.RecipeListView.as_view(),
+         name='async-recipe-list'),
+    path('async/recipes/<int:pk>/', async_views.RecipeDetailView.as_view(),
+         name='async-recipe-detail'),
+    path('async/tags/', async_views.TagListView.as_view(),
+         name='async-tag-list'),
+    path('async/ingredients/', async_views.IngredientListView.as_view(),
+         name='async-ingredient-list'),
+    path('sync/', views.SyncView.as_view(), name='sync'),
+    path('stats/', views.StatsView.as_view(), name='stats'),
 ]
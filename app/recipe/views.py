@@ -1,19 +1,37 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.http import (
+    FileResponse, HttpResponseNotModified, StreamingHttpResponse)
+from django.utils.http import parse_etags
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 from rest_framework.mixins import ListModelMixin, CreateModelMixin
 
-from core import models
-from recipe import serializers
+from core import metrics, models, stats, versioning
+from core.authentication import CachedTokenAuthentication
+from core.autocomplete import name_index
+from recipe import (
+    export, fast, filters, images, importer, serializers, thumbnails)
+from recipe.conditional import ConditionalGetMixin
+from recipe.pagination import OptInCursorPagination
+
+logger = logging.getLogger(__name__)
 
+ImageStatus = models.Recipe.ImageStatus
 
-class BaseRecipeAttr(ListModelMixin, CreateModelMixin, GenericViewSet):
+
+class BaseRecipeAttr(ConditionalGetMixin, fast.FastListMixin, ListModelMixin,
+                     CreateModelMixin, GenericViewSet):
     '''Base class attributes for recipe viewsets'''
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = OptInCursorPagination
 
     def get_queryset(self):
         '''return objects for current logged user'''
@@ -23,6 +41,34 @@ class BaseRecipeAttr(ListModelMixin, CreateModelMixin, GenericViewSet):
         '''create new object'''
         serializer.save(user=self.request.user)
 
+    def fast_list(self, queryset):
+        '''return the list representation of queryset without serializers'''
+        return fast.name_list(queryset)
+
+    @action(methods=['GET'], detail=False)
+    def autocomplete(self, request):
+        '''return the names best matching the partial name ?q=
+
+        Names starting with q come first, then typo tolerant matches. At
+        most ?limit= (default 10) names are returned.
+        '''
+        q = request.query_params.get('q', '').strip()
+        max_limit = settings.RECIPE_AUTOCOMPLETE['MAX_LIMIT']
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= max_limit:
+            return Response(
+                {'limit': [f'Expected an integer from 1 to {max_limit}.']},
+                status=status.HTTP_400_BAD_REQUEST)
+        if not q:
+            return Response([])
+
+        matches = name_index.search(
+            self.queryset.model, request.user.pk, q, limit)
+        return Response(self.get_serializer(matches, many=True).data)
+
 
 class TagViewSet(BaseRecipeAttr):
     '''list and create api endpoints for tag model'''
@@ -36,20 +82,21 @@ class IngredientViewSet(BaseRecipeAttr):
     serializer_class = serializers.IngredientSerializer
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, fast.FastListMixin, ModelViewSet):
     '''list and create api endpoints for recipe model'''
     queryset = models.Recipe.objects.all()
     serializer_class = serializers.RecipeSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = OptInCursorPagination
 
-    def params_to_ids(self, param):
+    def params_to_ids(self, param, param_name='ids'):
         '''convert a comma-sep strings of ids to list of int ids'''
-        return [int(id) for id in param.split(',')]
+        return filters.parse_ids(param, param_name)
 
     def get_serializer_class(self):
         '''return serializer class'''
-        if self.action == 'retrieve':
+        if self.action in ('retrieve', 'export'):
             return serializers.RecipeDetailSerializer
         if self.action == 'upload_image':
             return serializers.RecipeUploadSerializer
@@ -57,22 +104,141 @@ class RecipeViewSet(ModelViewSet):
 
     def get_queryset(self):
         '''return queryset for auth user'''
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
+        queryset = filters.filter_recipes(
+            self.queryset, self.request.query_params, self.request.user)
+        prefetch = serializers.get_prefetch_plan(self.get_serializer_class())
+        return queryset.prefetch_related(*prefetch)
 
-        if tags:
-            tags_ids = self.params_to_ids(tags)
-            queryset = queryset.filter(tags__id__in=tags_ids)
-        if ingredients:
-            ingredients_ids = self.params_to_ids(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredients_ids)
+    def retrieve(self, request, *args, **kwargs):
+        '''return a recipe, or 304 if the client copy is current'''
+        updated_at = self.detail_updated_at()
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            f'u{updated_at.isoformat()}', updated_at, super().retrieve,
+            request, *args, **kwargs)
 
-        return queryset.filter(user=self.request.user).order_by('-id')
+    def fast_list(self, queryset):
+        '''return the list representation of queryset without serializers'''
+        return fast.recipe_list(queryset, self.request)
 
     def perform_create(self, serializer):
-        '''create a new recipe'''
-        serializer.save(user=self.request.user)
+        '''create a new recipe, logging it and its links as one change'''
+        with transaction.atomic(), versioning.deferred():
+            serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        '''update a recipe, logging it and its links as one change'''
+        with transaction.atomic(), versioning.deferred():
+            serializer.save()
+
+    def get_bulk_serializer(self, *args, **kwargs):
+        '''return a list serializer capped at RECIPE_BULK_MAX_ITEMS'''
+        kwargs.setdefault('max_length', settings.RECIPE_BULK_MAX_ITEMS)
+        return self.get_serializer(*args, many=True, **kwargs)
+
+    def bulk_response(self, recipes, status_code):
+        '''return recipes, reloaded in one pass, in their input order'''
+        prefetch = serializers.get_prefetch_plan(self.get_serializer_class())
+        loaded = models.Recipe.objects.prefetch_related(*prefetch).in_bulk(
+            [recipe.pk for recipe in recipes])
+        serializer = self.get_serializer(
+            [loaded[recipe.pk] for recipe in recipes], many=True)
+        return Response(serializer.data, status=status_code)
+
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk_create(self, request):
+        '''create a list of recipes in one transaction'''
+        serializer = self.get_bulk_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic(), versioning.deferred():
+            recipes = serializer.save(user=request.user)
+        return self.bulk_response(recipes, status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        '''partially update a list of recipes, matched by id'''
+        items = request.data if isinstance(request.data, list) else []
+        ids = [item.get('id') if isinstance(item, dict) else None
+               for item in items]
+        valid_ids = [pk for pk in ids if isinstance(pk, int)]
+        recipes = self.queryset.filter(user=request.user).in_bulk(valid_ids)
+
+        errors = [{} if pk in recipes else {'id': ['Recipe not found.']}
+                  for pk in ids]
+        seen = set()
+        for index, pk in enumerate(ids):
+            if pk in seen and not errors[index]:
+                errors[index] = {'id': ['Duplicate recipe id.']}
+            seen.add(pk)
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        instances = [recipes[pk] for pk in ids]
+        serializer = self.get_bulk_serializer(
+            instances, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic(), versioning.deferred():
+            serializer.save()
+        return self.bulk_response(instances, status.HTTP_200_OK)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request):
+        '''delete the recipes listed in the ids query parameter'''
+        ids = self.params_to_ids(request.query_params.get('ids', ''))
+        with transaction.atomic(), versioning.deferred():
+            recipes = self.queryset.filter(user=request.user, id__in=ids)
+            deleted = sorted(recipes.values_list('id', flat=True))
+            recipes.delete()
+        return Response({
+            'deleted': deleted,
+            'not_found': sorted(set(ids).difference(deleted)),
+        }, status=status.HTTP_200_OK)
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        '''stream every matching recipe with its ingredients and tags
+
+        ?output= picks ndjson (default, one recipe per line) or json (one
+        array). The list filters and ?q= apply; recipes are ordered by id.
+        '''
+        fmt = request.query_params.get('output', 'ndjson')
+        if fmt not in export.FORMATS:
+            choices = ', '.join(export.FORMATS)
+            return Response({'output': [f'Expected one of: {choices}.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        content_type, filename = export.FORMATS[fmt]
+        response = StreamingHttpResponse(
+            export.stream_recipes(
+                queryset, self.get_serializer_class(),
+                self.get_serializer_context(), fmt,
+                settings.RECIPE_EXPORT_CHUNK_SIZE),
+            content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(methods=['POST'], detail=False, url_path='import',
+            parser_classes=(importer.CSVImportParser,
+                            importer.NDJSONImportParser))
+    def import_recipes(self, request):
+        '''import recipes from a text/csv or application/x-ndjson body
+
+        Rows are validated like recipe creation, with ingredient and tag
+        names, and loaded in batches. Invalid rows are skipped and listed
+        with their errors; the response reports the counts.
+        '''
+        upload = request.data
+        if 'stream' not in upload:
+            return Response({'detail': 'Expected a CSV or NDJSON body.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        config = settings.RECIPE_IMPORT
+        result = importer.import_recipes(
+            request.user, upload['stream'], upload['format'],
+            batch_size=config['BATCH_SIZE'],
+            max_errors=config['MAX_ERRORS'])
+        return Response(result, status=status.HTTP_200_OK)
 
     @action(
         methods=['POST'],
@@ -80,12 +246,188 @@ class RecipeViewSet(ModelViewSet):
         url_path='upload',
     )
     def upload_image(self, request, pk=None):
-        '''handle uploading of recipe image'''
+        '''accept a recipe image and queue it for processing'''
         recipe = self.get_object()
+        stale_renditions = list(recipe.image_renditions.values())
         serializer = self.get_serializer(recipe, data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save(image_status=ImageStatus.PENDING,
+                        image_renditions={})
+        images.delete_files(stale_renditions)
+        images.schedule_processing(recipe)
+        recipe.refresh_from_db(
+            fields=['image', 'image_status', 'image_renditions'])
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(
+        methods=['GET'],
+        detail=True,
+        url_path='image',
+    )
+    def image_variant(self, request, pk=None):
+        '''return the recipe image resized to ?width= (and ?height=)
+
+        ?output= picks jpeg (default), png or webp where supported.
+        Variants are rendered on first request and then served from the
+        thumbnail disk cache. Responses are immutable when ?v= matches the
+        current image version, advertised in the Content-Location header.
+        Only processed images are served: 409 while processing is pending.
+        '''
+        recipe = self.get_object()
+        if recipe.image and recipe.image_status in (
+                ImageStatus.PENDING, ImageStatus.PROCESSING):
+            return Response(
+                {'image': ['The image of this recipe is being processed.']},
+                status=status.HTTP_409_CONFLICT)
+        if not recipe.image or recipe.image_status != ImageStatus.READY:
+            return Response({'image': ['This recipe has no image.']},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        params = request.query_params
+        fmt = params.get('output', 'jpeg')
+        try:
+            width = int(params.get('width', ''))
+            height = int(params['height']) if params.get('height') else None
+        except ValueError:
+            width = height = 0
+        max_width = settings.RECIPE_THUMBNAIL_CACHE['MAX_WIDTH']
+        if not 0 < width <= max_width or (
+                height is not None and not 0 < height <= max_width):
+            return Response(
+                {'width': [f'Expected an integer from 1 to {max_width}.']},
+                status=status.HTTP_400_BAD_REQUEST)
+        if fmt not in thumbnails.FORMATS:
+            choices = ', '.join(thumbnails.FORMATS)
+            return Response({'output': [f'Expected one of: {choices}.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        version = thumbnails.source_version(recipe.image)
+        key = thumbnails.variant_key(version, width, height, fmt)
+        etag = f'"{key}"'
+        if version == params.get('v'):
+            cache_control = 'private, max-age=31536000, immutable'
+        else:
+            cache_control = 'private, no-cache'
+
+        def render():
+            with recipe.image.open('rb') as source:
+                return thumbnails.render_variant(source, width, height, fmt)
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            try:
+                variant = thumbnails.thumbnail_cache.open(key, fmt, render)
+            except thumbnails.InvalidImage:
+                logger.warning('Invalid image for recipe %s', recipe.pk,
+                               exc_info=True)
+                return Response(
+                    {'image': ['The image of this recipe cannot be read.']},
+                    status=status.HTTP_404_NOT_FOUND)
+            response = FileResponse(
+                variant, content_type=thumbnails.FORMATS[fmt][1])
+        query = params.copy()
+        query['v'] = version
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        response['Content-Location'] = f'{request.path}?{query.urlencode()}'
+        return response
+
+
+class SyncView(APIView):
+    '''changes to the recipes, tags and ingredients of the user
+
+    GET ?since=<token> returns the changes made after token, at most
+    ?limit= log entries: saved objects as the list endpoints render them,
+    the ids of deleted ones, the token to sync from next and whether
+    more changes remain. Without since, or when since predates the
+    compacted change log, reset is true and only a token is returned:
+    download the collections from the list endpoints, then sync from it.
+    '''
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    collections = (
+        ('recipes', models.ChangeLogEntry.Kind.RECIPE, models.Recipe),
+        ('tags', models.ChangeLogEntry.Kind.TAG, models.Tag),
+        ('ingredients', models.ChangeLogEntry.Kind.INGREDIENT,
+         models.Ingredient),
+    )
+
+    def get(self, request):
+        params = request.query_params
+        config = settings.RECIPE_SYNC
+        max_limit = config['MAX_BATCH_SIZE']
+        try:
+            since = int(params['since']) if params.get('since') else None
+        except ValueError:
+            since = -1
+        if since is not None and since < 0:
+            return Response({'since': ['Expected a sync token.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(params.get('limit', config['BATCH_SIZE']))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= max_limit:
+            return Response(
+                {'limit': [f'Expected an integer from 1 to {max_limit}.']},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.user.pk
+        result = None
+        if since is not None:
+            result = versioning.changes_since(user_id, since, limit)
+        if result is None:
+            data = {'reset': True, 'token': str(versioning.head(user_id)),
+                    'more': False, 'deleted': {}}
+            for name, _, _ in self.collections:
+                data[name] = data['deleted'][name] = []
+            return Response(data)
+
+        changes, token, more = result
+        data = {'reset': False, 'token': str(token), 'more': more,
+                'deleted': {}}
+        for name, kind, model in self.collections:
+            saved = [pk for pk, deleted in changes[kind].items()
+                     if not deleted]
+            items = []
+            if saved:
+                queryset = model.objects.filter(
+                    user_id=user_id, pk__in=saved).order_by('id')
+                with metrics.timed('serialize'):
+                    items = (fast.recipe_list(queryset, request)
+                             if model is models.Recipe
+                             else fast.name_list(queryset))
+            found = {item['id'] for item in items}
+            data[name] = items
+            # saved objects deleted since are gone; their tombstones follow
+            data['deleted'][name] = sorted(
+                pk for pk, deleted in changes[kind].items()
+                if deleted or pk not in found)
+        return Response(data)
+
+
+class StatsView(APIView):
+    '''statistics of the recipes of the user
+
+    GET returns the recipe count, total and average time_minutes and
+    price, recipes per price bucket and the ?top= most used tags and
+    ingredients. Served from summary rows kept up to date by every write,
+    so the cost does not grow with the collection.
+    '''
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        config = settings.RECIPE_STATS
+        max_top = config['MAX_TOP']
+        try:
+            top = int(request.query_params.get('top', config['TOP']))
+        except ValueError:
+            top = -1
+        if not 0 <= top <= max_top:
+            return Response(
+                {'top': [f'Expected an integer from 0 to {max_top}.']},
+                status=status.HTTP_400_BAD_REQUEST)
+        return Response(stats.get_stats(request.user.pk, top))
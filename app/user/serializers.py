@@ -1,11 +1,15 @@
 from django.contrib.auth import get_user_model
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
 
 from django.contrib.auth import authenticate
 from django.utils.translation import gettext_lazy as _
 
+from core import metrics
+from core.authentication import CachedTokenAuthentication
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(metrics.TimedSerializerMixin,
+                     serializers.ModelSerializer):
     '''serializes the user model'''
     class Meta:
         model = get_user_model()
@@ -64,3 +68,18 @@ class UserLoginSerializer(serializers.Serializer):
 
         attrs['user'] = user
         return attrs
+
+
+class TokenSerializer(serializers.Serializer):
+    '''a valid token, signed or not, to rotate or revoke'''
+    token = serializers.CharField(write_only=True)
+
+    def validate(self, attrs):
+        try:
+            attrs['user'], attrs['auth'] = (
+                CachedTokenAuthentication().authenticate_credentials(
+                    attrs['token']))
+        except exceptions.AuthenticationFailed as exc:
+            raise serializers.ValidationError(
+                {'token': [exc.detail]}, code='authorization')
+        return attrs
@@ -1,13 +1,20 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from core import tokens
+from core.throttling import bucket_store
 
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
+REFRESH_URL = reverse('user:token-refresh')
+REVOKE_URL = reverse('user:token-revoke')
 
 
 def create_user(**params):
@@ -18,6 +25,7 @@ class PublicUserAPITest(TestCase):
     '''test suite for public user api'''
 
     def setUp(self):
+        bucket_store.clear()
         self.client = APIClient()
         self.payload = {
             'email': 'test@domain.com',
@@ -77,6 +85,82 @@ class PublicUserAPITest(TestCase):
         self.assertNotIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_token_is_signed(self):
+        '''test that logins get an expiring token authenticating the user'''
+        create_user(**self.payload)
+        res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertIn('expires_at', res.data)
+        token = res.data['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
+    def test_refresh_token_rotates(self):
+        '''test that refreshing revokes the token for a new one'''
+        token = tokens.issue(create_user(**self.payload)).key
+
+        res = self.client.post(REFRESH_URL, {'token': token})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['token'], token)
+        res = self.client.post(REFRESH_URL, {'token': token})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_revoke_token(self):
+        '''test that revoked tokens, signed or not, stop authenticating'''
+        user = create_user(**self.payload)
+        legacy = Token.objects.create(user=user).key
+        for token in (tokens.issue(user).key, legacy):
+            res = self.client.post(REVOKE_URL, {'token': token})
+            self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+            res = self.client.get(ME_URL)
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.assertFalse(Token.objects.exists())
+
+    def test_create_token_rehashes_password(self):
+        '''test that logging in upgrades a hash of another algorithm'''
+        user = create_user(**self.payload)
+        user.password = make_password(self.payload['password'],
+                                      hasher='pbkdf2_sha256')
+        user.save()
+
+        res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$'))
+        self.assertTrue(user.check_password(self.payload['password']))
+
+    def test_rehash_keeps_tokens_valid(self):
+        '''test that a login upgrading the hash keeps other tokens valid'''
+        user = create_user(**self.payload)
+        user.password = make_password(self.payload['password'],
+                                      hasher='pbkdf2_sha256')
+        user.save()
+        first = self.client.post(TOKEN_URL, self.payload).data['token']
+        self.client.post(TOKEN_URL, self.payload)
+
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$'))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {first}')
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_200_OK)
+
+    def test_password_change_invalidates_tokens(self):
+        '''test that changing the password rejects the older tokens'''
+        token = tokens.issue(create_user(**self.payload)).key
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+        res = self.client.patch(ME_URL, {'password': 'newPass123'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(ME_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
     def test_create_token_no_user(self):
         '''test that token is not created if user does not exist'''
         res = self.client.post(TOKEN_URL, self.payload)
@@ -1,27 +1,89 @@
-from rest_framework import generics
-from rest_framework.authentication import TokenAuthentication
+from django.conf import settings
+from rest_framework import generics, status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+
+from core import tokens
+from core.authentication import CachedTokenAuthentication
+from core.throttling import EmailThrottle, IPThrottle
 from user import serializers
 
 
+def token_data(user):
+    '''return the response data of a new token of user
+
+    Signed tokens come with their expiry; with SIGNED_TOKENS disabled
+    the database token of user is returned.
+    '''
+    if not settings.SIGNED_TOKENS['ENABLED']:
+        token, _ = Token.objects.get_or_create(user=user)
+        return {'token': token.key}
+    token = tokens.issue(user)
+    return {'token': token.key, 'expires_at': token.expires_at}
+
+
+def revoke(token):
+    '''revoke a signed token, or delete a database one'''
+    if isinstance(token, tokens.SignedToken):
+        tokens.revoke(token)
+    else:
+        token.delete()
+
+
 class CreateUserView(generics.CreateAPIView):
     '''create a new user'''
     serializer_class = serializers.UserSerializer
+    throttle_classes = (IPThrottle, EmailThrottle)
+    throttle_scope = 'signup'
 
 
 class CreateTokenView(ObtainAuthToken):
     '''handles user login token generation'''
     serializer_class = serializers.UserLoginSerializer
+    throttle_classes = (IPThrottle, EmailThrottle)
+    throttle_scope = 'login'
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(token_data(serializer.validated_data['user']))
+
+
+class RefreshTokenView(generics.GenericAPIView):
+    '''exchange a valid token for a new one, revoking it'''
+    serializer_class = serializers.TokenSerializer
+    authentication_classes = ()
+    permission_classes = ()
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        revoke(serializer.validated_data['auth'])
+        return Response(token_data(serializer.validated_data['user']))
+
+
+class RevokeTokenView(generics.GenericAPIView):
+    '''revoke a valid token, e.g. on logout'''
+    serializer_class = serializers.TokenSerializer
+    authentication_classes = ()
+    permission_classes = ()
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        revoke(serializer.validated_data['auth'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     '''api for authenticated user profile'''
     serializer_class = serializers.UserSerializer
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
 
     def get_object(self):
         return self.request.user